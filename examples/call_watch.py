@@ -2,7 +2,6 @@ import os
 from dotenv import load_dotenv
 import hypersync
 import asyncio
-import time
 from hypersync import TransactionField
 
 # Load environment variables from a .env file
@@ -39,8 +38,16 @@ async def main():
         "transfer(address dst, uint256 wad)"
     ])
 
-    while True:
-        res = await client.get(query)
+    # tail keeps the stream open after it reaches the tip of the chain and delivers new blocks
+    # as soon as the server has them
+    receiver = await client.stream(query, hypersync.StreamConfig(tail=True))
+
+    async for res in receiver:
+        # the stream tells us if blocks we already processed were reorged out of the chain,
+        # it continues from the first of them after this
+        if isinstance(res, hypersync.Rollback):
+            print(f"chain reorg, rolling back to block {res.block_number}")
+            continue
 
         if len(res.data.transactions) > 0:
             # Decode the log on a background thread so we don't block the event loop.
@@ -50,13 +57,4 @@ async def main():
                 if call:
                     print(f"Call decoded: addr: {call[0].val}, wad: {call[1].val}")
 
-        height = res.archive_height
-        while height < res.next_block:
-            print(f"waiting for chain to advance. Height is {height}")
-            height = await client.get_height()
-            time.sleep(1)
-
-        # continue query from next_block
-        query.from_block = res.next_block
-
 asyncio.run(main())
@@ -25,7 +25,13 @@ async def main():
     await client.collect_parquet(
         query=query,
         path="data",
-        config=hypersync.StreamConfig()
+        config=hypersync.StreamConfig(
+            # write files as data arrives, starting a new file every 2000 blocks
+            parquet=hypersync.ParquetConfig(
+                compression=hypersync.ParquetCompression.ZSTD,
+                rotate_blocks=2000,
+            )
+        )
     )
 
     print("\nParquet collection completed!")
@@ -2,7 +2,6 @@ import os
 from dotenv import load_dotenv
 import hypersync
 import asyncio
-import time
 from hypersync import LogField, ClientConfig
 
 # Load environment variables from a .env file
@@ -48,9 +47,17 @@ async def main():
         "Transfer(address indexed from, address indexed to, uint256 value)"
     ])
 
+    # tail keeps the stream open after it reaches the tip of the chain and delivers new blocks
+    # as soon as the server has them
+    receiver = await client.stream(query, hypersync.StreamConfig(tail=True))
+
     total_dai_volume = 0
-    while True:
-        res = await client.get(query)
+    async for res in receiver:
+        # the stream tells us if blocks we already processed were reorged out of the chain,
+        # it continues from the first of them after this
+        if isinstance(res, hypersync.Rollback):
+            print(f"chain reorg, rolling back to block {res.block_number}")
+            continue
 
         if len(res.data.logs) > 0:
             # Decode the log on a background thread so we don't block the event loop.
@@ -63,16 +70,7 @@ async def main():
                     continue
 
                 total_dai_volume += log.body[0].val
-        
-        print(f"total DAI transfer volume is {total_dai_volume / 1e18} USD")
-
-        height = res.archive_height
-        while height < res.next_block:
-            print(f"waiting for chain to advance. Height is {height}")
-            height = await client.get_height()
-            time.sleep(1)
 
-        # continue query from next_block
-        query.from_block = res.next_block
+        print(f"total DAI transfer volume is {total_dai_volume / 1e18} USD, next block is {res.next_block}")
 
 asyncio.run(main())
@@ -1,12 +1,15 @@
 from .hypersync import HypersyncClient as _HypersyncClient
+from .hypersync import SyncHypersyncClient as _SyncHypersyncClient
 from .hypersync import Decoder as _Decoder
 from .hypersync import CallDecoder as _CallDecoder
 from .hypersync import signature_to_topic0 as _sig_to_topic0
 from .hypersync import ArrowStream as _ArrowStream
 from .hypersync import EventStream as _EventStream
 from .hypersync import QueryResponseStream as _QueryResponseStream
+from .hypersync import MultiQueryStream as _MultiQueryStream
 from .hypersync import RateLimitInfo as _RateLimitInfo
-from typing import Optional, Dict, Tuple
+from .hypersync import Rollback as _Rollback
+from typing import AsyncIterator, Iterator, List, Optional, Dict, Tuple, Union
 from dataclasses import dataclass
 from strenum import StrEnum
 
@@ -147,9 +150,11 @@ class Trace(object):
 
 
 class Event(object):
-    # Transaction that triggered this event
+    # Transaction that triggered this event, events of the same transaction in a response
+    # share this object
     transaction: Optional[Transaction]
-    # Block that this event happened in
+    # Block that this event happened in, events of the same block in a response share this
+    # object
     block: Optional[Block]
     # Evm log data
     log: Log
@@ -164,12 +169,69 @@ class DecodedEvent(object):
     body: list[DecodedSolValue]
 
 
+class BigIntOutput(StrEnum):
+    """Arrow types of decoded integers wider than 64 bits."""
+
+    # 32 byte big endian two's complement FixedSizeBinary.
+    BINARY = "binary"
+    # decimal256(76, decimals), values with more than 76 digits are null.
+    DECIMAL256 = "decimal256"
+    # float64 divided by 10**decimals, precision is lost beyond 53 bits.
+    FLOAT64 = "float64"
+    # FixedSizeList of 4 uint64 limbs of the two's complement value, least significant first.
+    # pa_array.values.to_numpy().reshape(-1, 4) gives the limbs as a NumPy array.
+    LIMBS = "limbs"
+
+
+class RowFormat(StrEnum):
+    """
+    Representation of the rows of query responses. Only responses of OBJECTS can be pickled
+    or serialized with to_ipc_bytes.
+    """
+
+    # Lists of Block, Transaction, Log and Trace objects with hex string fields.
+    OBJECTS = "objects"
+    # Lists of Record objects that only hold the columns of the query's field selection, so
+    # memory per row scales with the number of selected fields. Repeated hashes and addresses
+    # are the same python object, within a response and across the responses of a stream
+    # (until 65536 distinct values are cached), which saves memory and speeds up dict and set
+    # lookups.
+    RECORDS = "records"
+    # Like RECORDS, with quantities (gas, value, timestamp, ...) as ints and hashes, addresses
+    # and other binary fields as bytes instead of hex strings.
+    NATIVE_RECORDS = "native_records"
+    # RowSequence views, rows and their fields are only converted when they are accessed.
+    LAZY = "lazy"
+    # Like LAZY, with ints and bytes like NATIVE_RECORDS.
+    NATIVE_LAZY = "native_lazy"
+
+
+class ArrowOutput(StrEnum):
+    """Python type of the tables of arrow responses."""
+
+    # pyarrow.Table, needs pyarrow.
+    PYARROW = "pyarrow"
+    # ArrowTable, exported through the Arrow PyCapsule interface without importing pyarrow.
+    CAPSULE = "capsule"
+
+
+# Decoded parameters, DecodedEvent unless plain values are enabled on the decoder.
+DecodedValues = Union[DecodedEvent, tuple, dict[str, any]]
+# Decoded inputs, a list of DecodedSolValue unless plain values are enabled on the decoder.
+DecodedInputs = Union[list[DecodedSolValue], tuple, dict[str, any]]
+
+
 class Decoder:
     """Decode logs parsing topics and log data."""
 
-    def __init__(self, signatures: list[str]):
-        """Initialize decoder from event signatures."""
-        self.inner = _Decoder(signatures)
+    def __init__(self, signatures: list[str], num_threads: Optional[int] = None):
+        """Initialize decoder from event signatures.
+
+        Logs are decoded in parallel without holding the GIL. num_threads sets the size of a
+        thread pool dedicated to this decoder, the pool shared by all decoders is used if it is
+        None.
+        """
+        self.inner = _Decoder(signatures, num_threads)
 
     def enable_checksummed_addresses(self):
         self.inner.enable_checksummed_addresses()
@@ -177,20 +239,54 @@ class Decoder:
     def disable_checksummed_addresses(self):
         self.inner.disable_checksummed_addresses()
 
-    async def decode_logs(self, logs: list[Log]) -> list[Optional[DecodedEvent]]:
+    def enable_plain_values(self, named: bool = False):
+        """Return plain python values instead of DecodedEvent objects.
+
+        Each decoded log becomes a tuple of its parameters in signature order, or a dict
+        keyed by parameter name if named is set. Arrays are lists and structs are tuples.
+        """
+        self.inner.enable_plain_values(named)
+
+    def disable_plain_values(self):
+        self.inner.disable_plain_values()
+
+    async def decode_logs(self, logs: list[Log]) -> list[Optional[DecodedValues]]:
         """Parse log and return decoded event. Returns None if topic0 not found."""
         return await self.inner.decode_logs(logs)
 
-    def decode_logs_sync(self, logs: list[Log]) -> list[Optional[DecodedEvent]]:
+    def decode_logs_sync(self, logs: list[Log]) -> list[Optional[DecodedValues]]:
         """Parse log and return decoded event. Returns None if topic0 not found."""
         return self.inner.decode_logs_sync(logs)
 
-    async def decode_events(self, events: list[Event]) -> list[Optional[DecodedEvent]]:
+    async def decode_events(self, events: list[Event]) -> list[Optional[DecodedValues]]:
         return await self.inner.decode_events(events)
 
-    def decode_events_sync(self, events: list[Event]) -> list[Optional[DecodedEvent]]:
+    def decode_events_sync(self, events: list[Event]) -> list[Optional[DecodedValues]]:
         return self.inner.decode_events_sync(events)
 
+    def set_big_int_output(self, output: BigIntOutput, decimals: Optional[int] = None):
+        """Set the arrow type of integer parameters wider than 64 bits in decode_arrow.
+
+        decimals scales DECIMAL256 and FLOAT64 output.
+        """
+        self.inner.set_big_int_output(output, decimals)
+
+    async def decode_arrow(self, table: any, event: Optional[str] = None) -> any:
+        """Decode a pyarrow Table or RecordBatch of raw logs into a pyarrow Table.
+
+        The input needs the binary topic0..topic3 and data columns, like the logs table
+        returned by collect_arrow without hex output. The result has one column per event
+        parameter, named after the parameters in the signature. Indexed strings, bytes,
+        arrays and tuples are 32 byte hashes of the value. Rows that don't belong to
+        the event are null. event picks the event by name if the decoder has several
+        signatures.
+        """
+        return await self.inner.decode_arrow(table, event)
+
+    def decode_arrow_sync(self, table: any, event: Optional[str] = None) -> any:
+        """Decode a pyarrow Table or RecordBatch of raw logs into a pyarrow Table."""
+        return self.inner.decode_arrow_sync(table, event)
+
 
 class CallDecoder:
     """Decode logs parsing topics and log data."""
@@ -205,35 +301,46 @@ class CallDecoder:
     def disable_checksummed_addresses(self):
         self.inner.disable_checksummed_addresses()
 
-    async def decode_inputs(self, inputs: list[str]) -> list[list[DecodedSolValue]]:
+    def enable_plain_values(self, named: bool = False):
+        """Return plain python values instead of lists of DecodedSolValue.
+
+        Each decoded input becomes a tuple in signature order, or a dict keyed by input name
+        if named is set. Arrays are lists and structs are tuples.
+        """
+        self.inner.enable_plain_values(named)
+
+    def disable_plain_values(self):
+        self.inner.disable_plain_values()
+
+    async def decode_inputs(self, inputs: list[str]) -> list[Optional[DecodedInputs]]:
         """Parse log and return decoded event. Returns None if topic0 not found."""
-        return await self.inner.decode_inputs(input)
+        return await self.inner.decode_inputs(inputs)
 
-    def decode_inputs_sync(self, inputs: list[str]) -> list[list[DecodedSolValue]]:
+    def decode_inputs_sync(self, inputs: list[str]) -> list[Optional[DecodedInputs]]:
         """Parse log and return decoded event. Returns None if topic0 not found."""
-        return self.inner.decode_input_syncs(input)
+        return self.inner.decode_inputs_sync(inputs)
 
     async def decode_transactions_input(
         self, txs: list[Transaction]
-    ) -> list[list[DecodedSolValue]]:
+    ) -> list[Optional[DecodedInputs]]:
         """Parse log and return decoded event. Returns None if topic0 not found."""
         return await self.inner.decode_transactions_input(txs)
 
     def decode_transactions_input_sync(
         self, txs: list[Transaction]
-    ) -> list[list[DecodedSolValue]]:
+    ) -> list[Optional[DecodedInputs]]:
         """Parse log and return decoded event. Returns None if topic0 not found."""
         return self.inner.decode_transactions_input_sync(txs)
 
     async def decode_traces_input(
         self, traces: list[Trace]
-    ) -> list[list[DecodedSolValue]]:
+    ) -> list[Optional[DecodedInputs]]:
         """Parse log and return decoded event. Returns None if topic0 not found."""
         return await self.inner.decode_traces_input(traces)
 
     def decode_traces_input_sync(
         self, traces: list[Trace]
-    ) -> list[list[DecodedSolValue]]:
+    ) -> list[Optional[DecodedInputs]]:
         """Parse log and return decoded event. Returns None if topic0 not found."""
         return self.inner.decode_traces_input_sync(traces)
 
@@ -680,6 +787,66 @@ class ColumnMapping:
     decoded_log: Optional[Dict[str, DataType]] = None
 
 
+class CheckpointBackend(StrEnum):
+    # Checkpoint is stored as a json file, replaced atomically on every update.
+    FILE = "file"
+    # Checkpoint is stored as a row in a sqlite database, keyed by CheckpointConfig.key.
+    SQLITE = "sqlite"
+
+
+@dataclass
+class CheckpointConfig:
+    """
+    Durable store for stream progress.
+
+    After the consumer acknowledges a response, by asking the stream for the next one, its
+    next_block and rollback_guard are recorded. A stream started with the same checkpoint
+    resumes from the recorded next_block instead of the query's from_block.
+    """
+
+    # Path of the checkpoint file or sqlite database.
+    path: str
+    # Storage backend. Default: CheckpointBackend.FILE.
+    backend: Optional[CheckpointBackend] = None
+    # Key of the checkpoint in a sqlite database, lets multiple streams share one database.
+    # Default: "default".
+    key: Optional[str] = None
+
+
+class ParquetCompression(StrEnum):
+    UNCOMPRESSED = "uncompressed"
+    SNAPPY = "snappy"
+    GZIP = "gzip"
+    LZ4 = "lz4"
+    ZSTD = "zstd"
+
+
+@dataclass
+class ParquetConfig:
+    """
+    Options for writing collect_parquet output incrementally.
+
+    Responses are written as they arrive, so memory use doesn't grow with the size of the
+    block range. Files are written under a temporary name and renamed to
+    "{table}_{from_block}_{to_block}.parquet" once they are complete, so finished files can be
+    read while the collection is still running.
+    """
+
+    # Compression codec. Default: ParquetCompression.UNCOMPRESSED.
+    compression: Optional[ParquetCompression] = None
+    # Compression level, only used by gzip and zstd.
+    compression_level: Optional[int] = None
+    # Maximum number of rows in a row group. Row groups are flushed to the file once they are full.
+    row_group_size: Optional[int] = None
+    # Dictionary encode columns. Default: True.
+    dictionary: Optional[bool] = None
+    # Start a new file at every multiple of this many blocks, e.g. 100000 gives
+    # blocks_17000000_17100000.parquet, blocks_17100000_17200000.parquet, ...
+    rotate_blocks: Optional[int] = None
+    # Start a new file once the current one reaches this many bytes.
+    rotate_bytes: Optional[int] = None
+
+
 @dataclass
 class StreamConfig:
     """Config for hypersync event streaming."""
@@ -698,6 +865,7 @@ class StreamConfig:
     # Minimum batch size that could be used during dynamic adjustment.
     min_batch_size: Optional[int] = None
     # Number of async threads that would be spawned to execute different block ranges of queries.
+    # For stream_many this is the limit on requests in flight across all queries.
     concurrency: Optional[int] = None
     # Max number of blocks to fetch in a single request.
     max_num_blocks: Optional[int] = None
@@ -713,6 +881,61 @@ class StreamConfig:
     response_bytes_floor: Optional[int] = None
     # Stream data in reverse order.
     reverse: Optional[bool] = None
+    # Number of converted responses to buffer ahead of the consumer, so conversion of the next
+    # response overlaps with processing of the current one. Default: 1.
+    prefetch: Optional[int] = None
+    # Maximum bytes of responses buffered ahead of the consumer. The stream stops pulling data
+    # while buffered responses exceed it. Sizes are exact for arrow streams and approximate for
+    # object streams. Responses still in flight inside the inner client are not counted.
+    memory_budget_bytes: Optional[int] = None
+    # Record acknowledged progress in a durable store and resume from it when the stream is
+    # started again. Not supported for reverse streams.
+    checkpoint: Optional[CheckpointConfig] = None
+    # Number of independent streams collect_arrow and collect_parquet split [from_block, to_block)
+    # into. Idle shards take over the upper half of a busy shard's remaining range, so dense block
+    # ranges get spread out. Each shard runs with the configured concurrency. With sharding,
+    # collect_parquet writes one file per table for every processed range, named
+    # "{table}_{from_block}_{to_block}.parquet". Not supported for reverse streams.
+    shard_count: Optional[int] = None
+    # Keep streaming after reaching the height of the server. Once the stream catches up, the
+    # server height is polled and the stream continues from where it left off as soon as new
+    # blocks are available. Stops at query.to_block if it is set.
+    # Not supported for reverse streams.
+    tail: Optional[bool] = None
+    # Delay in milliseconds before polling for a new height in tail mode. Defaults to 200.
+    tail_poll_interval_millis: Optional[int] = None
+    # The poll delay doubles every time the height hasn't moved, up to this many milliseconds.
+    # Defaults to 2000.
+    tail_max_poll_interval_millis: Optional[int] = None
+    # Number of recent block hashes kept to detect reorgs in tail mode. If a response contradicts
+    # them, it is not delivered. Instead the stream delivers a Rollback with the first block that
+    # is no longer part of the chain and continues from that block. 0 disables reorg detection.
+    # Defaults to 256.
+    reorg_buffer_size: Optional[int] = None
+    # Write collect_parquet output incrementally with these options instead of all at once.
+    # Not supported for reverse streams.
+    parquet: Optional[ParquetConfig] = None
+    # Decode the logs of stream_arrow and collect_arrow responses into one table per event, in
+    # the same pass over the logs. The tables are returned in ArrowResponseData.decoded_events.
+    # Topics and data need to be selected, as binary or hex. Logs of anonymous events are never
+    # matched.
+    event_signatures: Optional[list[str]] = None
+    # Arrow type of integer parameters wider than 64 bits, like uint256, in the tables of
+    # event_signatures. Defaults to BigIntOutput.BINARY.
+    big_int_output: Optional[BigIntOutput] = None
+    # Decimals that DECIMAL256 and FLOAT64 big int output is scaled by, e.g. 18 to get token
+    # amounts instead of wei.
+    big_int_decimals: Optional[int] = None
+    # Python type of the tables of stream_arrow and collect_arrow responses. Defaults to
+    # ArrowOutput.PYARROW.
+    arrow_output: Optional[ArrowOutput] = None
+    # Emit the hashes and addresses of stream_arrow and collect_arrow responses as 32 and 20 byte
+    # fixed_size_binary columns, also if hex_output is set. Values of another size become null.
+    fixed_size_binary: Optional[bool] = None
+    # Dictionary encode the log address and topic0 columns and the block_hash columns of
+    # stream_arrow and collect_arrow responses, with int32 indices. Saves memory and speeds up
+    # joins and group bys on these columns.
+    dictionary_encode: Optional[bool] = None
 
 
 @dataclass
@@ -738,13 +961,48 @@ class ClientConfig:
     # Whether to proactively sleep when the rate limit is exhausted instead of
     # sending requests that will be rejected with 429. Default: True.
     proactive_rate_limit_sleep: Optional[bool] = None
+    # Representation of the rows of QueryResponse.data. Default: RowFormat.OBJECTS.
+    row_format: Optional[RowFormat] = None
+
+
+class RowView(object):
+    """
+    A single row of a RowSequence.
+
+    Has the same attributes as the matching Block, Transaction, Log or Trace object,
+    each attribute is converted when it is accessed.
+    """
+
+
+class Record(object):
+    """
+    A row returned instead of Block, Transaction, Log and Trace objects if
+    ClientConfig.row_format is RowFormat.RECORDS or RowFormat.NATIVE_RECORDS. The records of a
+    table are built when the table is first accessed.
+
+    Only holds the columns of the query's field selection. Has the same attributes as the
+    matching object, fields that were not selected are None.
+    """
+
+
+class RowSequence(object):
+    """
+    Read-only sequence of rows, returned instead of lists if ClientConfig.row_format is
+    RowFormat.LAZY or RowFormat.NATIVE_LAZY.
+    """
+
+    def __len__(self) -> int: ...
+
+    def __getitem__(self, index: int) -> RowView: ...
+
+    def __iter__(self) -> Iterator[RowView]: ...
 
 
 class QueryResponseData(object):
-    blocks: list[Block]
-    transactions: list[Transaction]
-    logs: list[Log]
-    traces: list[Trace]
+    blocks: Union[list[Block], list[Record], RowSequence]
+    transactions: Union[list[Transaction], list[Record], RowSequence]
+    logs: Union[list[Log], list[Record], RowSequence]
+    traces: Union[list[Trace], list[Record], RowSequence]
 
 
 class RollbackGuard(object):
@@ -764,6 +1022,12 @@ class RollbackGuard(object):
     first_parent_hash: str
 
 
+# Delivered by tail streams when previously delivered blocks are no longer part of the chain.
+# Data from rollback.block_number on should be discarded, the stream continues from that block.
+# This is the native class so streamed items can be told apart with isinstance(item, Rollback).
+Rollback = _Rollback
+
+
 class RateLimitInfo(object):
     """Rate limit information from server response headers."""
     # Total request quota for the current window.
@@ -776,6 +1040,45 @@ class RateLimitInfo(object):
     cost: Optional[int]
 
 
+class ResponseTiming(object):
+    """Where the time went while producing a single response."""
+    # Time spent waiting for the underlying client to deliver the response. For single requests
+    # this is the whole request, for streams it is only the time the stream waited on the
+    # underlying client, which is zero if the response had already been fetched.
+    fetch_wait_ms: float
+    # Time it took the hypersync instance to execute the query.
+    server_execution_time_ms: int
+    # Estimated in-memory size of the decoded response. This is not the number of bytes
+    # received over the network, which the underlying client doesn't report.
+    decoded_bytes: int
+    # Time spent exporting arrow data to pyarrow, only set for arrow responses.
+    arrow_conversion_ms: float
+    # Time spent converting the underlying client's response into the returned response type,
+    # not set for arrow responses.
+    response_conversion_ms: float
+    # Time the response waited in the stream buffer until it was received, only set for streams.
+    queued_ms: float
+
+
+class ClientMetrics(object):
+    """
+    Counters aggregated over all responses delivered by a client.
+
+    All values only ever increase, so they can be exported as prometheus counters.
+    """
+    # Number of responses delivered.
+    responses_total: int
+    # Number of failed requests and streams.
+    errors_total: int
+    # Sums of the corresponding ResponseTiming fields.
+    fetch_wait_ms_total: float
+    server_execution_time_ms_total: int
+    decoded_bytes_total: int
+    arrow_conversion_ms_total: float
+    response_conversion_ms_total: float
+    queued_ms_total: float
+
+
 class QueryResponse(object):
     # Current height of the source hypersync instance
     archive_height: Optional[int]
@@ -789,6 +1092,18 @@ class QueryResponse(object):
     data: QueryResponseData
     # Rollback guard, supposed to be used to detect rollbacks
     rollback_guard: Optional[RollbackGuard]
+    # Where the time went while producing this response
+    timing: ResponseTiming
+
+    # serialize the response as Arrow IPC. Responses are pickled this way, so they can be sent
+    # to a ProcessPoolExecutor without pickling every field of every row.
+    # Raises for responses of a client whose row_format isn't RowFormat.OBJECTS, their
+    # RowSequences and Records can't be read back as the same types.
+    def to_ipc_bytes(self) -> bytes: ...
+
+    # read a response serialized by to_ipc_bytes
+    @classmethod
+    def from_ipc_bytes(cls, data: bytes) -> "QueryResponse": ...
 
 
 class EventResponse(object):
@@ -804,19 +1119,65 @@ class EventResponse(object):
     data: list[Event]
     # Rollback guard, supposed to be used to detect rollbacks
     rollback_guard: Optional[RollbackGuard]
+    # Where the time went while producing this response
+    timing: ResponseTiming
+
+    # serialize the response as Arrow IPC. Responses are pickled this way, so they can be sent
+    # to a ProcessPoolExecutor without pickling every field of every row.
+    def to_ipc_bytes(self) -> bytes: ...
+
+    # read a response serialized by to_ipc_bytes
+    @classmethod
+    def from_ipc_bytes(cls, data: bytes) -> "EventResponse": ...
+
+
+class ArrowTable(object):
+    """
+    Record batches of a table, returned instead of pyarrow.Table if StreamConfig.arrow_output
+    is ArrowOutput.CAPSULE.
+
+    Implements the Arrow PyCapsule interface, so polars.from_arrow(table), duckdb and
+    pyarrow.table(table) import the batches without copying, and without pyarrow being
+    installed unless it is the consumer.
+    """
+
+    num_rows: int
+
+    def __len__(self) -> int: ...
+
+    def __arrow_c_stream__(self, requested_schema: Optional[object] = None) -> object: ...
+
+    def __arrow_c_schema__(self) -> object: ...
+
+    # Convert to a pyarrow.Table, needs pyarrow.
+    def to_pyarrow(self) -> any: ...
+
+    # Serialize the batches as an Arrow IPC stream, which pyarrow.ipc.open_stream can read as
+    # well. Tables are pickled this way.
+    def to_ipc_bytes(self) -> bytes: ...
+
+    # Read an Arrow IPC stream, such as the output of to_ipc_bytes.
+    @classmethod
+    def from_ipc_bytes(cls, data: bytes) -> "ArrowTable": ...
 
 
 class ArrowResponseData(object):
-    # pyarrow.Table
+    # pyarrow.Table or ArrowTable, None if there are no rows
     blocks: any
-    # pyarrow.Table
+    # pyarrow.Table or ArrowTable, None if there are no rows
     transactions: any
-    # pyarrow.Table
+    # pyarrow.Table or ArrowTable, None if there are no rows
     logs: any
-    # pyarrow.Table
+    # pyarrow.Table or ArrowTable, None if there are no rows
     traces: any
-    # pyarrow.Table
+    # pyarrow.Table or ArrowTable, None if there are no rows
     decoded_logs: any
+    # Dict of a pyarrow.Table or ArrowTable per event of StreamConfig.event_signatures, keyed by event name
+    # or by signature if several signatures share a name. Each table holds the logs of its
+    # event with their block_number, transaction_index, log_index, transaction_hash and
+    # address columns if selected, followed by a column per event parameter. None if
+    # event_signatures is not set.
+    decoded_events: Optional[Dict[str, any]]
 
 
 class ArrowResponse(object):
@@ -832,43 +1193,366 @@ class ArrowResponse(object):
     data: ArrowResponseData
     # Rollback guard, supposed to be used to detect rollbacks
     rollback_guard: Optional[RollbackGuard]
+    # Where the time went while producing this response
+    timing: ResponseTiming
+
+    # serialize the response as Arrow IPC. Responses are pickled this way, so they can be sent
+    # to a ProcessPoolExecutor without pickling every field of every row.
+    def to_ipc_bytes(self) -> bytes: ...
+
+    # read a response serialized by to_ipc_bytes
+    @classmethod
+    def from_ipc_bytes(cls, data: bytes) -> "ArrowResponse": ...
+
+
+class ArrowStreamTable(object):
+    """One table of the remaining items of an ArrowStream or ArrowBatchStream."""
+
+    # export the table as an arrow stream, waits for its first batch to get the schema. The
+    # schema is empty if the stream finishes before that.
+    def __arrow_c_stream__(self, requested_schema: Optional[object] = None) -> object: ...
+
+    # export the schema of the table, waits for its first batch like __arrow_c_stream__. The
+    # batch is kept for the next __arrow_c_stream__ call.
+    def __arrow_c_schema__(self) -> object: ...
 
 
 class ArrowStream(object):
     inner: _ArrowStream
 
     # receive the next response, returns None if the stream is finished
-    async def recv(self) -> Optional[ArrowResponse]:
+    async def recv(self) -> Optional[Union[ArrowResponse, Rollback]]:
         await self.inner.recv()
 
+    # receive up to max_items already buffered responses in one call, waiting for at least one.
+    # returns None if the stream is finished and an empty list if timeout (seconds) elapsed first
+    async def recv_many(
+        self, max_items: int, timeout: Optional[float] = None
+    ) -> Optional[list[Union[ArrowResponse, Rollback]]]:
+        return await self.inner.recv_many(max_items, timeout)
+
+    def __aiter__(self) -> AsyncIterator[Union[ArrowResponse, Rollback]]:
+        return self.inner.__aiter__()
+
     # close the stream so it doesn't keep loading data in the background
     async def close(self):
         await self.inner.close()
 
+    # blocking versions of the methods above, these release the GIL while waiting so they can be
+    # used from plain threads without an asyncio event loop
+    def recv_sync(self) -> Optional[Union[ArrowResponse, Rollback]]:
+        return self.inner.recv_sync()
+
+    def recv_many_sync(
+        self, max_items: int, timeout: Optional[float] = None
+    ) -> Optional[list[Union[ArrowResponse, Rollback]]]:
+        return self.inner.recv_many_sync(max_items, timeout)
+
+    def close_sync(self):
+        self.inner.close_sync()
+
+    # approximate size in bytes of the responses buffered ahead of the consumer
+    def buffered_bytes(self) -> int:
+        return self.inner.buffered_bytes()
+
+    # number of responses buffered ahead of the consumer
+    def queue_depth(self) -> int:
+        return self.inner.queue_depth()
+
+    def __iter__(self) -> Iterator[Union[ArrowResponse, Rollback]]:
+        return self.inner.__iter__()
+
+    # view of one table ("blocks", "transactions", "logs", "traces" or "decoded_logs") of the
+    # remaining responses, which implements the Arrow PyCapsule stream interface. Consumers like
+    # pyarrow.RecordBatchReader.from_stream, polars.from_arrow and duckdb pull the batches
+    # response by response, other tables are dropped and reading fails on a rollback.
+    def table(self, name: str) -> ArrowStreamTable:
+        return self.inner.table(name)
+
+    # raises, responses hold several tables so one has to be exported with table
+    def __arrow_c_stream__(self, requested_schema: Optional[object] = None) -> object:
+        return self.inner.__arrow_c_stream__(requested_schema)
+
+
+class ArrowBatch(object):
+    """A record batch of one table of an arrow response, delivered by ArrowBatchStream."""
+
+    # "blocks", "transactions", "logs", "traces", "decoded_logs" or the name of an event of
+    # StreamConfig.event_signatures
+    table: str
+    # pyarrow.RecordBatch, or an ArrowTable holding the batch if StreamConfig.arrow_output is
+    # ArrowOutput.CAPSULE
+    batch: any
+    # Next block of the response the batch belongs to
+    next_block: int
+    # Set on the last batch of a response, checkpoints only move forward with it
+    last_in_response: bool
+    # Current height of the source hypersync instance
+    archive_height: Optional[int]
+    # Rollback guard of the response, only set on its last batch
+    rollback_guard: Optional[RollbackGuard]
+    # Where the time went while producing this batch, server_execution_time_ms is only set on
+    # the last batch of a response
+    timing: ResponseTiming
+
+
+class ArrowBatchStream(object):
+    """
+    Stream of the record batches of arrow responses, one table at a time. Batches are
+    delivered as soon as their response arrives and prefetch counts batches instead of
+    responses. A response without rows yields a single zero-row batch, which might have no
+    columns, so next_block and checkpoints still advance past it.
+    """
+
+    # receive the next batch, returns None if the stream is finished
+    async def recv(self) -> Optional[Union[ArrowBatch, Rollback]]: ...
+
+    # receive up to max_items already buffered batches in one call, waiting for at least one.
+    # returns None if the stream is finished and an empty list if timeout (seconds) elapsed first
+    async def recv_many(
+        self, max_items: int, timeout: Optional[float] = None
+    ) -> Optional[list[Union[ArrowBatch, Rollback]]]: ...
+
+    def __aiter__(self) -> AsyncIterator[Union[ArrowBatch, Rollback]]: ...
+
+    # close the stream so it doesn't keep loading data in the background
+    async def close(self): ...
+
+    # blocking versions of the methods above, these release the GIL while waiting
+    def recv_sync(self) -> Optional[Union[ArrowBatch, Rollback]]: ...
+
+    def recv_many_sync(
+        self, max_items: int, timeout: Optional[float] = None
+    ) -> Optional[list[Union[ArrowBatch, Rollback]]]: ...
+
+    def close_sync(self): ...
+
+    def __iter__(self) -> Iterator[Union[ArrowBatch, Rollback]]: ...
+
+    # approximate size in bytes of the batches buffered ahead of the consumer
+    def buffered_bytes(self) -> int: ...
+
+    # number of batches buffered ahead of the consumer
+    def queue_depth(self) -> int: ...
+
+    # view of one table of the remaining batches, which implements the Arrow PyCapsule stream
+    # interface, see ArrowStream.table. Tables of StreamConfig.event_signatures are named after
+    # their event. pyarrow.RecordBatchReader.from_stream(stream.table("logs")) gives a reader
+    # over the whole stream that holds at most the prefetched batches in memory.
+    def table(self, name: str) -> ArrowStreamTable: ...
+
+
+class ArrowEventResponse(object):
+    """
+    Logs of an arrow response joined with their transactions and blocks, delivered by
+    collect_events_arrow and stream_events_arrow.
+    """
+
+    # Current height of the source hypersync instance
+    archive_height: Optional[int]
+    # Next block to query for, the responses are paginated so
+    # the caller should continue the query from this block if they
+    # didn't get responses up to the to_block they specified in the Query.
+    next_block: int
+    # Total time it took the hypersync instance to execute the query.
+    total_execution_time: int
+    # pyarrow.Table with a row per log. Selected transaction fields follow the log fields
+    # prefixed with "transaction_", selected block fields are prefixed with "block_". Fields
+    # that repeat a log field are left out. An ArrowTable if StreamConfig.arrow_output is
+    # ArrowOutput.CAPSULE, None if there are no logs in that case.
+    data: any
+    # Rollback guard
+    rollback_guard: Optional[RollbackGuard]
+    # Where the time went while producing this response
+    timing: ResponseTiming
+
+    # serialize the response as Arrow IPC. Responses are pickled this way, so they can be sent
+    # to a ProcessPoolExecutor without pickling every field of every row.
+    def to_ipc_bytes(self) -> bytes: ...
+
+    # read a response serialized by to_ipc_bytes
+    @classmethod
+    def from_ipc_bytes(cls, data: bytes) -> "ArrowEventResponse": ...
+
+
+class ArrowEventStream(object):
+    """Stream of ArrowEventResponse, see HypersyncClient.stream_events_arrow."""
+
+    # receive the next response, returns None if the stream is finished
+    async def recv(self) -> Optional[Union[ArrowEventResponse, Rollback]]: ...
+
+    # receive up to max_items already buffered responses in one call, waiting for at least one.
+    # returns None if the stream is finished and an empty list if timeout (seconds) elapsed first
+    async def recv_many(
+        self, max_items: int, timeout: Optional[float] = None
+    ) -> Optional[list[Union[ArrowEventResponse, Rollback]]]: ...
+
+    def __aiter__(self) -> AsyncIterator[Union[ArrowEventResponse, Rollback]]: ...
+
+    # close the stream so it doesn't keep loading data in the background
+    async def close(self): ...
+
+    # blocking versions of the methods above, these release the GIL while waiting
+    def recv_sync(self) -> Optional[Union[ArrowEventResponse, Rollback]]: ...
+
+    def recv_many_sync(
+        self, max_items: int, timeout: Optional[float] = None
+    ) -> Optional[list[Union[ArrowEventResponse, Rollback]]]: ...
+
+    def close_sync(self): ...
+
+    def __iter__(self) -> Iterator[Union[ArrowEventResponse, Rollback]]: ...
+
+    # approximate size in bytes of the responses buffered ahead of the consumer
+    def buffered_bytes(self) -> int: ...
+
+    # number of responses buffered ahead of the consumer
+    def queue_depth(self) -> int: ...
+
 
 class EventStream(object):
     inner: _EventStream
 
     # receive the next response, returns None if the stream is finished
-    async def recv(self) -> Optional[EventResponse]:
+    async def recv(self) -> Optional[Union[EventResponse, Rollback]]:
         await self.inner.recv()
 
+    # receive up to max_items already buffered responses in one call, waiting for at least one.
+    # returns None if the stream is finished and an empty list if timeout (seconds) elapsed first
+    async def recv_many(
+        self, max_items: int, timeout: Optional[float] = None
+    ) -> Optional[list[Union[EventResponse, Rollback]]]:
+        return await self.inner.recv_many(max_items, timeout)
+
+    def __aiter__(self) -> AsyncIterator[Union[EventResponse, Rollback]]:
+        return self.inner.__aiter__()
+
     # close the stream so it doesn't keep loading data in the background
     async def close(self):
         await self.inner.close()
 
+    # blocking versions of the methods above, these release the GIL while waiting so they can be
+    # used from plain threads without an asyncio event loop
+    def recv_sync(self) -> Optional[Union[EventResponse, Rollback]]:
+        return self.inner.recv_sync()
+
+    def recv_many_sync(
+        self, max_items: int, timeout: Optional[float] = None
+    ) -> Optional[list[Union[EventResponse, Rollback]]]:
+        return self.inner.recv_many_sync(max_items, timeout)
+
+    def close_sync(self):
+        self.inner.close_sync()
+
+    # approximate size in bytes of the responses buffered ahead of the consumer
+    def buffered_bytes(self) -> int:
+        return self.inner.buffered_bytes()
+
+    # number of responses buffered ahead of the consumer
+    def queue_depth(self) -> int:
+        return self.inner.queue_depth()
+
+    def __iter__(self) -> Iterator[Union[EventResponse, Rollback]]:
+        return self.inner.__iter__()
+
 
 class QueryResponseStream(object):
     inner: _QueryResponseStream
 
     # receive the next response, returns None if the stream is finished
-    async def recv(self) -> Optional[QueryResponse]:
+    async def recv(self) -> Optional[Union[QueryResponse, Rollback]]:
         await self.inner.recv()
 
+    # receive up to max_items already buffered responses in one call, waiting for at least one.
+    # returns None if the stream is finished and an empty list if timeout (seconds) elapsed first
+    async def recv_many(
+        self, max_items: int, timeout: Optional[float] = None
+    ) -> Optional[list[Union[QueryResponse, Rollback]]]:
+        return await self.inner.recv_many(max_items, timeout)
+
+    def __aiter__(self) -> AsyncIterator[Union[QueryResponse, Rollback]]:
+        return self.inner.__aiter__()
+
     # close the stream so it doesn't keep loading data in the background
     async def close(self):
         await self.inner.close()
 
+    # blocking versions of the methods above, these release the GIL while waiting so they can be
+    # used from plain threads without an asyncio event loop
+    def recv_sync(self) -> Optional[Union[QueryResponse, Rollback]]:
+        return self.inner.recv_sync()
+
+    def recv_many_sync(
+        self, max_items: int, timeout: Optional[float] = None
+    ) -> Optional[list[Union[QueryResponse, Rollback]]]:
+        return self.inner.recv_many_sync(max_items, timeout)
+
+    def close_sync(self):
+        self.inner.close_sync()
+
+    # approximate size in bytes of the responses buffered ahead of the consumer
+    def buffered_bytes(self) -> int:
+        return self.inner.buffered_bytes()
+
+    # number of responses buffered ahead of the consumer
+    def queue_depth(self) -> int:
+        return self.inner.queue_depth()
+
+    def __iter__(self) -> Iterator[Union[QueryResponse, Rollback]]:
+        return self.inner.__iter__()
+
+
+class MultiQueryStream(object):
+    """
+    Responses of HypersyncClient.stream_many, tagged with the index of their query.
+
+    Responses of a single query arrive in order, responses of different queries are
+    interleaved as they arrive.
+    """
+
+    inner: _MultiQueryStream
+
+    # receive the next (query index, response) pair, returns None if the stream is finished
+    async def recv(self) -> Optional[Tuple[int, QueryResponse]]:
+        return await self.inner.recv()
+
+    # receive up to max_items already buffered responses in one call, waiting for at least one.
+    # returns None if the stream is finished and an empty list if timeout (seconds) elapsed first
+    async def recv_many(
+        self, max_items: int, timeout: Optional[float] = None
+    ) -> Optional[List[Tuple[int, QueryResponse]]]:
+        return await self.inner.recv_many(max_items, timeout)
+
+    def __aiter__(self) -> AsyncIterator[Tuple[int, QueryResponse]]:
+        return self.inner.__aiter__()
+
+    # close the stream, this stops all queries
+    async def close(self):
+        await self.inner.close()
+
+    # blocking versions of the methods above
+    def recv_sync(self) -> Optional[Tuple[int, QueryResponse]]:
+        return self.inner.recv_sync()
+
+    def recv_many_sync(
+        self, max_items: int, timeout: Optional[float] = None
+    ) -> Optional[List[Tuple[int, QueryResponse]]]:
+        return self.inner.recv_many_sync(max_items, timeout)
+
+    def close_sync(self):
+        self.inner.close_sync()
+
+    # approximate size in bytes of the responses buffered ahead of the consumer
+    def buffered_bytes(self) -> int:
+        return self.inner.buffered_bytes()
+
+    # number of responses buffered ahead of the consumer
+    def queue_depth(self) -> int:
+        return self.inner.queue_depth()
+
+    def __iter__(self) -> Iterator[Tuple[int, QueryResponse]]:
+        return self.inner.__iter__()
+
 
 class HypersyncClient:
     """Internal client to handle http requests and retries."""
@@ -908,12 +1592,25 @@ class HypersyncClient:
         """
         return await self.inner.collect_arrow(query, config)
 
+    async def collect_events_arrow(
+        self, query: Query, config: StreamConfig
+    ) -> ArrowEventResponse:
+        """
+        Retrieves logs joined with their transactions and blocks as a single Arrow table. Only
+        the transaction and block fields selected in the query are joined, the join runs in
+        Rust so no per-row python objects are created.
+        """
+        return await self.inner.collect_events_arrow(query, config)
+
     async def collect_parquet(
         self, path: str, query: Query, config: StreamConfig
     ) -> None:
         """
         Writes parquet file getting data through a stream using the provided path, query,
         and stream configuration.
+
+        If config.parquet or config.shard_count is set, responses are written to rotating
+        "{table}_{from_block}_{to_block}.parquet" files as they arrive, see ParquetConfig.
         """
         return await self.inner.collect_parquet(path, query, config)
 
@@ -940,6 +1637,10 @@ class HypersyncClient:
         """Get the most recently observed rate limit information. Returns None if no requests have been made yet."""
         return self.inner.rate_limit_info()
 
+    def metrics(self) -> ClientMetrics:
+        """Get counters aggregated over all responses delivered by this client."""
+        return self.inner.metrics()
+
     async def wait_for_rate_limit(self) -> None:
         """Wait until the current rate limit window resets. Returns immediately if no rate limit info observed or quota available."""
         return await self.inner.wait_for_rate_limit()
@@ -959,6 +1660,151 @@ class HypersyncClient:
         """Spawns task to execute query and return data via a channel in Arrow format."""
         return await self.inner.stream_arrow(query, config)
 
+    async def stream_arrow_batches(
+        self, query: Query, config: StreamConfig
+    ) -> ArrowBatchStream:
+        """Like stream_arrow, but delivers each record batch of the responses on its own."""
+        return await self.inner.stream_arrow_batches(query, config)
+
+    async def stream_events_arrow(
+        self, query: Query, config: StreamConfig
+    ) -> ArrowEventStream:
+        """
+        Like collect_events_arrow, but delivers a joined table per response through a
+        channel.
+        """
+        return await self.inner.stream_events_arrow(query, config)
+
+    async def stream_many(
+        self, queries: List[Query], config: StreamConfig
+    ) -> MultiQueryStream:
+        """
+        Stream many queries at once over one client.
+
+        Queries are split into ranges of config.batch_size blocks that are requested
+        concurrently, so a single long query also uses the limit. All queries share
+        config.concurrency as a single limit on ranges in flight, each running one request at
+        a time and holding at most two responses until they are delivered. Delivered responses
+        go to one buffer of config.prefetch responses, followed by the converted response
+        buffer bounded by config.prefetch and config.memory_budget_bytes, so memory use
+        doesn't grow with the number of queries. Responses are returned as (query index,
+        QueryResponse) pairs. Each query runs until its to_block, or the server height if it
+        has none.
+        config.max_num_* apply to queries that don't set their own. reverse, checkpoint, tail,
+        shard_count, column_mapping, event_signature, hex_output and the dynamic batch size
+        options are not supported.
+        """
+        return await self.inner.stream_many(queries, config)
+
+
+class SyncHypersyncClient:
+    """
+    Blocking version of HypersyncClient.
+
+    Methods block the calling thread on the shared tokio runtime and release the GIL while
+    waiting, so multiple Python threads can run queries in parallel without an event loop.
+    Streams returned by this client should be consumed with recv_sync or plain iteration.
+    """
+
+    def __init__(self, config: ClientConfig):
+        """Creates a new client with the given configuration."""
+        self.inner = _SyncHypersyncClient(config)
+
+    def get_height(self) -> int:
+        """Get the height of the hypersync server with retries."""
+        return self.inner.get_height()
+
+    def get_chain_id(self) -> int:
+        """Get the chain_id of the hypersync server with retries."""
+        return self.inner.get_chain_id()
+
+    def collect(self, query: Query, config: StreamConfig) -> QueryResponse:
+        """
+        Retrieves blocks, transactions, traces, and logs through a stream using the provided
+        query and stream configuration.
+        """
+        return self.inner.collect(query, config)
+
+    def collect_events(self, query: Query, config: StreamConfig) -> EventResponse:
+        """Retrieves events through a stream using the provided query and stream configuration."""
+        return self.inner.collect_events(query, config)
+
+    def collect_arrow(self, query: Query, config: StreamConfig) -> ArrowResponse:
+        """
+        Retrieves blocks, transactions, traces, and logs in Arrow format through a stream using
+        the provided query and stream configuration.
+        """
+        return self.inner.collect_arrow(query, config)
+
+    def collect_events_arrow(self, query: Query, config: StreamConfig) -> ArrowEventResponse:
+        """Blocking version of HypersyncClient.collect_events_arrow."""
+        return self.inner.collect_events_arrow(query, config)
+
+    def collect_parquet(self, path: str, query: Query, config: StreamConfig) -> None:
+        """
+        Writes parquet file getting data through a stream using the provided path, query,
+        and stream configuration.
+        """
+        return self.inner.collect_parquet(path, query, config)
+
+    def get(self, query: Query) -> QueryResponse:
+        """Executes query with retries and returns the response."""
+        return self.inner.get(query)
+
+    def get_events(self, query: Query) -> EventResponse:
+        """
+        Add block, transaction and log fields selection to the query, executes it with retries
+        and returns the response.
+        """
+        return self.inner.get_events(query)
+
+    def get_arrow(self, query: Query) -> ArrowResponse:
+        """Executes query with retries and returns the response in Arrow format."""
+        return self.inner.get_arrow(query)
+
+    def get_with_rate_limit(self, query: Query) -> Tuple[QueryResponse, RateLimitInfo]:
+        """Executes query with retries and returns the response with rate limit info."""
+        return self.inner.get_with_rate_limit(query)
+
+    def rate_limit_info(self) -> Optional[RateLimitInfo]:
+        """Get the most recently observed rate limit information. Returns None if no requests have been made yet."""
+        return self.inner.rate_limit_info()
+
+    def metrics(self) -> ClientMetrics:
+        """Get counters aggregated over all responses delivered by this client."""
+        return self.inner.metrics()
+
+    def wait_for_rate_limit(self) -> None:
+        """Wait until the current rate limit window resets. Returns immediately if no rate limit info observed or quota available."""
+        return self.inner.wait_for_rate_limit()
+
+    def stream(self, query: Query, config: StreamConfig) -> QueryResponseStream:
+        """Spawns task to execute query and return data via a channel."""
+        return self.inner.stream(query, config)
+
+    def stream_events(self, query: Query, config: StreamConfig) -> EventStream:
+        """
+        Add block, transaction and log fields selection to the query and spawns task to execute it,
+        returning data via a channel.
+        """
+        return self.inner.stream_events(query, config)
+
+    def stream_arrow(self, query: Query, config: StreamConfig) -> ArrowStream:
+        """Spawns task to execute query and return data via a channel in Arrow format."""
+        return self.inner.stream_arrow(query, config)
+
+    def stream_arrow_batches(self, query: Query, config: StreamConfig) -> ArrowBatchStream:
+        """Like stream_arrow, but delivers each record batch of the responses on its own."""
+        return self.inner.stream_arrow_batches(query, config)
+
+    def stream_events_arrow(self, query: Query, config: StreamConfig) -> ArrowEventStream:
+        """Blocking version of HypersyncClient.stream_events_arrow."""
+        return self.inner.stream_events_arrow(query, config)
+
+    def stream_many(self, queries: List[Query], config: StreamConfig) -> MultiQueryStream:
+        """Blocking version of HypersyncClient.stream_many."""
+        return self.inner.stream_many(queries, config)
+
 
 def preset_query_blocks_and_transactions(
     from_block: int, to_block: Optional[int] = None
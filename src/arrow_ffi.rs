@@ -1,35 +1,218 @@
-use anyhow::{Context, Result};
+use std::sync::Arc;
+use std::time::Instant;
+
+use anyhow::{anyhow, Context, Result};
 use arrow::{
-    array::RecordBatch, ffi_stream::FFI_ArrowArrayStream, record_batch::RecordBatchIterator,
+    array::RecordBatch,
+    datatypes::{Schema, SchemaRef},
+    ffi::FFI_ArrowSchema,
+    ffi_stream::{ArrowArrayStreamReader, FFI_ArrowArrayStream},
+    record_batch::{RecordBatchIterator, RecordBatchReader},
 };
 use pyo3::{
     ffi::Py_uintptr_t,
-    types::{PyAnyMethods, PyModule},
-    Py, PyAny, PyErr, Python,
+    pyclass, pymethods,
+    types::{PyAnyMethods, PyBytes, PyCapsule, PyDict, PyDictMethods, PyModule, PyType},
+    Bound, Py, PyAny, PyResult, Python,
 };
 
 use crate::{
-    response::{ArrowResponse, ArrowResponseData},
+    column_layout::ColumnLayout,
+    decode_arrow::EventTables,
+    event_join::EventJoin,
+    ipc,
+    metrics::{millis, ResponseTiming},
+    response::{ArrowEventResponse, ArrowResponse, ArrowResponseData},
     types::RollbackGuard,
 };
 
-pub fn response_to_pyarrow(response: hypersync_client::ArrowResponse) -> Result<ArrowResponse> {
-    let data = Python::attach(|py| {
-        let pyarrow = py.import("pyarrow")?;
-        Ok::<_, PyErr>(ArrowResponseData {
-            blocks: convert_batches_to_pyarrow_table(py, &pyarrow, response.data.blocks)?,
-            transactions: convert_batches_to_pyarrow_table(
-                py,
-                &pyarrow,
-                response.data.transactions,
-            )?,
-            logs: convert_batches_to_pyarrow_table(py, &pyarrow, response.data.logs)?,
-            traces: convert_batches_to_pyarrow_table(py, &pyarrow, response.data.traces)?,
-            decoded_logs: convert_batches_to_pyarrow_table(
+/// Python type of the tables of arrow responses.
+#[derive(Clone, Copy, Debug, Default, PartialEq, Eq)]
+pub enum TableFormat {
+    /// pyarrow Tables.
+    #[default]
+    Pyarrow,
+    /// `ArrowTable`s, which are exported through the Arrow PyCapsule interface and don't need
+    /// pyarrow.
+    Capsule,
+}
+
+impl TableFormat {
+    pub fn parse(name: &str) -> Result<Self> {
+        match name {
+            "pyarrow" => Ok(Self::Pyarrow),
+            "capsule" => Ok(Self::Capsule),
+            other => Err(anyhow!("unknown arrow output: {other}")),
+        }
+    }
+}
+
+/// Record batches of a table of an arrow response.
+///
+/// Implements the Arrow PyCapsule interface, so polars, duckdb, pyarrow and other arrow
+/// consumers can import the batches without copying them and without pyarrow being installed.
+#[pyclass(frozen, module = "hypersync.hypersync")]
+pub struct ArrowTable {
+    schema: SchemaRef,
+    batches: Vec<RecordBatch>,
+}
+
+impl ArrowTable {
+    /// Wrap `batches`, `None` if there are no batches.
+    pub fn to_python(py: Python, batches: Vec<RecordBatch>) -> Result<Py<PyAny>> {
+        match batches.first() {
+            Some(batch) => Ok(Py::new(
                 py,
-                &pyarrow,
-                response.data.decoded_logs,
-            )?,
+                Self {
+                    schema: batch.schema(),
+                    batches,
+                },
+            )?
+            .into_any()),
+            None => Ok(py.None()),
+        }
+    }
+}
+
+#[pymethods]
+impl ArrowTable {
+    #[getter]
+    pub fn num_rows(&self) -> usize {
+        self.batches.iter().map(RecordBatch::num_rows).sum()
+    }
+
+    pub fn __len__(&self) -> usize {
+        self.num_rows()
+    }
+
+    /// Export the batches as an `arrow_array_stream` capsule. `requested_schema` is not
+    /// supported, the batches are always exported with their own schema.
+    #[pyo3(signature = (requested_schema=None))]
+    pub fn __arrow_c_stream__<'py>(
+        &self,
+        py: Python<'py>,
+        requested_schema: Option<Bound<'py, PyAny>>,
+    ) -> PyResult<Bound<'py, PyCapsule>> {
+        let _ = requested_schema;
+        let reader = RecordBatchIterator::new(
+            self.batches.clone().into_iter().map(Ok),
+            Arc::clone(&self.schema),
+        );
+        stream_capsule(py, Box::new(reader))
+    }
+
+    /// Export the schema as an `arrow_schema` capsule.
+    pub fn __arrow_c_schema__<'py>(&self, py: Python<'py>) -> Result<Bound<'py, PyCapsule>> {
+        schema_capsule(py, &self.schema)
+    }
+
+    /// Convert to a pyarrow Table, needs pyarrow.
+    pub fn to_pyarrow(&self, py: Python) -> Result<Py<PyAny>> {
+        batches_to_pyarrow(py, self.batches.clone())
+    }
+
+    /// Serialize the batches as an Arrow IPC stream, which `pyarrow.ipc.open_stream` can read
+    /// as well.
+    pub fn to_ipc_bytes<'py>(&self, py: Python<'py>) -> Result<Bound<'py, PyBytes>> {
+        let bytes = ipc::write_stream(&self.schema, &self.batches)?;
+        Ok(PyBytes::new(py, &bytes))
+    }
+
+    /// Read an Arrow IPC stream, such as the output of `to_ipc_bytes`.
+    #[classmethod]
+    pub fn from_ipc_bytes(_cls: &Bound<'_, PyType>, data: &[u8]) -> Result<Self> {
+        let (schema, batches) = ipc::read_stream(data)?;
+        Ok(Self { schema, batches })
+    }
+
+    pub fn __reduce__<'py>(
+        slf: &Bound<'py, Self>,
+    ) -> Result<(Bound<'py, PyAny>, (Bound<'py, PyBytes>,))> {
+        let bytes = slf.get().to_ipc_bytes(slf.py())?;
+        Ok((slf.get_type().getattr("from_ipc_bytes")?, (bytes,)))
+    }
+}
+
+/// Export `reader` as an `arrow_array_stream` capsule of the Arrow PyCapsule interface.
+///
+/// The consumer moves the stream out of the capsule, it is only released with the capsule if
+/// it was never consumed.
+pub fn stream_capsule<'py>(
+    py: Python<'py>,
+    reader: Box<dyn RecordBatchReader + Send>,
+) -> PyResult<Bound<'py, PyCapsule>> {
+    PyCapsule::new(
+        py,
+        FFI_ArrowArrayStream::new(reader),
+        Some(c"arrow_array_stream".to_owned()),
+    )
+}
+
+/// Export `schema` as an `arrow_schema` capsule of the Arrow PyCapsule interface.
+pub fn schema_capsule<'py>(py: Python<'py>, schema: &Schema) -> Result<Bound<'py, PyCapsule>> {
+    let schema = FFI_ArrowSchema::try_from(schema).context("export schema")?;
+    Ok(PyCapsule::new(
+        py,
+        schema,
+        Some(c"arrow_schema".to_owned()),
+    )?)
+}
+
+/// Import the record batches of a table of an arrow response, either format.
+pub fn table_batches(table: &Bound<'_, PyAny>) -> Result<Vec<RecordBatch>> {
+    if table.is_none() {
+        return Ok(Vec::new());
+    }
+    match table.downcast::<ArrowTable>() {
+        Ok(table) => Ok(table.get().batches.clone()),
+        Err(_) => pyarrow_to_batches(table),
+    }
+}
+
+/// Export the tables of `response` to python, decoding its logs into `events` if given.
+///
+/// Columns are laid out by `layout` after the logs are decoded.
+pub fn response_to_pyarrow(
+    response: hypersync_client::ArrowResponse,
+    events: Option<&EventTables>,
+    format: TableFormat,
+    layout: ColumnLayout,
+) -> Result<ArrowResponse> {
+    let start = Instant::now();
+
+    let decoded_events = events
+        .map(|events| layout_events(events.decode(&response.data.logs)?, layout))
+        .transpose()
+        .context("decode events")?;
+    let response = layout.apply_response(response)?;
+
+    let data = Python::attach(|py| {
+        // pyarrow is only imported if the tables are converted to it.
+        let pyarrow = match format {
+            TableFormat::Pyarrow => Some(py.import("pyarrow")?),
+            TableFormat::Capsule => None,
+        };
+        let table = |batches: &Vec<RecordBatch>| match &pyarrow {
+            Some(pyarrow) => convert_batches_to_pyarrow_table(py, pyarrow, batches.clone()),
+            None => ArrowTable::to_python(py, batches.clone()),
+        };
+
+        Ok::<_, anyhow::Error>(ArrowResponseData {
+            blocks: table(&response.data.blocks)?,
+            transactions: table(&response.data.transactions)?,
+            logs: table(&response.data.logs)?,
+            traces: table(&response.data.traces)?,
+            decoded_logs: table(&response.data.decoded_logs)?,
+            decoded_events: match decoded_events {
+                Some(tables) => {
+                    let dict = PyDict::new(py);
+                    for (name, batches) in tables {
+                        dict.set_item(name, table(&batches)?)?;
+                    }
+                    dict.into_any().unbind()
+                }
+                None => py.None(),
+            },
         })
     })?;
 
@@ -42,9 +225,148 @@ pub fn response_to_pyarrow(response: hypersync_client::ArrowResponse) -> Result<
             .rollback_guard
             .map(|rg| RollbackGuard::try_convert(rg).context("convert rollback guard"))
             .transpose()?,
+        timing: ResponseTiming {
+            server_execution_time_ms: response.total_execution_time,
+            arrow_conversion_ms: millis(start.elapsed()),
+            ..Default::default()
+        },
+        batches: Some(Arc::new([
+            response.data.blocks,
+            response.data.transactions,
+            response.data.logs,
+            response.data.traces,
+            response.data.decoded_logs,
+        ])),
     })
 }
 
+/// Join the logs of `response` with their transactions and blocks and export the joined table
+/// to python.
+pub fn events_to_pyarrow(
+    response: hypersync_client::ArrowResponse,
+    join: &EventJoin,
+    format: TableFormat,
+    layout: ColumnLayout,
+) -> Result<ArrowEventResponse> {
+    let start = Instant::now();
+
+    let response = layout.apply_response(response)?;
+    let joined = join
+        .join(
+            &response.data.logs,
+            &response.data.transactions,
+            &response.data.blocks,
+        )
+        .context("join events")?;
+    let data = Python::attach(|py| match format {
+        TableFormat::Pyarrow => batches_to_pyarrow(py, joined),
+        TableFormat::Capsule => ArrowTable::to_python(py, joined),
+    })?;
+
+    Ok(ArrowEventResponse {
+        archive_height: response.archive_height,
+        next_block: response.next_block,
+        total_execution_time: response.total_execution_time,
+        data,
+        rollback_guard: response
+            .rollback_guard
+            .map(|rg| RollbackGuard::try_convert(rg).context("convert rollback guard"))
+            .transpose()?,
+        timing: ResponseTiming {
+            server_execution_time_ms: response.total_execution_time,
+            arrow_conversion_ms: millis(start.elapsed()),
+            ..Default::default()
+        },
+    })
+}
+
+/// Lay out the id columns of the tables of `EventTables::decode` like the columns of the logs
+/// they were taken from.
+pub fn layout_events(
+    tables: Vec<(String, Vec<RecordBatch>)>,
+    layout: ColumnLayout,
+) -> Result<Vec<(String, Vec<RecordBatch>)>> {
+    tables
+        .into_iter()
+        .map(|(name, batches)| Ok((name, layout.apply("logs", batches)?)))
+        .collect()
+}
+
+/// In-memory size of the arrow buffers of a response, used for stream memory budgeting.
+pub fn arrow_response_size(response: &hypersync_client::ArrowResponse) -> usize {
+    let data = &response.data;
+    [
+        &data.blocks,
+        &data.transactions,
+        &data.logs,
+        &data.traces,
+        &data.decoded_logs,
+    ]
+    .into_iter()
+    .flatten()
+    .map(RecordBatch::get_array_memory_size)
+    .sum()
+}
+
+/// Export `batches` as a pyarrow Table, `None` if there are no batches.
+pub fn batches_to_pyarrow(py: Python, batches: Vec<RecordBatch>) -> Result<Py<PyAny>> {
+    let pyarrow = py.import("pyarrow")?;
+    convert_batches_to_pyarrow_table(py, &pyarrow, batches)
+}
+
+/// Export a single batch as a pyarrow RecordBatch or an `ArrowTable` following `format`.
+pub fn batch_to_python(py: Python, batch: RecordBatch, format: TableFormat) -> Result<Py<PyAny>> {
+    match format {
+        TableFormat::Pyarrow => {
+            let pyarrow = py.import("pyarrow")?;
+            let schema = batch.schema();
+            let reader = RecordBatchIterator::new([Ok(batch)], schema);
+            let mut ffi_stream = FFI_ArrowArrayStream::new(Box::new(reader));
+
+            let batch = pyarrow
+                .getattr("RecordBatchReader")?
+                .call_method1(
+                    "_import_from_c",
+                    (&mut ffi_stream as *mut FFI_ArrowArrayStream as Py_uintptr_t,),
+                )?
+                .call_method0("read_next_batch")
+                .context("read pyarrow RecordBatch")?;
+
+            Ok(batch.unbind())
+        }
+        TableFormat::Capsule => ArrowTable::to_python(py, vec![batch]),
+    }
+}
+
+/// Import the record batches of a pyarrow Table or RecordBatch.
+pub fn pyarrow_to_batches(obj: &Bound<'_, PyAny>) -> Result<Vec<RecordBatch>> {
+    let pyarrow = obj.py().import("pyarrow")?;
+
+    let table = if obj.is_instance(&pyarrow.getattr("RecordBatch")?)? {
+        pyarrow
+            .getattr("Table")?
+            .call_method1("from_batches", (vec![obj.clone()],))
+            .context("call pyarrow::Table::from_batches")?
+    } else {
+        obj.clone()
+    };
+
+    let mut ffi_stream = FFI_ArrowArrayStream::empty();
+    table
+        .call_method0("to_reader")
+        .context("get record batch reader")?
+        .call_method1(
+            "_export_to_c",
+            (&mut ffi_stream as *mut FFI_ArrowArrayStream as Py_uintptr_t,),
+        )
+        .context("export arrow stream")?;
+
+    ArrowArrayStreamReader::try_new(ffi_stream)
+        .context("import arrow stream")?
+        .collect::<Result<Vec<_>, _>>()
+        .context("read record batches")
+}
+
 fn convert_batches_to_pyarrow_table<'py>(
     py: Python<'py>,
     pyarrow: &pyo3::Bound<'py, PyModule>,
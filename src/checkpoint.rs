@@ -0,0 +1,390 @@
+use std::fs;
+use std::io::Write;
+use std::path::{Path, PathBuf};
+use std::sync::{
+    atomic::{AtomicU64, Ordering},
+    Mutex,
+};
+
+use anyhow::{anyhow, Context, Result};
+use pyo3::prelude::*;
+use rusqlite::OptionalExtension;
+use serde::{Deserialize, Serialize};
+
+use crate::{
+    response::{ArrowBatch, ArrowEventResponse, ArrowResponse, EventResponse, QueryResponse},
+    types::RollbackGuard,
+};
+
+/// Counter used to give every temporary checkpoint file of this process its own name.
+static TMP_COUNTER: AtomicU64 = AtomicU64::new(0);
+
+#[derive(Default, Clone, FromPyObject)]
+pub struct CheckpointConfig {
+    /// Path of the checkpoint file or sqlite database.
+    pub path: String,
+    /// "file" or "sqlite", defaults to "file".
+    pub backend: Option<String>,
+    /// Key of the checkpoint inside a sqlite database. Defaults to "default".
+    pub key: Option<String>,
+}
+
+/// Progress of a stream, persisted after the consumer acknowledges a response.
+#[derive(Clone, Serialize, Deserialize)]
+pub struct Checkpoint {
+    /// Block to continue the stream from.
+    pub next_block: u64,
+    /// Rollback guard of the last acknowledged response.
+    pub rollback_guard: Option<RollbackGuard>,
+}
+
+/// Responses that can be recorded in a checkpoint store.
+pub trait Checkpointed {
+    /// Progress reached once this item is processed, `None` if it doesn't move the progress.
+    fn checkpoint(&self) -> Option<Checkpoint>;
+}
+
+impl Checkpointed for QueryResponse {
+    fn checkpoint(&self) -> Option<Checkpoint> {
+        Some(Checkpoint {
+            next_block: u64::try_from(self.next_block).unwrap_or_default(),
+            rollback_guard: self.rollback_guard.clone(),
+        })
+    }
+}
+
+impl Checkpointed for EventResponse {
+    fn checkpoint(&self) -> Option<Checkpoint> {
+        Some(Checkpoint {
+            next_block: u64::try_from(self.next_block).unwrap_or_default(),
+            rollback_guard: self.rollback_guard.clone(),
+        })
+    }
+}
+
+/// Responses of `stream_many` tagged with their query index.
+impl<T: Checkpointed> Checkpointed for (usize, T) {
+    fn checkpoint(&self) -> Option<Checkpoint> {
+        self.1.checkpoint()
+    }
+}
+
+impl Checkpointed for ArrowResponse {
+    fn checkpoint(&self) -> Option<Checkpoint> {
+        Some(Checkpoint {
+            next_block: self.next_block,
+            rollback_guard: self.rollback_guard.clone(),
+        })
+    }
+}
+
+impl Checkpointed for ArrowEventResponse {
+    fn checkpoint(&self) -> Option<Checkpoint> {
+        Some(Checkpoint {
+            next_block: self.next_block,
+            rollback_guard: self.rollback_guard.clone(),
+        })
+    }
+}
+
+/// Only the last batch of a response completes it.
+impl Checkpointed for ArrowBatch {
+    fn checkpoint(&self) -> Option<Checkpoint> {
+        self.last_in_response.then(|| Checkpoint {
+            next_block: self.next_block,
+            rollback_guard: self.rollback_guard.clone(),
+        })
+    }
+}
+
+#[derive(Debug)]
+pub enum CheckpointStore {
+    File(PathBuf),
+    Sqlite {
+        conn: Mutex<rusqlite::Connection>,
+        key: String,
+    },
+}
+
+impl CheckpointStore {
+    pub fn open(config: &CheckpointConfig) -> Result<Self> {
+        match config.backend.as_deref().unwrap_or("file") {
+            "file" => Ok(Self::File(PathBuf::from(&config.path))),
+            "sqlite" => {
+                let conn =
+                    rusqlite::Connection::open(&config.path).context("open checkpoint database")?;
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS hypersync_checkpoints (
+                        key TEXT PRIMARY KEY,
+                        next_block INTEGER NOT NULL,
+                        rollback_guard TEXT
+                    )",
+                    [],
+                )
+                .context("create checkpoint table")?;
+
+                Ok(Self::Sqlite {
+                    conn: Mutex::new(conn),
+                    key: config.key.clone().unwrap_or_else(|| "default".into()),
+                })
+            }
+            other => Err(anyhow!("unknown checkpoint backend: {other}")),
+        }
+    }
+
+    pub fn load(&self) -> Result<Option<Checkpoint>> {
+        match self {
+            Self::File(path) => {
+                let data = match fs::read(path) {
+                    Ok(data) => data,
+                    Err(e) if e.kind() == std::io::ErrorKind::NotFound => return Ok(None),
+                    Err(e) => return Err(e).context("read checkpoint file"),
+                };
+
+                serde_json::from_slice(&data)
+                    .context("parse checkpoint file")
+                    .map(Some)
+            }
+            Self::Sqlite { conn, key } => {
+                let conn = conn.lock().unwrap();
+                let row = conn
+                    .query_row(
+                        "SELECT next_block, rollback_guard FROM hypersync_checkpoints WHERE key = ?1",
+                        [key],
+                        |row| Ok((row.get::<_, i64>(0)?, row.get::<_, Option<String>>(1)?)),
+                    )
+                    .optional()
+                    .context("query checkpoint")?;
+
+                row.map(|(next_block, rollback_guard)| {
+                    Ok(Checkpoint {
+                        next_block: next_block.try_into().context("convert next_block")?,
+                        rollback_guard: rollback_guard
+                            .map(|rg| serde_json::from_str(&rg))
+                            .transpose()
+                            .context("parse rollback guard")?,
+                    })
+                })
+                .transpose()
+            }
+        }
+    }
+
+    /// Atomically replace the stored checkpoint.
+    pub fn save(&self, checkpoint: &Checkpoint) -> Result<()> {
+        match self {
+            Self::File(path) => {
+                let data = serde_json::to_vec(checkpoint).context("serialize checkpoint")?;
+
+                // Unique per write so concurrent writers never share a temporary file.
+                let mut tmp_path = path.clone().into_os_string();
+                tmp_path.push(format!(
+                    ".{}.{}.tmp",
+                    std::process::id(),
+                    TMP_COUNTER.fetch_add(1, Ordering::Relaxed)
+                ));
+                let tmp_path = PathBuf::from(tmp_path);
+
+                let write = || -> Result<()> {
+                    let mut file = fs::File::create(&tmp_path).context("create checkpoint file")?;
+                    file.write_all(&data).context("write checkpoint file")?;
+                    file.sync_all().context("sync checkpoint file")?;
+                    fs::rename(&tmp_path, path).context("replace checkpoint file")
+                };
+                if let Err(e) = write() {
+                    fs::remove_file(&tmp_path).ok();
+                    return Err(e);
+                }
+
+                sync_parent_dir(path)
+            }
+            Self::Sqlite { conn, key } => {
+                let next_block =
+                    i64::try_from(checkpoint.next_block).context("convert next_block")?;
+                let rollback_guard = checkpoint
+                    .rollback_guard
+                    .as_ref()
+                    .map(serde_json::to_string)
+                    .transpose()
+                    .context("serialize rollback guard")?;
+
+                conn.lock()
+                    .unwrap()
+                    .execute(
+                        "INSERT INTO hypersync_checkpoints (key, next_block, rollback_guard)
+                        VALUES (?1, ?2, ?3)
+                        ON CONFLICT(key) DO UPDATE SET
+                            next_block = excluded.next_block,
+                            rollback_guard = excluded.rollback_guard",
+                        rusqlite::params![key, next_block, rollback_guard],
+                    )
+                    .context("write checkpoint")?;
+
+                Ok(())
+            }
+        }
+    }
+}
+
+/// Flush the directory entry of `path` so a completed rename survives a crash.
+#[cfg(unix)]
+fn sync_parent_dir(path: &Path) -> Result<()> {
+    let parent = match path.parent() {
+        Some(parent) if !parent.as_os_str().is_empty() => parent,
+        _ => Path::new("."),
+    };
+
+    fs::File::open(parent)
+        .and_then(|dir| dir.sync_all())
+        .context("sync checkpoint directory")
+}
+
+/// Directories can't be opened as files on this platform, the rename is all we can do.
+#[cfg(not(unix))]
+fn sync_parent_dir(_path: &Path) -> Result<()> {
+    Ok(())
+}
+
+#[cfg(test)]
+mod tests {
+    use std::sync::Arc;
+
+    use hypersync_client::net_types;
+
+    use super::*;
+    use crate::stream::StreamOptions;
+
+    /// Path in the temp directory that is unique to this process and test.
+    fn temp_path(name: &str) -> PathBuf {
+        let path = std::env::temp_dir().join(format!("hypersync-{}-{name}", std::process::id()));
+        fs::remove_file(&path).ok();
+        path
+    }
+
+    fn open(path: &Path, backend: &str, key: Option<&str>) -> CheckpointStore {
+        CheckpointStore::open(&CheckpointConfig {
+            path: path.to_string_lossy().into_owned(),
+            backend: Some(backend.to_owned()),
+            key: key.map(str::to_owned),
+        })
+        .unwrap()
+    }
+
+    fn checkpoint(next_block: u64) -> Checkpoint {
+        Checkpoint {
+            next_block,
+            rollback_guard: Some(RollbackGuard {
+                block_number: next_block as i64 - 1,
+                hash: "0xaa".to_owned(),
+                ..Default::default()
+            }),
+        }
+    }
+
+    #[test]
+    fn test_file_store_roundtrip() {
+        let path = temp_path("checkpoint.json");
+        let store = open(&path, "file", None);
+        assert!(store.load().unwrap().is_none());
+
+        store.save(&checkpoint(42)).unwrap();
+        store.save(&checkpoint(50)).unwrap();
+
+        let loaded = open(&path, "file", None).load().unwrap().unwrap();
+        assert_eq!(loaded.next_block, 50);
+        let guard = loaded.rollback_guard.unwrap();
+        assert_eq!((guard.block_number, guard.hash.as_str()), (49, "0xaa"));
+
+        // temporary files are renamed over the checkpoint
+        let name = path.file_name().unwrap().to_string_lossy().into_owned();
+        let leftovers = fs::read_dir(path.parent().unwrap())
+            .unwrap()
+            .filter_map(|entry| entry.ok())
+            .filter(|entry| {
+                let entry = entry.file_name().to_string_lossy().into_owned();
+                entry.starts_with(&name) && entry.ends_with(".tmp")
+            })
+            .count();
+        assert_eq!(leftovers, 0);
+
+        fs::remove_file(&path).unwrap();
+    }
+
+    #[test]
+    fn test_sqlite_store_roundtrip() {
+        let path = temp_path("checkpoints.sqlite");
+        {
+            let first = open(&path, "sqlite", Some("first"));
+            let second = open(&path, "sqlite", Some("second"));
+            assert!(first.load().unwrap().is_none());
+
+            first.save(&checkpoint(10)).unwrap();
+            second.save(&checkpoint(20)).unwrap();
+            first.save(&checkpoint(11)).unwrap();
+        }
+
+        let first = open(&path, "sqlite", Some("first"))
+            .load()
+            .unwrap()
+            .unwrap();
+        let second = open(&path, "sqlite", Some("second"))
+            .load()
+            .unwrap()
+            .unwrap();
+        assert_eq!((first.next_block, second.next_block), (11, 20));
+        assert_eq!(first.rollback_guard.unwrap().block_number, 10);
+        assert!(open(&path, "sqlite", None).load().unwrap().is_none());
+
+        fs::remove_file(&path).unwrap();
+    }
+
+    #[test]
+    fn test_unknown_backend() {
+        let config = CheckpointConfig {
+            path: "checkpoint".to_owned(),
+            backend: Some("redis".to_owned()),
+            key: None,
+        };
+        assert!(CheckpointStore::open(&config).is_err());
+    }
+
+    #[test]
+    fn test_resume_from_saved_next_block() {
+        let path = temp_path("resume.json");
+        let store = open(&path, "file", None);
+        store.save(&checkpoint(500)).unwrap();
+        let options = StreamOptions {
+            checkpoint: Some(Arc::new(store)),
+            ..Default::default()
+        };
+
+        let query = |from_block: u64, to_block: Option<u64>| -> net_types::Query {
+            serde_json::from_value(serde_json::json!({
+                "from_block": from_block,
+                "to_block": to_block,
+            }))
+            .unwrap()
+        };
+
+        // continues from the checkpoint
+        let mut q = query(100, Some(1000));
+        assert!(options.resume(&mut q).unwrap());
+        assert_eq!(q.from_block, 500);
+
+        // never moves a query back
+        let mut q = query(600, None);
+        assert!(options.resume(&mut q).unwrap());
+        assert_eq!(q.from_block, 600);
+
+        // already finished
+        let mut q = query(100, Some(500));
+        assert!(!options.resume(&mut q).unwrap());
+
+        // nothing to resume from without a store
+        let mut q = query(100, Some(1000));
+        assert!(StreamOptions::default().resume(&mut q).unwrap());
+        assert_eq!(q.from_block, 100);
+
+        fs::remove_file(&path).unwrap();
+    }
+}
@@ -0,0 +1,394 @@
+use std::sync::Arc;
+
+use anyhow::{Context, Result};
+use hypersync_client::{net_types, ArrowResponse as InnerArrowResponse};
+
+use crate::{
+    arrow_ffi::{arrow_response_size, events_to_pyarrow, response_to_pyarrow, TableFormat},
+    column_layout::ColumnLayout,
+    config::{ClientConfig, StreamConfig},
+    event_join::EventJoin,
+    metrics::{ClientMetrics, Metrics},
+    multi::{self, MultiOptions},
+    query::Query,
+    response::{
+        convert_event_response, convert_response, event_response_size, query_response_size,
+        ArrowBatchStream, ArrowEventResponse, ArrowEventStream, ArrowResponse, ArrowStream,
+        ConvertOptions, EventResponse, EventStream, MultiQueryStream, QueryResponse,
+        QueryResponseStream,
+    },
+    shard, stream,
+    types::RateLimitInfo,
+};
+
+/// State and request logic shared by `HypersyncClient` and `SyncHypersyncClient`.
+///
+/// Methods take `self` by value so the returned futures are `'static`, the async client wraps
+/// them with `future_into_py` and the blocking client with `block_on`.
+#[derive(Clone)]
+pub struct ClientCore {
+    inner: Arc<hypersync_client::Client>,
+    metrics: Arc<Metrics>,
+    convert: ConvertOptions,
+}
+
+impl ClientCore {
+    pub fn new(config: ClientConfig) -> Result<Self> {
+        env_logger::try_init().ok();
+
+        let convert = config.convert_options()?;
+        let config = config.try_convert().context("parse config")?;
+
+        Ok(Self {
+            inner: Arc::new(hypersync_client::Client::new(config).context("create client")?),
+            metrics: Arc::new(Metrics::default()),
+            convert,
+        })
+    }
+
+    pub fn metrics(&self) -> ClientMetrics {
+        self.metrics.snapshot()
+    }
+
+    pub fn rate_limit_info(&self) -> Option<RateLimitInfo> {
+        self.inner.rate_limit_info().map(|info| info.into())
+    }
+
+    pub async fn get_height(self) -> Result<u64> {
+        self.inner.get_height().await
+    }
+
+    pub async fn get_chain_id(self) -> Result<u64> {
+        self.inner.get_chain_id().await
+    }
+
+    pub async fn wait_for_rate_limit(self) {
+        self.inner.wait_for_rate_limit().await
+    }
+
+    pub async fn collect(self, query: Query, config: StreamConfig) -> Result<QueryResponse> {
+        let convert = self.convert.for_query(&query.field_selection);
+        let query = query.try_convert().context("parse query")?;
+        let config = config.try_convert().context("parse config")?;
+
+        let (res, latency) = self
+            .metrics
+            .time(self.inner.collect(query, config))
+            .await
+            .context("collect arrow")?;
+
+        let bytes = query_response_size(&res);
+        let mut res = convert_response(res, &convert).context("convert response to pyarrow")?;
+        self.metrics.observe(&mut res, latency, bytes);
+
+        Ok(res)
+    }
+
+    pub async fn collect_events(self, query: Query, config: StreamConfig) -> Result<EventResponse> {
+        let query = query.try_convert().context("parse query")?;
+        let config = config.try_convert().context("parse config")?;
+
+        let (res, latency) = self
+            .metrics
+            .time(self.inner.collect_events(query, config))
+            .await
+            .context("collect arrow")?;
+
+        let bytes = event_response_size(&res);
+        let mut res = convert_event_response(res).context("convert response to pyarrow")?;
+        self.metrics.observe(&mut res, latency, bytes);
+
+        Ok(res)
+    }
+
+    pub async fn collect_arrow(self, query: Query, config: StreamConfig) -> Result<ArrowResponse> {
+        let query = query.try_convert().context("parse query")?;
+        let options = config.stream_options()?;
+        let config = config.try_convert().context("parse config")?;
+
+        let (res, latency) = self
+            .metrics
+            .time(collect_arrow_sharded(
+                Arc::clone(&self.inner),
+                query,
+                config,
+                options.shard_count,
+            ))
+            .await
+            .context("collect arrow")?;
+
+        let bytes = arrow_response_size(&res);
+        let mut res = response_to_pyarrow(
+            res,
+            options.event_tables.as_deref(),
+            options.table_format,
+            options.column_layout,
+        )
+        .context("convert response to pyarrow")?;
+        self.metrics.observe(&mut res, latency, bytes);
+
+        Ok(res)
+    }
+
+    pub async fn collect_events_arrow(
+        self,
+        mut query: Query,
+        config: StreamConfig,
+    ) -> Result<ArrowEventResponse> {
+        let join = EventJoin::prepare(&mut query);
+        let query = query.try_convert().context("parse query")?;
+        let options = config.stream_options()?;
+        let config = config.try_convert().context("parse config")?;
+
+        let (res, latency) = self
+            .metrics
+            .time(collect_arrow_sharded(
+                Arc::clone(&self.inner),
+                query,
+                config,
+                options.shard_count,
+            ))
+            .await
+            .context("collect arrow")?;
+
+        let bytes = arrow_response_size(&res);
+        let mut res = events_to_pyarrow(res, &join, options.table_format, options.column_layout)
+            .context("convert response to pyarrow")?;
+        self.metrics.observe(&mut res, latency, bytes);
+
+        Ok(res)
+    }
+
+    pub async fn collect_parquet(
+        self,
+        path: String,
+        query: Query,
+        config: StreamConfig,
+    ) -> Result<()> {
+        let query = query.try_convert().context("parse query")?;
+        let options = config.stream_options()?;
+        let config = config.try_convert().context("parse config")?;
+
+        match (options.parquet, options.shard_count) {
+            (None, None) => self.inner.collect_parquet(&path, query, config).await,
+            (parquet, shard_count) => {
+                shard::collect_parquet(
+                    self.inner,
+                    &path,
+                    query,
+                    config,
+                    shard_count.unwrap_or(1),
+                    parquet.unwrap_or_default(),
+                )
+                .await
+            }
+        }
+        .context("collect parquet")
+    }
+
+    pub async fn get(self, query: Query) -> Result<QueryResponse> {
+        let convert = self.convert.for_query(&query.field_selection);
+        let query = query.try_convert().context("parse query")?;
+
+        let (res, latency) = self
+            .metrics
+            .time(self.inner.get(&query))
+            .await
+            .context("get arrow")?;
+
+        let bytes = query_response_size(&res);
+        let mut res = convert_response(res, &convert).context("convert response to pyarrow")?;
+        self.metrics.observe(&mut res, latency, bytes);
+
+        Ok(res)
+    }
+
+    pub async fn get_events(self, query: Query) -> Result<EventResponse> {
+        let query = query.try_convert().context("parse query")?;
+
+        let (res, latency) = self
+            .metrics
+            .time(self.inner.get_events(query))
+            .await
+            .context("get arrow")?;
+
+        let bytes = event_response_size(&res);
+        let mut res = convert_event_response(res).context("convert response to pyarrow")?;
+        self.metrics.observe(&mut res, latency, bytes);
+
+        Ok(res)
+    }
+
+    pub async fn get_arrow(self, query: Query) -> Result<ArrowResponse> {
+        let query = query.try_convert().context("parse query")?;
+
+        let (res, latency) = self
+            .metrics
+            .time(self.inner.get_arrow(&query))
+            .await
+            .context("get arrow")?;
+
+        let bytes = arrow_response_size(&res);
+        let mut res =
+            response_to_pyarrow(res, None, TableFormat::default(), ColumnLayout::default())
+                .context("convert response to pyarrow")?;
+        self.metrics.observe(&mut res, latency, bytes);
+
+        Ok(res)
+    }
+
+    pub async fn get_with_rate_limit(self, query: Query) -> Result<(QueryResponse, RateLimitInfo)> {
+        let convert = self.convert.for_query(&query.field_selection);
+        let query = query.try_convert().context("parse query")?;
+
+        let (res, latency) = self
+            .metrics
+            .time(self.inner.get_with_rate_limit(&query))
+            .await
+            .context("get with rate limit")?;
+
+        let bytes = query_response_size(&res.response);
+        let mut response = convert_response(res.response, &convert).context("convert response")?;
+        self.metrics.observe(&mut response, latency, bytes);
+        let rate_limit: RateLimitInfo = res.rate_limit.into();
+
+        Ok((response, rate_limit))
+    }
+
+    pub async fn stream(self, query: Query, config: StreamConfig) -> Result<QueryResponseStream> {
+        let convert = self.convert.for_query(&query.field_selection);
+        let query = query.try_convert().context("parse query")?;
+        let options = config
+            .stream_options()?
+            .with_metrics(self.metrics)
+            .with_convert(convert);
+        let config = config.try_convert().context("parse config")?;
+
+        let inner = stream::open(
+            self.inner,
+            query,
+            config,
+            &options,
+            |client, query, config| client.stream(query, config),
+        )
+        .await?;
+
+        Ok(QueryResponseStream::new(inner, &options))
+    }
+
+    pub async fn stream_events(self, query: Query, config: StreamConfig) -> Result<EventStream> {
+        let query = query.try_convert().context("parse query")?;
+        let options = config.stream_options()?.with_metrics(self.metrics);
+        let config = config.try_convert().context("parse config")?;
+
+        let inner = stream::open(
+            self.inner,
+            query,
+            config,
+            &options,
+            |client, query, config| client.stream_events(query, config),
+        )
+        .await?;
+
+        Ok(EventStream::new(inner, &options))
+    }
+
+    pub async fn stream_arrow(self, query: Query, config: StreamConfig) -> Result<ArrowStream> {
+        let query = query.try_convert().context("parse query")?;
+        let options = config.stream_options()?.with_metrics(self.metrics);
+        let config = config.try_convert().context("parse config")?;
+
+        let inner = stream::open(
+            self.inner,
+            query,
+            config,
+            &options,
+            |client, query, config| client.stream_arrow(query, config),
+        )
+        .await?;
+
+        Ok(ArrowStream::new(inner, &options))
+    }
+
+    pub async fn stream_events_arrow(
+        self,
+        mut query: Query,
+        config: StreamConfig,
+    ) -> Result<ArrowEventStream> {
+        let join = EventJoin::prepare(&mut query);
+        let query = query.try_convert().context("parse query")?;
+        let options = config.stream_options()?.with_metrics(self.metrics);
+        let config = config.try_convert().context("parse config")?;
+
+        let inner = stream::open(
+            self.inner,
+            query,
+            config,
+            &options,
+            |client, query, config| client.stream_arrow(query, config),
+        )
+        .await?;
+
+        Ok(ArrowEventStream::new(inner, &options, join))
+    }
+
+    pub async fn stream_arrow_batches(
+        self,
+        query: Query,
+        config: StreamConfig,
+    ) -> Result<ArrowBatchStream> {
+        let query = query.try_convert().context("parse query")?;
+        let options = config.stream_options()?.with_metrics(self.metrics);
+        let config = config.try_convert().context("parse config")?;
+
+        let inner = stream::open(
+            self.inner,
+            query,
+            config,
+            &options,
+            |client, query, config| client.stream_arrow(query, config),
+        )
+        .await?;
+
+        Ok(ArrowBatchStream::new(inner, &options))
+    }
+
+    pub async fn stream_many(
+        self,
+        queries: Vec<Query>,
+        config: StreamConfig,
+    ) -> Result<MultiQueryStream> {
+        let multi_options = MultiOptions::new(&config)?;
+        let options = config.stream_options()?.with_metrics(self.metrics);
+        let convert = self.convert.with_shared_interner();
+        let convert = queries
+            .iter()
+            .map(|query| convert.for_query(&query.field_selection))
+            .collect::<Vec<_>>();
+        let queries = queries
+            .into_iter()
+            .map(|mut query| {
+                multi_options.apply_limits(&mut query);
+                query.try_convert()
+            })
+            .collect::<Result<Vec<_>>>()
+            .context("parse queries")?;
+
+        let inner = multi::stream_many(self.inner, queries, multi_options, options.prefetch);
+
+        Ok(MultiQueryStream::new(inner, &options, convert))
+    }
+}
+
+/// Collect `query` with `shard_count` independent streams, or a single one if it is not set.
+async fn collect_arrow_sharded(
+    inner: Arc<hypersync_client::Client>,
+    query: net_types::Query,
+    config: hypersync_client::StreamConfig,
+    shard_count: Option<usize>,
+) -> Result<InnerArrowResponse> {
+    match shard_count {
+        Some(shard_count) => shard::collect_arrow(inner, query, config, shard_count).await,
+        None => inner.collect_arrow(query, config).await,
+    }
+}
@@ -0,0 +1,261 @@
+//! Compact layouts of the hash and address columns of arrow responses.
+//!
+//! Hashes and addresses are variable length binaries, or hex strings with `hex_output`. They
+//! can be emitted as `FixedSizeBinary(32)` and `FixedSizeBinary(20)` instead, and the columns
+//! that repeat the same few values over many rows can be dictionary encoded.
+
+use std::sync::Arc;
+
+use anyhow::{Context, Result};
+use arrow::{
+    array::{ArrayRef, FixedSizeBinaryBuilder, RecordBatch},
+    compute::cast,
+    datatypes::{DataType, Schema},
+};
+
+use crate::decode_arrow::BinaryColumn;
+
+const HASH_SIZE: i32 = 32;
+const ADDRESS_SIZE: i32 = 20;
+
+/// Hash and address columns of each table, with their size in bytes.
+const FIXED_SIZE_COLUMNS: &[(&str, &[(&str, i32)])] = &[
+    (
+        "blocks",
+        &[
+            ("hash", HASH_SIZE),
+            ("parent_hash", HASH_SIZE),
+            ("sha3_uncles", HASH_SIZE),
+            ("transactions_root", HASH_SIZE),
+            ("state_root", HASH_SIZE),
+            ("receipts_root", HASH_SIZE),
+            ("mix_hash", HASH_SIZE),
+            ("parent_beacon_block_root", HASH_SIZE),
+            ("withdrawals_root", HASH_SIZE),
+            ("send_root", HASH_SIZE),
+            ("miner", ADDRESS_SIZE),
+        ],
+    ),
+    (
+        "transactions",
+        &[
+            ("block_hash", HASH_SIZE),
+            ("hash", HASH_SIZE),
+            ("root", HASH_SIZE),
+            ("source_hash", HASH_SIZE),
+            ("from", ADDRESS_SIZE),
+            ("to", ADDRESS_SIZE),
+            ("contract_address", ADDRESS_SIZE),
+        ],
+    ),
+    (
+        "logs",
+        &[
+            ("block_hash", HASH_SIZE),
+            ("transaction_hash", HASH_SIZE),
+            ("topic0", HASH_SIZE),
+            ("topic1", HASH_SIZE),
+            ("topic2", HASH_SIZE),
+            ("topic3", HASH_SIZE),
+            ("address", ADDRESS_SIZE),
+        ],
+    ),
+    (
+        "traces",
+        &[
+            ("block_hash", HASH_SIZE),
+            ("transaction_hash", HASH_SIZE),
+            ("from", ADDRESS_SIZE),
+            ("to", ADDRESS_SIZE),
+            ("address", ADDRESS_SIZE),
+            ("author", ADDRESS_SIZE),
+            ("refund_address", ADDRESS_SIZE),
+            ("action_address", ADDRESS_SIZE),
+        ],
+    ),
+];
+
+/// Columns of each table that hold few distinct values.
+const DICTIONARY_COLUMNS: &[(&str, &[&str])] = &[
+    ("transactions", &["block_hash"]),
+    ("logs", &["block_hash", "address", "topic0"]),
+    ("traces", &["block_hash"]),
+];
+
+/// How the hash and address columns of arrow responses are laid out.
+#[derive(Clone, Copy, Debug, Default, PartialEq, Eq)]
+pub struct ColumnLayout {
+    /// Emit hashes and addresses as `FixedSizeBinary(32)` and `FixedSizeBinary(20)`, whether
+    /// the inner client returned them as binaries or hex strings.
+    pub fixed_size_binary: bool,
+    /// Dictionary encode the log address and topic0 columns and the block_hash columns, with
+    /// `Int32` keys.
+    pub dictionary: bool,
+}
+
+impl ColumnLayout {
+    /// Lay out the columns of `response` that this layout applies to.
+    pub fn apply_response(
+        &self,
+        mut response: hypersync_client::ArrowResponse,
+    ) -> Result<hypersync_client::ArrowResponse> {
+        if *self == Self::default() {
+            return Ok(response);
+        }
+
+        let data = &mut response.data;
+        for (table, batches) in [
+            ("blocks", &mut data.blocks),
+            ("transactions", &mut data.transactions),
+            ("logs", &mut data.logs),
+            ("traces", &mut data.traces),
+        ] {
+            *batches = self
+                .apply(table, std::mem::take(batches))
+                .with_context(|| format!("lay out {table}"))?;
+        }
+
+        Ok(response)
+    }
+
+    /// Lay out the columns of `batches` of `table`, columns of other tables are kept as is.
+    pub fn apply(&self, table: &str, batches: Vec<RecordBatch>) -> Result<Vec<RecordBatch>> {
+        let fixed_size: &[(&str, i32)] = if self.fixed_size_binary {
+            columns_of(FIXED_SIZE_COLUMNS, table)
+        } else {
+            &[]
+        };
+        let dictionary: &[&str] = if self.dictionary {
+            columns_of(DICTIONARY_COLUMNS, table)
+        } else {
+            &[]
+        };
+        if fixed_size.is_empty() && dictionary.is_empty() {
+            return Ok(batches);
+        }
+
+        batches
+            .into_iter()
+            .map(|batch| {
+                let schema = batch.schema();
+                let mut fields = Vec::with_capacity(schema.fields().len());
+                let mut columns = Vec::with_capacity(schema.fields().len());
+
+                for (field, column) in schema.fields().iter().zip(batch.columns()) {
+                    let name = field.name().as_str();
+                    let mut column = Arc::clone(column);
+                    if let Some((_, size)) = fixed_size.iter().find(|(n, _)| *n == name) {
+                        column = to_fixed_size_binary(&column, *size)
+                            .with_context(|| format!("convert {name}"))?;
+                    }
+                    if dictionary.contains(&name) {
+                        let data_type = DataType::Dictionary(
+                            Box::new(DataType::Int32),
+                            Box::new(column.data_type().clone()),
+                        );
+                        column = cast(&column, &data_type)
+                            .with_context(|| format!("dictionary encode {name}"))?;
+                    }
+
+                    if column.data_type() == field.data_type() {
+                        fields.push(Arc::clone(field));
+                    } else {
+                        // Values of the wrong size become null, so converted columns are
+                        // always nullable.
+                        fields.push(Arc::new(
+                            field
+                                .as_ref()
+                                .clone()
+                                .with_data_type(column.data_type().clone())
+                                .with_nullable(true),
+                        ));
+                    }
+                    columns.push(column);
+                }
+
+                let schema = Schema::new_with_metadata(fields, schema.metadata().clone());
+                RecordBatch::try_new(Arc::new(schema), columns).context("build record batch")
+            })
+            .collect()
+    }
+}
+
+fn columns_of<T>(columns: &'static [(&str, &'static [T])], table: &str) -> &'static [T] {
+    columns
+        .iter()
+        .find(|(t, _)| *t == table)
+        .map(|(_, columns)| *columns)
+        .unwrap_or_default()
+}
+
+/// Copy a binary or hex column into a `FixedSizeBinary(size)` column, values of another size
+/// are null.
+fn to_fixed_size_binary(column: &ArrayRef, size: i32) -> Result<ArrayRef> {
+    if column.data_type() == &DataType::FixedSizeBinary(size) {
+        return Ok(Arc::clone(column));
+    }
+
+    let values = BinaryColumn::new(column)?;
+    let mut builder = FixedSizeBinaryBuilder::with_capacity(column.len(), size);
+    for row in 0..column.len() {
+        match values.value(row) {
+            Some(value) if value.len() == size as usize => builder.append_value(value)?,
+            _ => builder.append_null(),
+        }
+    }
+
+    Ok(Arc::new(builder.finish()))
+}
+
+#[cfg(test)]
+mod tests {
+    use arrow::{
+        array::{Array, AsArray, StringArray, UInt64Array},
+        datatypes::{Field, Int32Type},
+    };
+
+    use super::*;
+
+    #[test]
+    fn test_apply_layout() {
+        let address = format!("0x{}", "ab".repeat(20));
+        let schema = Arc::new(Schema::new(vec![
+            Field::new("block_number", DataType::UInt64, true),
+            Field::new("address", DataType::Utf8, true),
+        ]));
+        let batch = RecordBatch::try_new(
+            schema,
+            vec![
+                Arc::new(UInt64Array::from(vec![1, 1, 2])),
+                Arc::new(StringArray::from(vec![
+                    Some(address.as_str()),
+                    Some(address.as_str()),
+                    None,
+                ])),
+            ],
+        )
+        .unwrap();
+
+        let layout = ColumnLayout {
+            fixed_size_binary: true,
+            dictionary: true,
+        };
+        let batches = layout.apply("logs", vec![batch.clone()]).unwrap();
+        let address = batches[0].column(1);
+        assert_eq!(
+            address.data_type(),
+            &DataType::Dictionary(
+                Box::new(DataType::Int32),
+                Box::new(DataType::FixedSizeBinary(ADDRESS_SIZE))
+            )
+        );
+        let address = address.as_dictionary::<Int32Type>();
+        assert_eq!(address.values().len(), 1);
+        assert_eq!(address.null_count(), 1);
+        assert_eq!(batches[0].column(0).data_type(), &DataType::UInt64);
+
+        // Tables without hash or address columns are not touched.
+        let batches = layout.apply("decoded_logs", vec![batch.clone()]).unwrap();
+        assert_eq!(batches[0].schema(), batch.schema());
+    }
+}
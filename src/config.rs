@@ -1,9 +1,23 @@
 use std::collections::HashMap;
+use std::sync::Arc;
+use std::time::Duration;
 
-use anyhow::{Context, Result};
+use anyhow::{anyhow, Context, Result};
 use pyo3::prelude::*;
 use serde::{Deserialize, Serialize};
 
+use crate::{
+    arrow_ffi::TableFormat,
+    checkpoint::{CheckpointConfig, CheckpointStore},
+    column_layout::ColumnLayout,
+    decode_arrow::{BigIntFormat, ColumnOptions, EventTables},
+    parquet_sink::ParquetConfig,
+    response::ConvertOptions,
+    rows::RowFormat,
+    stream::{StreamOptions, DEFAULT_PREFETCH},
+    tail::TailOptions,
+};
+
 #[derive(Default, Clone, Serialize, Deserialize, FromPyObject)]
 pub struct StreamConfig {
     #[serde(skip_serializing_if = "Option::is_none")]
@@ -34,6 +48,67 @@ pub struct StreamConfig {
     pub response_bytes_floor: Option<i64>,
     #[serde(skip_serializing_if = "Option::is_none")]
     pub reverse: Option<bool>,
+    /// Number of converted responses buffered ahead of the consumer. Handled by this crate,
+    /// not forwarded to the inner client.
+    #[serde(skip)]
+    pub prefetch: Option<i64>,
+    /// Maximum bytes of responses buffered ahead of the consumer. Handled by this crate,
+    /// not forwarded to the inner client.
+    #[serde(skip)]
+    pub memory_budget_bytes: Option<i64>,
+    /// Store to record acknowledged progress in and resume from. Handled by this crate,
+    /// not forwarded to the inner client.
+    #[serde(skip)]
+    pub checkpoint: Option<CheckpointConfig>,
+    /// Number of independent streams collect_arrow and collect_parquet split the block range
+    /// into. Handled by this crate, not forwarded to the inner client.
+    #[serde(skip)]
+    pub shard_count: Option<i64>,
+    /// Keep streaming new blocks after reaching the height of the server. Handled by this crate,
+    /// not forwarded to the inner client.
+    #[serde(skip)]
+    pub tail: Option<bool>,
+    /// Delay before polling for a new height in tail mode. Handled by this crate, not forwarded
+    /// to the inner client.
+    #[serde(skip)]
+    pub tail_poll_interval_millis: Option<i64>,
+    /// Cap of the exponential backoff between height polls in tail mode. Handled by this crate,
+    /// not forwarded to the inner client.
+    #[serde(skip)]
+    pub tail_max_poll_interval_millis: Option<i64>,
+    /// Number of recent block hashes kept to detect reorgs in tail mode, 0 disables reorg
+    /// detection. Handled by this crate, not forwarded to the inner client.
+    #[serde(skip)]
+    pub reorg_buffer_size: Option<i64>,
+    /// Write collect_parquet output incrementally with these options. Handled by this crate,
+    /// not forwarded to the inner client.
+    #[serde(skip)]
+    pub parquet: Option<ParquetConfig>,
+    /// Decode the logs of arrow responses into one table per event of these signatures. Handled
+    /// by this crate, not forwarded to the inner client.
+    #[serde(skip)]
+    pub event_signatures: Option<Vec<String>>,
+    /// Arrow type of integers wider than 64 bits in the tables of event_signatures. Handled by
+    /// this crate, not forwarded to the inner client.
+    #[serde(skip)]
+    pub big_int_output: Option<String>,
+    /// Decimals that decimal256 and float64 big int output is scaled by. Handled by this
+    /// crate, not forwarded to the inner client.
+    #[serde(skip)]
+    pub big_int_decimals: Option<i64>,
+    /// "pyarrow" or "capsule", python type of the tables of arrow responses. Handled by this
+    /// crate, not forwarded to the inner client.
+    #[serde(skip)]
+    pub arrow_output: Option<String>,
+    /// Emit hashes and addresses of arrow responses as FixedSizeBinary(32) and
+    /// FixedSizeBinary(20), also if hex_output is set. Handled by this crate, not forwarded to
+    /// the inner client.
+    #[serde(skip)]
+    pub fixed_size_binary: Option<bool>,
+    /// Dictionary encode the log address and topic0 columns and the block_hash columns of arrow
+    /// responses. Handled by this crate, not forwarded to the inner client.
+    #[serde(skip)]
+    pub dictionary_encode: Option<bool>,
 }
 
 #[derive(Default, Clone, Serialize, Deserialize, FromPyObject)]
@@ -55,6 +130,126 @@ impl StreamConfig {
         let json = serde_json::to_vec(self).context("serialize to json")?;
         serde_json::from_slice(&json).context("parse json")
     }
+
+    /// Options that are handled by this crate instead of the inner client.
+    pub fn stream_options(&self) -> Result<StreamOptions> {
+        let prefetch = self
+            .prefetch
+            .map(usize::try_from)
+            .transpose()
+            .context("convert prefetch")?;
+        let memory_budget_bytes = self
+            .memory_budget_bytes
+            .map(usize::try_from)
+            .transpose()
+            .context("convert memory_budget_bytes")?;
+
+        if self.checkpoint.is_some() && self.reverse == Some(true) {
+            return Err(anyhow!("checkpoints are not supported for reverse streams"));
+        }
+        let shard_count = self
+            .shard_count
+            .map(usize::try_from)
+            .transpose()
+            .context("convert shard_count")?
+            .filter(|&n| n > 1);
+        if shard_count.is_some() && self.reverse == Some(true) {
+            return Err(anyhow!("sharding is not supported for reverse streams"));
+        }
+        let tail = if self.tail == Some(true) {
+            if self.reverse == Some(true) {
+                return Err(anyhow!("tail is not supported for reverse streams"));
+            }
+            let defaults = TailOptions::default();
+            let poll_interval = self
+                .tail_poll_interval_millis
+                .map(u64::try_from)
+                .transpose()
+                .context("convert tail_poll_interval_millis")?
+                .map_or(defaults.poll_interval, Duration::from_millis);
+            let max_poll_interval = self
+                .tail_max_poll_interval_millis
+                .map(u64::try_from)
+                .transpose()
+                .context("convert tail_max_poll_interval_millis")?
+                .map_or(defaults.max_poll_interval, Duration::from_millis);
+            let reorg_buffer_size = self
+                .reorg_buffer_size
+                .map(usize::try_from)
+                .transpose()
+                .context("convert reorg_buffer_size")?
+                .unwrap_or(defaults.reorg_buffer_size);
+            Some(TailOptions {
+                poll_interval,
+                max_poll_interval,
+                reorg_buffer_size,
+            })
+        } else {
+            None
+        };
+        let parquet = self
+            .parquet
+            .as_ref()
+            .map(ParquetConfig::try_convert)
+            .transpose()
+            .context("parse parquet config")?;
+        if parquet.is_some() && self.reverse == Some(true) {
+            return Err(anyhow!(
+                "parquet options are not supported for reverse streams"
+            ));
+        }
+        let checkpoint = self
+            .checkpoint
+            .as_ref()
+            .map(CheckpointStore::open)
+            .transpose()
+            .context("open checkpoint store")?
+            .map(Arc::new);
+        let big_ints = match &self.big_int_output {
+            Some(output) => BigIntFormat::parse(output, self.big_int_decimals)
+                .context("parse big_int_output")?,
+            None => BigIntFormat::default(),
+        };
+        let event_tables = self
+            .event_signatures
+            .as_deref()
+            .filter(|signatures| !signatures.is_empty())
+            .map(|signatures| {
+                EventTables::from_signatures(
+                    signatures,
+                    ColumnOptions {
+                        checksummed_addresses: false,
+                        big_ints,
+                    },
+                )
+            })
+            .transpose()
+            .context("parse event_signatures")?
+            .map(Arc::new);
+        let table_format = self
+            .arrow_output
+            .as_deref()
+            .map(TableFormat::parse)
+            .transpose()
+            .context("parse arrow_output")?
+            .unwrap_or_default();
+
+        Ok(StreamOptions {
+            prefetch: prefetch.unwrap_or(DEFAULT_PREFETCH),
+            memory_budget_bytes,
+            checkpoint,
+            shard_count,
+            tail,
+            parquet,
+            event_tables,
+            table_format,
+            column_layout: ColumnLayout {
+                fixed_size_binary: self.fixed_size_binary.unwrap_or(false),
+                dictionary: self.dictionary_encode.unwrap_or(false),
+            },
+            ..Default::default()
+        })
+    }
 }
 
 #[derive(Default, Clone, Serialize, Deserialize, FromPyObject)]
@@ -78,6 +273,10 @@ pub struct ClientConfig {
     pub retry_ceiling_ms: Option<i64>,
     #[serde(skip_serializing_if = "Option::is_none")]
     pub proactive_rate_limit_sleep: Option<bool>,
+    /// Representation of the rows of query responses, see `RowFormat`. Handled by this crate,
+    /// not forwarded to the inner client.
+    #[serde(skip)]
+    pub row_format: Option<String>,
 }
 
 impl ClientConfig {
@@ -90,4 +289,20 @@ impl ClientConfig {
         let json = serde_json::to_vec(&config).context("serialize to json")?;
         serde_json::from_slice(&json).context("parse json")
     }
+
+    /// Options for converting responses that are handled by this crate.
+    pub fn convert_options(&self) -> Result<ConvertOptions> {
+        let row_format = self
+            .row_format
+            .as_deref()
+            .map(RowFormat::parse)
+            .transpose()
+            .context("parse row_format")?
+            .unwrap_or_default();
+
+        Ok(ConvertOptions {
+            row_format,
+            ..Default::default()
+        })
+    }
 }
@@ -1,32 +1,74 @@
 use std::sync::Arc;
 
-use anyhow::{Context, Result};
+use alloy_dyn_abi::{DecodedEvent as RawDecodedEvent, DynSolValue};
+use alloy_primitives::B256;
+use anyhow::{anyhow, Context, Result};
+use arrow::array::RecordBatch;
 use hypersync_client::format::{Data, Hex, LogArgument};
 use pyo3::{
-    exceptions::PyValueError, pyclass, pyfunction, pymethods, Bound, PyAny, PyResult, Python,
+    exceptions::PyValueError, pyclass, pyfunction, pymethods, Bound, IntoPyObjectExt, Py, PyAny,
+    PyResult, Python,
 };
 use pyo3_async_runtimes::tokio::future_into_py;
+use rayon::prelude::*;
 
-use crate::types::{DecodedEvent, DecodedSolValue, Event, Log};
+use crate::{
+    arrow_ffi::{batches_to_pyarrow, pyarrow_to_batches},
+    decode_arrow::{BigIntFormat, ColumnOptions, EventTables},
+    types::{plain_params, DecodedEvent, DecodedSolValue, Event, Log, ValueFormat},
+};
+
+/// Smallest number of logs handed to a single worker, splitting further costs more than it saves.
+pub const MIN_LOGS_PER_TASK: usize = 64;
 
+/// Decodes logs in two phases. Hex parsing and ABI decoding run in parallel on a thread pool
+/// without holding the GIL, only building the python values of the decoded events needs it.
 #[pyclass]
 #[derive(Clone)]
 pub struct Decoder {
     inner: Arc<hypersync_client::Decoder>,
     checksummed_addresses: bool,
+    format: ValueFormat,
+    /// Arrow output of integers wider than 64 bits in `decode_arrow`.
+    big_ints: BigIntFormat,
+    /// Decoders of the events by topic0, used for arrow tables and plain values.
+    events: Arc<EventTables>,
+    /// Pool used for the GIL-free phase, the global rayon pool is used if not set.
+    pool: Option<Arc<rayon::ThreadPool>>,
 }
 
 #[pymethods]
 impl Decoder {
     #[new]
-    pub fn from_signatures(signatures: Vec<String>) -> PyResult<Self> {
+    #[pyo3(signature = (signatures, num_threads=None))]
+    pub fn from_signatures(signatures: Vec<String>, num_threads: Option<usize>) -> PyResult<Self> {
         let inner = hypersync_client::Decoder::from_signatures(&signatures)
             .context("build inner decoder")
             .map_err(|e| PyValueError::new_err(format!("{:?}", e)))?;
 
+        let events = EventTables::from_signatures(&signatures, ColumnOptions::default())
+            .context("build event decoders")
+            .map_err(|e| PyValueError::new_err(format!("{:?}", e)))?;
+
+        let pool = num_threads
+            .map(|n| {
+                rayon::ThreadPoolBuilder::new()
+                    .num_threads(n)
+                    .thread_name(|i| format!("hypersync-decode-{i}"))
+                    .build()
+                    .context("build decoder thread pool")
+                    .map_err(|e| PyValueError::new_err(format!("{:?}", e)))
+            })
+            .transpose()?
+            .map(Arc::new);
+
         Ok(Self {
             inner: Arc::new(inner),
             checksummed_addresses: false,
+            format: ValueFormat::Wrapped,
+            big_ints: BigIntFormat::default(),
+            events: Arc::new(events),
+            pool,
         })
     }
 
@@ -38,22 +80,43 @@ impl Decoder {
         self.checksummed_addresses = false;
     }
 
+    /// Return the parameters of decoded events as plain python values instead of
+    /// `DecodedEvent`s. A dict keyed by parameter name if `named` is set, a tuple in signature
+    /// order otherwise.
+    #[pyo3(signature = (named=false))]
+    pub fn enable_plain_values(&mut self, named: bool) {
+        self.format = ValueFormat::plain(named);
+    }
+
+    pub fn disable_plain_values(&mut self) {
+        self.format = ValueFormat::Wrapped;
+    }
+
+    /// Set how `decode_arrow` outputs integers wider than 64 bits, one of "binary",
+    /// "decimal256", "float64" or "limbs". `decimals` scales decimal256 and float64 values.
+    #[pyo3(signature = (output, decimals=None))]
+    pub fn set_big_int_output(&mut self, output: &str, decimals: Option<i64>) -> PyResult<()> {
+        self.big_ints = BigIntFormat::parse(output, decimals)
+            .map_err(|e| PyValueError::new_err(format!("{:?}", e)))?;
+        Ok(())
+    }
+
     pub fn decode_logs<'py>(&self, logs: Vec<Log>, py: Python<'py>) -> PyResult<Bound<'py, PyAny>> {
         let decoder = self.clone();
 
         future_into_py(py, async move {
-            Ok(tokio::task::spawn_blocking(move || {
-                Python::attach(|py| decoder.decode_logs_sync(logs, py))
+            tokio::task::spawn_blocking(move || {
+                let decoded = decoder.decode_raw(&logs.iter().collect::<Vec<_>>());
+                Python::attach(|py| decoder.to_python(py, decoded))
             })
             .await
-            .unwrap())
+            .unwrap()
         })
     }
 
-    pub fn decode_logs_sync(&self, logs: Vec<Log>, py: Python) -> Vec<Option<DecodedEvent>> {
-        logs.iter()
-            .map(|log| self.decode_impl(log, py).ok().flatten())
-            .collect::<Vec<_>>()
+    pub fn decode_logs_sync(&self, logs: Vec<Log>, py: Python) -> PyResult<Vec<Option<Py<PyAny>>>> {
+        let decoded = py.detach(|| self.decode_raw(&logs.iter().collect::<Vec<_>>()));
+        self.to_python(py, decoded)
     }
 
     pub fn decode_events<'py>(
@@ -64,34 +127,187 @@ impl Decoder {
         let decoder = self.clone();
 
         future_into_py(py, async move {
-            Ok(tokio::task::spawn_blocking(move || {
-                Python::attach(|py| decoder.decode_events_sync(events, py))
+            tokio::task::spawn_blocking(move || {
+                let decoded =
+                    decoder.decode_raw(&events.iter().map(|e| &e.log).collect::<Vec<_>>());
+                Python::attach(|py| decoder.to_python(py, decoded))
             })
             .await
-            .unwrap())
+            .unwrap()
         })
     }
 
-    pub fn decode_events_sync(&self, events: Vec<Event>, py: Python) -> Vec<Option<DecodedEvent>> {
-        events
-            .iter()
-            .map(|event| self.decode_impl(&event.log, py).ok().flatten())
-            .collect::<Vec<_>>()
+    pub fn decode_events_sync(
+        &self,
+        events: Vec<Event>,
+        py: Python,
+    ) -> PyResult<Vec<Option<Py<PyAny>>>> {
+        let decoded =
+            py.detach(|| self.decode_raw(&events.iter().map(|e| &e.log).collect::<Vec<_>>()));
+        self.to_python(py, decoded)
     }
+
+    /// Decode a pyarrow Table or RecordBatch of raw logs into a table with a column per event
+    /// parameter, see `decode_arrow_sync`.
+    #[pyo3(signature = (table, event=None))]
+    pub fn decode_arrow<'py>(
+        &self,
+        table: &Bound<'py, PyAny>,
+        event: Option<String>,
+        py: Python<'py>,
+    ) -> PyResult<Bound<'py, PyAny>> {
+        let batches = pyarrow_to_batches(table)?;
+        let decoder = self.clone();
+
+        future_into_py(py, async move {
+            let decoded = tokio::task::spawn_blocking(move || {
+                decoder.decode_batches(&batches, event.as_deref())
+            })
+            .await
+            .unwrap()?;
+            Ok(Python::attach(|py| batches_to_pyarrow(py, decoded))?)
+        })
+    }
+
+    /// Decode a pyarrow Table or RecordBatch of raw logs into a table with a column per event
+    /// parameter.
+    ///
+    /// The table needs the binary `topic0`..`topic3` and `data` columns. `event` picks the
+    /// event by name if the decoder was built from several signatures. Rows of other events
+    /// are null.
+    #[pyo3(signature = (table, event=None))]
+    pub fn decode_arrow_sync(
+        &self,
+        table: &Bound<'_, PyAny>,
+        event: Option<String>,
+        py: Python,
+    ) -> Result<Py<PyAny>> {
+        let batches = pyarrow_to_batches(table)?;
+        let decoded = py.detach(|| self.decode_batches(&batches, event.as_deref()))?;
+        batches_to_pyarrow(py, decoded)
+    }
+}
+
+/// Logs decoded in the GIL-free phase, in the shape the output format needs.
+enum RawDecoded {
+    Events(Vec<Option<RawDecodedEvent>>),
+    /// Index of the event in `Decoder::events` and its parameters in signature order.
+    Params(Vec<Option<(usize, Vec<DynSolValue>)>>),
 }
 
 impl Decoder {
-    fn decode_impl(&self, log: &Log, py: Python) -> Result<Option<DecodedEvent>> {
-        let topics = log
-            .topics
-            .iter()
-            .map(|v| {
-                v.as_ref()
-                    .map(|v| LogArgument::decode_hex(v).context("decode topic"))
-                    .transpose()
-            })
-            .collect::<Result<Vec<_>>>()
-            .context("decode topics")?;
+    /// Decode `logs` on the thread pool, logs that fail to decode are returned as `None`.
+    ///
+    /// Doesn't touch python objects so it should be called without holding the GIL.
+    fn decode_raw(&self, logs: &[&Log]) -> RawDecoded {
+        self.install(|| match self.format {
+            ValueFormat::Wrapped => RawDecoded::Events(
+                logs.par_iter()
+                    .with_min_len(MIN_LOGS_PER_TASK)
+                    .map(|log| self.decode_impl(log).ok().flatten())
+                    .collect(),
+            ),
+            ValueFormat::Tuple | ValueFormat::Dict => RawDecoded::Params(
+                logs.par_iter()
+                    .with_min_len(MIN_LOGS_PER_TASK)
+                    .map(|log| self.decode_params(log).ok().flatten())
+                    .collect(),
+            ),
+        })
+    }
+
+    /// Decode arrow batches of raw logs with the columnar decoder of `event`.
+    ///
+    /// Always returns at least one batch so the schema survives empty input.
+    fn decode_batches(
+        &self,
+        batches: &[RecordBatch],
+        event: Option<&str>,
+    ) -> Result<Vec<RecordBatch>> {
+        let columns = match event {
+            Some(name) => self
+                .events
+                .get(name)
+                .with_context(|| format!("decoder has no event named {name}"))?,
+            None if self.events.len() == 1 => self.events.event(0),
+            None => {
+                return Err(anyhow!(
+                    "decoder has several events, pick one with the event argument"
+                ))
+            }
+        };
+
+        let options = ColumnOptions {
+            checksummed_addresses: self.checksummed_addresses,
+            big_ints: self.big_ints,
+        };
+        let mut decoded = self.install(|| {
+            batches
+                .iter()
+                .map(|batch| columns.decode_batch(batch, &options))
+                .collect::<Result<Vec<_>>>()
+        })?;
+        if decoded.is_empty() {
+            decoded.push(RecordBatch::new_empty(columns.schema(&options)));
+        }
+
+        Ok(decoded)
+    }
+
+    /// Run `f` on the pool of the decoder.
+    fn install<R: Send>(&self, f: impl FnOnce() -> R + Send) -> R {
+        match &self.pool {
+            Some(pool) => pool.install(f),
+            None => f(),
+        }
+    }
+
+    /// Build the python values of the events decoded by `decode_raw`.
+    fn to_python(&self, py: Python, decoded: RawDecoded) -> PyResult<Vec<Option<Py<PyAny>>>> {
+        match decoded {
+            RawDecoded::Events(events) => events
+                .into_iter()
+                .map(|decoded| {
+                    decoded
+                        .map(|decoded| {
+                            DecodedEvent {
+                                indexed: decoded
+                                    .indexed
+                                    .into_iter()
+                                    .map(|v| {
+                                        DecodedSolValue::new(py, v, self.checksummed_addresses)
+                                    })
+                                    .collect(),
+                                body: decoded
+                                    .body
+                                    .into_iter()
+                                    .map(|v| {
+                                        DecodedSolValue::new(py, v, self.checksummed_addresses)
+                                    })
+                                    .collect(),
+                            }
+                            .into_py_any(py)
+                        })
+                        .transpose()
+                })
+                .collect(),
+            RawDecoded::Params(params) => params
+                .into_iter()
+                .map(|decoded| {
+                    decoded
+                        .map(|(event, values)| {
+                            let names = (self.format == ValueFormat::Dict)
+                                .then(|| self.events.event(event).param_names());
+                            plain_params(py, values, names, self.checksummed_addresses)
+                        })
+                        .transpose()
+                })
+                .collect(),
+        }
+    }
+
+    fn decode_impl(&self, log: &Log) -> Result<Option<RawDecodedEvent>> {
+        let (topics, data) = parse_log(log)?;
 
         let topic0 = topics
             .first()
@@ -99,36 +315,141 @@ impl Decoder {
             .as_ref()
             .context("topic0 is null")?;
 
-        let data = log.data.as_ref().context("get log.data")?;
-        let data = Data::decode_hex(data).context("decode data")?;
-
-        let decoded = match self
-            .inner
+        self.inner
             .decode(topic0.as_slice(), &topics, &data)
-            .context("decode log")?
-        {
-            Some(v) => v,
-            None => return Ok(None),
-        };
+            .context("decode log")
+    }
 
-        Ok(Some(DecodedEvent {
-            indexed: decoded
-                .indexed
-                .into_iter()
-                .map(|v| DecodedSolValue::new(py, v, self.checksummed_addresses))
-                .collect(),
-            body: decoded
-                .body
-                .into_iter()
-                .map(|v| DecodedSolValue::new(py, v, self.checksummed_addresses))
-                .collect(),
-        }))
+    /// Decode a log into the index of its event and its parameters in signature order.
+    fn decode_params(&self, log: &Log) -> Result<Option<(usize, Vec<DynSolValue>)>> {
+        let (topics, data) = parse_log(log)?;
+
+        let topics = topics
+            .iter()
+            .map_while(Option::as_ref)
+            .map(|topic| B256::try_from(topic.as_slice()))
+            .collect::<Result<Vec<_>, _>>()
+            .context("convert topics")?;
+
+        Ok(self.events.decode_log(&topics, &data))
     }
 }
 
+/// Parse the hex encoded topics and data of a log.
+fn parse_log(log: &Log) -> Result<(Vec<Option<LogArgument>>, Data)> {
+    let topics = log
+        .topics
+        .iter()
+        .map(|v| {
+            v.as_ref()
+                .map(|v| LogArgument::decode_hex(v).context("decode topic"))
+                .transpose()
+        })
+        .collect::<Result<Vec<_>>>()
+        .context("decode topics")?;
+
+    let data = log.data.as_ref().context("get log.data")?;
+    let data = Data::decode_hex(data).context("decode data")?;
+
+    Ok((topics, data))
+}
+
 #[pyfunction]
 pub fn signature_to_topic0(sig: &str) -> Result<String> {
     let event = alloy_json_abi::Event::parse(sig).context("parse event signature")?;
     let topic0 = hypersync_client::format::Hash::try_from(event.selector().as_slice()).unwrap();
     Ok(topic0.encode_hex())
 }
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    const SIGNATURES: [&str; 2] = [
+        "Transfer(address indexed from, address indexed to, uint256 value)",
+        "Approval(address indexed owner, address indexed spender, uint256 value)",
+    ];
+
+    fn word(v: u64) -> String {
+        format!("0x{v:064x}")
+    }
+
+    /// Valid transfers mixed with logs of unknown events, bad hex, short data and no topics.
+    fn mixed_logs(n: usize) -> Vec<Log> {
+        let transfer = signature_to_topic0(SIGNATURES[0]).unwrap();
+
+        (0..n as u64)
+            .map(|i| {
+                let indexed = |topic0: String| vec![Some(topic0), Some(word(i)), Some(word(i + 1))];
+                let (topics, data) = match i % 5 {
+                    0 => (indexed(transfer.clone()), word(i)),
+                    1 => (indexed(word(0x11)), word(i)),
+                    2 => (indexed(transfer.clone()), "0xzz".to_owned()),
+                    3 => (indexed(transfer.clone()), "0x01".to_owned()),
+                    _ => (Vec::new(), word(i)),
+                };
+
+                Log {
+                    removed: Some(false),
+                    log_index: Some(i as i64),
+                    transaction_index: None,
+                    transaction_hash: None,
+                    block_hash: None,
+                    block_number: Some(1),
+                    address: None,
+                    data: Some(data),
+                    topics,
+                }
+            })
+            .collect()
+    }
+
+    #[test]
+    fn test_decode_raw_matches_sequential() {
+        let signatures = SIGNATURES.map(String::from).to_vec();
+        let sizes = [
+            0,
+            1,
+            MIN_LOGS_PER_TASK - 1,
+            MIN_LOGS_PER_TASK,
+            MIN_LOGS_PER_TASK + 1,
+            10 * MIN_LOGS_PER_TASK + 3,
+        ];
+
+        for format in [ValueFormat::Wrapped, ValueFormat::Tuple] {
+            let mut decoder = Decoder::from_signatures(signatures.clone(), Some(4)).unwrap();
+            decoder.format = format;
+
+            for n in sizes {
+                let logs = mixed_logs(n);
+                let logs = logs.iter().collect::<Vec<_>>();
+                let num_valid = n.div_ceil(5);
+
+                match decoder.decode_raw(&logs) {
+                    RawDecoded::Events(events) => {
+                        let sequential = logs
+                            .iter()
+                            .map(|log| decoder.decode_impl(log).ok().flatten())
+                            .collect::<Vec<_>>();
+                        let parts = |events: &[Option<RawDecodedEvent>]| {
+                            events
+                                .iter()
+                                .map(|e| e.as_ref().map(|e| (e.indexed.clone(), e.body.clone())))
+                                .collect::<Vec<_>>()
+                        };
+                        assert_eq!(parts(&events), parts(&sequential), "{n} logs");
+                        assert_eq!(events.iter().flatten().count(), num_valid, "{n} logs");
+                    }
+                    RawDecoded::Params(params) => {
+                        let sequential = logs
+                            .iter()
+                            .map(|log| decoder.decode_params(log).ok().flatten())
+                            .collect::<Vec<_>>();
+                        assert_eq!(params, sequential, "{n} logs");
+                        assert_eq!(params.iter().flatten().count(), num_valid, "{n} logs");
+                    }
+                }
+            }
+        }
+    }
+}
@@ -0,0 +1,839 @@
+//! Columnar decoding of raw log tables.
+//!
+//! Topics and data are read straight from the binary columns of an arrow table and every
+//! parameter of the event becomes a typed column, so decoding doesn't create python objects or
+//! go through hex strings.
+
+use std::borrow::Cow;
+use std::collections::HashMap;
+use std::sync::Arc;
+
+use alloy_dyn_abi::{DecodedEvent, DynSolEvent, DynSolType, DynSolValue, Specifier};
+use alloy_primitives::{B256, U256};
+use anyhow::{anyhow, Context, Result};
+use arrow::{
+    array::{
+        Array, ArrayRef, AsArray, BinaryArray, BooleanArray, Decimal256Array, FixedSizeBinaryArray,
+        FixedSizeListArray, Float64Array, Int64Array, LargeBinaryArray, ListArray, RecordBatch,
+        RecordBatchOptions, StringArray, StructArray, UInt32Array, UInt64Array,
+    },
+    buffer::{NullBuffer, OffsetBuffer},
+    compute::take,
+    datatypes::{
+        i256, DataType, Decimal256Type, DecimalType, Field, FieldRef, Fields, Schema, SchemaRef,
+        DECIMAL256_MAX_PRECISION,
+    },
+};
+use rayon::prelude::*;
+
+use crate::{decode::MIN_LOGS_PER_TASK, types::encode_prefix_hex};
+
+const TOPIC_COLUMNS: [&str; 4] = ["topic0", "topic1", "topic2", "topic3"];
+/// Columns of the logs table that identify a log, copied into the tables of `EventTables`.
+const LOG_ID_COLUMNS: [&str; 5] = [
+    "block_number",
+    "transaction_index",
+    "log_index",
+    "transaction_hash",
+    "address",
+];
+
+/// Decodes logs of a single event into one column per event parameter.
+#[derive(Debug)]
+pub struct EventColumns {
+    name: String,
+    /// Selector of the event, `None` for anonymous events.
+    topic0: Option<B256>,
+    event: DynSolEvent,
+    /// Column name, type and whether the parameter is indexed, in signature order.
+    params: Vec<(String, DynSolType, bool)>,
+}
+
+impl EventColumns {
+    pub fn from_signature(sig: &str) -> Result<Self> {
+        let event = alloy_json_abi::Event::parse(sig).context("parse event signature")?;
+
+        let params = event
+            .inputs
+            .iter()
+            .enumerate()
+            .map(|(i, param)| {
+                let ty = param
+                    .resolve()
+                    .with_context(|| format!("resolve type of parameter {i}"))?;
+                // Topics of indexed reference types hold the hash of the value, not the value.
+                let ty = if param.indexed && !is_value_type(&ty) {
+                    DynSolType::FixedBytes(32)
+                } else {
+                    ty
+                };
+                let name = if param.name.is_empty() {
+                    format!("param{i}")
+                } else {
+                    param.name.clone()
+                };
+                Ok((name, ty, param.indexed))
+            })
+            .collect::<Result<Vec<_>>>()?;
+
+        Ok(Self {
+            name: event.name.clone(),
+            topic0: (!event.anonymous).then(|| event.selector()),
+            event: event.resolve().context("resolve event")?,
+            params,
+        })
+    }
+
+    pub fn name(&self) -> &str {
+        &self.name
+    }
+
+    pub fn schema(&self, options: &ColumnOptions) -> SchemaRef {
+        Arc::new(Schema::new(self.fields(options)))
+    }
+
+    fn fields(&self, options: &ColumnOptions) -> Vec<FieldRef> {
+        self.params
+            .iter()
+            .map(|(name, ty, _)| Arc::new(Field::new(name, data_type(ty, options), true)))
+            .collect()
+    }
+
+    /// Names of the parameters in signature order, `param{i}` for unnamed ones.
+    pub fn param_names(&self) -> impl Iterator<Item = &str> {
+        self.params.iter().map(|(name, _, _)| name.as_str())
+    }
+
+    /// Decode the logs in `batch`, which needs a `data` column and the `topic` columns of the
+    /// event. Rows that are not logs of this event or fail to decode are null.
+    ///
+    /// Rows are decoded in parallel on the current rayon pool.
+    pub fn decode_batch(
+        &self,
+        batch: &RecordBatch,
+        options: &ColumnOptions,
+    ) -> Result<RecordBatch> {
+        let logs = LogColumns::new(batch)?;
+
+        let rows = (0..batch.num_rows())
+            .into_par_iter()
+            .with_min_len(MIN_LOGS_PER_TASK)
+            .map(|row| {
+                let (topics, data) = logs.get(row)?;
+                self.decode_log(&topics, &data)
+            })
+            .collect::<Vec<_>>();
+        let rows = rows.iter().map(Option::as_deref).collect::<Vec<_>>();
+
+        RecordBatch::try_new_with_options(
+            self.schema(options),
+            self.build_columns(&rows, options)?,
+            &RecordBatchOptions::new().with_row_count(Some(rows.len())),
+        )
+        .context("build record batch")
+    }
+
+    /// Decoded parameters of a log, in signature order.
+    fn decode_log(&self, topics: &[B256], data: &[u8]) -> Option<Vec<DynSolValue>> {
+        let DecodedEvent { indexed, body, .. } = self
+            .event
+            .decode_log_parts(topics.iter().copied(), data)
+            .ok()?;
+
+        let (mut indexed, mut body) = (indexed.into_iter(), body.into_iter());
+        self.params
+            .iter()
+            .map(|(_, _, is_indexed)| {
+                if *is_indexed {
+                    indexed.next()
+                } else {
+                    body.next()
+                }
+            })
+            .collect()
+    }
+
+    /// Build a column per parameter from decoded rows, `None` rows become nulls.
+    fn build_columns(
+        &self,
+        rows: &[Option<&[DynSolValue]>],
+        options: &ColumnOptions,
+    ) -> Result<Vec<ArrayRef>> {
+        self.params
+            .iter()
+            .enumerate()
+            .map(|(i, (name, ty, _))| {
+                let values = rows
+                    .iter()
+                    .map(|row| row.map(|row| &row[i]))
+                    .collect::<Vec<_>>();
+                build_array(ty, &values, options).with_context(|| format!("build column {name}"))
+            })
+            .collect()
+    }
+}
+
+/// Decodes logs of several events in a single pass, into a table per event.
+#[derive(Debug)]
+pub struct EventTables {
+    /// Table name and decoder of each event.
+    events: Vec<(String, EventColumns)>,
+    /// Indices into `events` by topic0, events with different parameter indexing can share it.
+    by_topic0: HashMap<B256, Vec<usize>>,
+    /// Output options of `decode`.
+    options: ColumnOptions,
+}
+
+impl EventTables {
+    /// Build the decoders of `signatures`.
+    ///
+    /// Tables are named after their event, events that share a name are keyed by their
+    /// signature instead. Logs are told apart by topic0, so logs of anonymous events never
+    /// match.
+    pub fn from_signatures(signatures: &[String], options: ColumnOptions) -> Result<Self> {
+        let events = signatures
+            .iter()
+            .map(|sig| {
+                let columns = EventColumns::from_signature(sig)
+                    .with_context(|| format!("build decoder for {sig}"))?;
+                Ok((sig, columns))
+            })
+            .collect::<Result<Vec<_>>>()?;
+
+        let names = events
+            .iter()
+            .map(|(sig, columns)| {
+                let shared_name = events
+                    .iter()
+                    .filter(|(_, other)| other.name == columns.name)
+                    .count()
+                    > 1;
+                if shared_name {
+                    sig.to_string()
+                } else {
+                    columns.name.clone()
+                }
+            })
+            .collect::<Vec<_>>();
+        let events = names
+            .into_iter()
+            .zip(events.into_iter().map(|(_, columns)| columns))
+            .collect::<Vec<_>>();
+
+        let mut by_topic0 = HashMap::<B256, Vec<usize>>::new();
+        for (i, (_, columns)) in events.iter().enumerate() {
+            if let Some(topic0) = columns.topic0 {
+                by_topic0.entry(topic0).or_default().push(i);
+            }
+        }
+
+        Ok(Self {
+            events,
+            by_topic0,
+            options,
+        })
+    }
+
+    pub fn len(&self) -> usize {
+        self.events.len()
+    }
+
+    /// Decoder of the event at `index`, in signature order.
+    pub fn event(&self, index: usize) -> &EventColumns {
+        &self.events[index].1
+    }
+
+    /// Decoder of the event with the table or event name `name`.
+    pub fn get(&self, name: &str) -> Option<&EventColumns> {
+        self.events
+            .iter()
+            .find(|(key, columns)| key == name || columns.name == name)
+            .map(|(_, columns)| columns)
+    }
+
+    /// Index of the event of a log and its decoded parameters in signature order.
+    pub fn decode_log(&self, topics: &[B256], data: &[u8]) -> Option<(usize, Vec<DynSolValue>)> {
+        self.by_topic0
+            .get(topics.first()?)?
+            .iter()
+            .find_map(|&i| Some((i, self.events[i].1.decode_log(topics, data)?)))
+    }
+
+    /// Decode `batches` of raw logs into a list of batches per event.
+    ///
+    /// Every event table holds the matching logs only. Columns of `LOG_ID_COLUMNS` that are in
+    /// the logs table are copied in front of the parameters so rows can be joined back.
+    pub fn decode(&self, batches: &[RecordBatch]) -> Result<Vec<(String, Vec<RecordBatch>)>> {
+        let mut tables = self
+            .events
+            .iter()
+            .map(|(name, _)| (name.clone(), Vec::with_capacity(batches.len())))
+            .collect::<Vec<_>>();
+
+        for batch in batches {
+            for (table, decoded) in tables.iter_mut().zip(self.decode_batch(batch)?) {
+                table.1.push(decoded);
+            }
+        }
+
+        for ((_, batches), (_, columns)) in tables.iter_mut().zip(&self.events) {
+            if batches.is_empty() {
+                batches.push(RecordBatch::new_empty(columns.schema(&self.options)));
+            }
+        }
+
+        Ok(tables)
+    }
+
+    fn decode_batch(&self, batch: &RecordBatch) -> Result<Vec<RecordBatch>> {
+        let logs = LogColumns::new(batch)?;
+
+        let rows = (0..batch.num_rows())
+            .into_par_iter()
+            .with_min_len(MIN_LOGS_PER_TASK)
+            .map(|row| {
+                let (topics, data) = logs.get(row)?;
+                self.decode_log(&topics, &data)
+            })
+            .collect::<Vec<_>>();
+
+        let id_columns = LOG_ID_COLUMNS
+            .iter()
+            .filter_map(|name| Some((*name, batch.column_by_name(name)?)))
+            .collect::<Vec<_>>();
+
+        self.events
+            .iter()
+            .enumerate()
+            .map(|(event, (name, columns))| {
+                let (indices, values): (Vec<u32>, Vec<_>) = rows
+                    .iter()
+                    .enumerate()
+                    .filter_map(|(row, decoded)| match decoded {
+                        Some((i, values)) if *i == event => {
+                            Some((row as u32, Some(values.as_slice())))
+                        }
+                        _ => None,
+                    })
+                    .unzip();
+                let indices = UInt32Array::from(indices);
+
+                let mut fields: Vec<FieldRef> =
+                    Vec::with_capacity(id_columns.len() + columns.params.len());
+                let mut arrays = Vec::with_capacity(fields.capacity());
+                for (id_name, column) in &id_columns {
+                    fields.push(Arc::new(Field::new(
+                        *id_name,
+                        column.data_type().clone(),
+                        true,
+                    )));
+                    arrays.push(
+                        take(column.as_ref(), &indices, None)
+                            .with_context(|| format!("take {id_name}"))?,
+                    );
+                }
+                fields.extend(columns.fields(&self.options));
+                arrays.extend(columns.build_columns(&values, &self.options)?);
+
+                RecordBatch::try_new_with_options(
+                    Arc::new(Schema::new(fields)),
+                    arrays,
+                    &RecordBatchOptions::new().with_row_count(Some(indices.len())),
+                )
+                .with_context(|| format!("build {name} batch"))
+            })
+            .collect()
+    }
+}
+
+/// Topic and data columns of a log table.
+struct LogColumns<'a> {
+    topics: Vec<Option<BinaryColumn<'a>>>,
+    data: BinaryColumn<'a>,
+}
+
+impl<'a> LogColumns<'a> {
+    fn new(batch: &'a RecordBatch) -> Result<Self> {
+        let topics = TOPIC_COLUMNS
+            .iter()
+            .map(|name| {
+                batch
+                    .column_by_name(name)
+                    .map(|col| BinaryColumn::new(col).with_context(|| format!("read {name}")))
+                    .transpose()
+            })
+            .collect::<Result<Vec<_>>>()?;
+        let data = batch.column_by_name("data").context("get data column")?;
+        let data = BinaryColumn::new(data).context("read data")?;
+
+        Ok(Self { topics, data })
+    }
+
+    /// Non-null leading topics and the data of the log at `row`.
+    fn get(&self, row: usize) -> Option<(Vec<B256>, Cow<'a, [u8]>)> {
+        let topics = self
+            .topics
+            .iter()
+            .map_while(|col| col.as_ref()?.value(row))
+            .map(|topic| B256::try_from(topic.as_ref()))
+            .collect::<Result<Vec<_>, _>>()
+            .ok()?;
+
+        Some((topics, self.data.value(row)?))
+    }
+}
+
+/// Binary column of a log table, hex encoded columns are decoded on access.
+pub enum BinaryColumn<'a> {
+    Binary(&'a BinaryArray),
+    LargeBinary(&'a LargeBinaryArray),
+    FixedSizeBinary(&'a FixedSizeBinaryArray),
+    Hex(&'a StringArray),
+}
+
+impl<'a> BinaryColumn<'a> {
+    pub fn new(array: &'a ArrayRef) -> Result<Self> {
+        match array.data_type() {
+            DataType::Binary => Ok(Self::Binary(array.as_binary())),
+            DataType::LargeBinary => Ok(Self::LargeBinary(array.as_binary())),
+            DataType::FixedSizeBinary(_) => Ok(Self::FixedSizeBinary(array.as_fixed_size_binary())),
+            DataType::Utf8 => Ok(Self::Hex(array.as_string())),
+            other => Err(anyhow!("expected a binary or hex column, got {other}")),
+        }
+    }
+
+    pub fn value(&self, row: usize) -> Option<Cow<'a, [u8]>> {
+        match self {
+            Self::Binary(a) => a.is_valid(row).then(|| Cow::Borrowed(a.value(row))),
+            Self::LargeBinary(a) => a.is_valid(row).then(|| Cow::Borrowed(a.value(row))),
+            Self::FixedSizeBinary(a) => a.is_valid(row).then(|| Cow::Borrowed(a.value(row))),
+            Self::Hex(a) => {
+                if a.is_null(row) {
+                    return None;
+                }
+                prefix_hex::decode::<Vec<u8>>(a.value(row))
+                    .ok()
+                    .map(Cow::Owned)
+            }
+        }
+    }
+}
+
+/// Arrow representation of integers wider than 64 bits.
+#[derive(Clone, Copy, Debug, Default, PartialEq, Eq)]
+pub enum BigIntFormat {
+    /// 32 byte big endian two's complement binaries.
+    #[default]
+    Binary,
+    /// `Decimal256(76, decimals)`, values that don't fit are null.
+    Decimal256 { decimals: u8 },
+    /// `Float64` divided by `10^decimals`, precision is lost beyond 53 bits.
+    Float64 { decimals: u8 },
+    /// `FixedSizeList(UInt64, 4)` of the two's complement value, least significant limb first.
+    Limbs,
+}
+
+impl BigIntFormat {
+    /// Parse the `big_int_output` option, `decimals` scales decimal256 and float64 output.
+    pub fn parse(name: &str, decimals: Option<i64>) -> Result<Self> {
+        let decimals = decimals
+            .map(u8::try_from)
+            .transpose()
+            .context("convert decimals")?
+            .unwrap_or(0);
+        if decimals > DECIMAL256_MAX_PRECISION {
+            return Err(anyhow!(
+                "decimals can be at most {DECIMAL256_MAX_PRECISION}"
+            ));
+        }
+
+        match name {
+            "binary" => Ok(Self::Binary),
+            "decimal256" => Ok(Self::Decimal256 { decimals }),
+            "float64" => Ok(Self::Float64 { decimals }),
+            "limbs" => Ok(Self::Limbs),
+            other => Err(anyhow!("unknown big int output: {other}")),
+        }
+    }
+}
+
+/// Output options of decoded event columns.
+#[derive(Clone, Copy, Debug, Default)]
+pub struct ColumnOptions {
+    pub checksummed_addresses: bool,
+    pub big_ints: BigIntFormat,
+}
+
+/// Whether `ty` is stored in a topic as is when indexed, other types are stored as their hash.
+fn is_value_type(ty: &DynSolType) -> bool {
+    matches!(
+        ty,
+        DynSolType::Bool
+            | DynSolType::Int(_)
+            | DynSolType::Uint(_)
+            | DynSolType::Address
+            | DynSolType::FixedBytes(_)
+            | DynSolType::Function
+    )
+}
+
+/// Arrow type of the column holding values of `ty`.
+///
+/// Integers of up to 64 bits map to native integers, wider ones as configured in `options`.
+/// Addresses are hex strings like in the row based decoder.
+fn data_type(ty: &DynSolType, options: &ColumnOptions) -> DataType {
+    match ty {
+        DynSolType::Bool => DataType::Boolean,
+        DynSolType::Int(bits) if *bits <= 64 => DataType::Int64,
+        DynSolType::Uint(bits) if *bits <= 64 => DataType::UInt64,
+        DynSolType::Int(_) | DynSolType::Uint(_) => match options.big_ints {
+            BigIntFormat::Binary => DataType::FixedSizeBinary(32),
+            BigIntFormat::Decimal256 { decimals } => {
+                DataType::Decimal256(DECIMAL256_MAX_PRECISION, decimals as i8)
+            }
+            BigIntFormat::Float64 { .. } => DataType::Float64,
+            BigIntFormat::Limbs => DataType::FixedSizeList(limb_field(), 4),
+        },
+        DynSolType::Address | DynSolType::String => DataType::Utf8,
+        DynSolType::FixedBytes(_) | DynSolType::Function | DynSolType::Bytes => DataType::Binary,
+        DynSolType::Array(inner) | DynSolType::FixedArray(inner, _) => DataType::List(Arc::new(
+            Field::new_list_field(data_type(inner, options), true),
+        )),
+        DynSolType::Tuple(types) => DataType::Struct(tuple_fields(types, options)),
+    }
+}
+
+fn limb_field() -> FieldRef {
+    Arc::new(Field::new_list_field(DataType::UInt64, false))
+}
+
+fn tuple_fields(types: &[DynSolType], options: &ColumnOptions) -> Fields {
+    types
+        .iter()
+        .enumerate()
+        .map(|(i, ty)| Field::new(i.to_string(), data_type(ty, options), true))
+        .collect()
+}
+
+fn nulls<T>(values: &[Option<T>]) -> NullBuffer {
+    NullBuffer::from(values.iter().map(Option::is_some).collect::<Vec<_>>())
+}
+
+/// Two's complement value of a wide integer and whether it is negative.
+fn big_int(value: &DynSolValue) -> Option<(U256, bool)> {
+    match value {
+        DynSolValue::Uint(v, _) => Some((*v, false)),
+        DynSolValue::Int(v, _) => Some((v.into_raw(), v.is_negative())),
+        _ => None,
+    }
+}
+
+fn to_f64(v: U256) -> f64 {
+    v.as_limbs()
+        .iter()
+        .rev()
+        .fold(0.0, |acc, &limb| acc * 18446744073709551616.0 + limb as f64)
+}
+
+fn build_big_int_array(values: &[Option<&DynSolValue>], format: BigIntFormat) -> Result<ArrayRef> {
+    let ints = values
+        .iter()
+        .map(|v| v.and_then(big_int))
+        .collect::<Vec<_>>();
+
+    let array: ArrayRef = match format {
+        BigIntFormat::Binary => Arc::new(FixedSizeBinaryArray::try_from_sparse_iter_with_size(
+            ints.iter().map(|v| v.map(|(v, _)| v.to_be_bytes::<32>())),
+            32,
+        )?),
+        BigIntFormat::Decimal256 { decimals } => Arc::new(
+            ints.iter()
+                .map(|v| {
+                    let (raw, negative) = (*v)?;
+                    // Unsigned values with the top bit set don't fit into an i256.
+                    if raw.bit(255) != negative {
+                        return None;
+                    }
+                    let v = i256::from_be_bytes(raw.to_be_bytes::<32>());
+                    Decimal256Type::is_valid_decimal_precision(v, DECIMAL256_MAX_PRECISION)
+                        .then_some(v)
+                })
+                .collect::<Decimal256Array>()
+                .with_precision_and_scale(DECIMAL256_MAX_PRECISION, decimals as i8)?,
+        ),
+        BigIntFormat::Float64 { decimals } => {
+            let scale = 10f64.powi(i32::from(decimals));
+            Arc::new(
+                ints.iter()
+                    .map(|v| {
+                        v.map(|(raw, negative)| {
+                            if negative {
+                                -to_f64(raw.wrapping_neg()) / scale
+                            } else {
+                                to_f64(raw) / scale
+                            }
+                        })
+                    })
+                    .collect::<Float64Array>(),
+            )
+        }
+        BigIntFormat::Limbs => {
+            let limbs = ints
+                .iter()
+                .flat_map(|v| v.map_or([0; 4], |(raw, _)| *raw.as_limbs()))
+                .collect::<UInt64Array>();
+            Arc::new(FixedSizeListArray::try_new(
+                limb_field(),
+                4,
+                Arc::new(limbs),
+                Some(nulls(&ints)),
+            )?)
+        }
+    };
+
+    Ok(array)
+}
+
+fn build_array(
+    ty: &DynSolType,
+    values: &[Option<&DynSolValue>],
+    options: &ColumnOptions,
+) -> Result<ArrayRef> {
+    let array: ArrayRef = match ty {
+        DynSolType::Bool => Arc::new(
+            values
+                .iter()
+                .map(|v| match v {
+                    Some(DynSolValue::Bool(b)) => Some(*b),
+                    _ => None,
+                })
+                .collect::<BooleanArray>(),
+        ),
+        DynSolType::Int(bits) if *bits <= 64 => Arc::new(
+            values
+                .iter()
+                .map(|v| match v {
+                    Some(DynSolValue::Int(v, _)) => i64::try_from(*v).ok(),
+                    _ => None,
+                })
+                .collect::<Int64Array>(),
+        ),
+        DynSolType::Uint(bits) if *bits <= 64 => Arc::new(
+            values
+                .iter()
+                .map(|v| match v {
+                    Some(DynSolValue::Uint(v, _)) => u64::try_from(*v).ok(),
+                    _ => None,
+                })
+                .collect::<UInt64Array>(),
+        ),
+        DynSolType::Int(_) | DynSolType::Uint(_) => build_big_int_array(values, options.big_ints)?,
+        DynSolType::Address => Arc::new(
+            values
+                .iter()
+                .map(|v| match v {
+                    Some(DynSolValue::Address(addr)) if options.checksummed_addresses => {
+                        Some(addr.to_checksum(None))
+                    }
+                    Some(DynSolValue::Address(addr)) => Some(encode_prefix_hex(addr.as_slice())),
+                    _ => None,
+                })
+                .collect::<StringArray>(),
+        ),
+        DynSolType::String => Arc::new(
+            values
+                .iter()
+                .map(|v| match v {
+                    Some(DynSolValue::String(s)) => Some(s.as_str()),
+                    _ => None,
+                })
+                .collect::<StringArray>(),
+        ),
+        DynSolType::FixedBytes(_) | DynSolType::Function | DynSolType::Bytes => Arc::new(
+            values
+                .iter()
+                .map(|v| match v {
+                    Some(DynSolValue::FixedBytes(bytes, size)) => Some(&bytes[..*size]),
+                    Some(DynSolValue::Function(bytes)) => Some(bytes.as_slice()),
+                    Some(DynSolValue::Bytes(bytes)) => Some(bytes.as_slice()),
+                    _ => None,
+                })
+                .collect::<BinaryArray>(),
+        ),
+        DynSolType::Array(inner) | DynSolType::FixedArray(inner, _) => {
+            let items = values
+                .iter()
+                .map(|v| match v {
+                    Some(DynSolValue::Array(items) | DynSolValue::FixedArray(items)) => {
+                        Some(items.as_slice())
+                    }
+                    _ => None,
+                })
+                .collect::<Vec<_>>();
+            let offsets = OffsetBuffer::from_lengths(items.iter().map(|v| v.map_or(0, <[_]>::len)));
+            let children = items
+                .iter()
+                .flatten()
+                .flat_map(|v| v.iter().map(Some))
+                .collect::<Vec<_>>();
+
+            Arc::new(ListArray::try_new(
+                Arc::new(Field::new_list_field(data_type(inner, options), true)),
+                offsets,
+                build_array(inner, &children, options)?,
+                Some(nulls(&items)),
+            )?)
+        }
+        DynSolType::Tuple(types) => {
+            let items = values
+                .iter()
+                .map(|v| match v {
+                    Some(DynSolValue::Tuple(items)) => Some(items.as_slice()),
+                    _ => None,
+                })
+                .collect::<Vec<_>>();
+
+            if types.is_empty() {
+                Arc::new(StructArray::new_empty_fields(
+                    items.len(),
+                    Some(nulls(&items)),
+                ))
+            } else {
+                let children = types
+                    .iter()
+                    .enumerate()
+                    .map(|(i, ty)| {
+                        let values = items
+                            .iter()
+                            .map(|v| v.and_then(|v| v.get(i)))
+                            .collect::<Vec<_>>();
+                        build_array(ty, &values, options)
+                    })
+                    .collect::<Result<Vec<_>>>()?;
+
+                Arc::new(StructArray::try_new(
+                    tuple_fields(types, options),
+                    children,
+                    Some(nulls(&items)),
+                )?)
+            }
+        }
+    };
+
+    Ok(array)
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_event_columns_schema() {
+        let columns = EventColumns::from_signature(
+            "Transfer(address indexed from, address indexed to, uint256 value)",
+        )
+        .unwrap();
+
+        assert_eq!(columns.name(), "Transfer");
+        let schema = columns.schema(&ColumnOptions::default());
+        let fields = schema
+            .fields()
+            .iter()
+            .map(|f| (f.name().as_str(), f.data_type().clone()))
+            .collect::<Vec<_>>();
+        assert_eq!(
+            fields,
+            [
+                ("from", DataType::Utf8),
+                ("to", DataType::Utf8),
+                ("value", DataType::FixedSizeBinary(32)),
+            ]
+        );
+    }
+
+    #[test]
+    fn test_indexed_reference_types() {
+        let columns = EventColumns::from_signature(
+            "Message(string indexed topic, uint256[] indexed ids, (uint256,uint256) indexed pair, string body)",
+        )
+        .unwrap();
+        let options = ColumnOptions::default();
+
+        let schema = columns.schema(&options);
+        let types = schema
+            .fields()
+            .iter()
+            .map(|f| f.data_type().clone())
+            .collect::<Vec<_>>();
+        assert_eq!(
+            types,
+            [
+                DataType::Binary,
+                DataType::Binary,
+                DataType::Binary,
+                DataType::Utf8
+            ]
+        );
+
+        let hashes = [
+            alloy_primitives::keccak256("hello"),
+            alloy_primitives::keccak256("ids"),
+            alloy_primitives::keccak256("pair"),
+        ];
+        let data =
+            DynSolValue::Tuple(vec![DynSolValue::String("hi".to_owned())]).abi_encode_params();
+        let topic =
+            |topic: B256| -> ArrayRef { Arc::new(BinaryArray::from(vec![topic.as_slice()])) };
+        let batch = RecordBatch::try_from_iter([
+            ("topic0", topic(columns.topic0.unwrap())),
+            ("topic1", topic(hashes[0])),
+            ("topic2", topic(hashes[1])),
+            ("topic3", topic(hashes[2])),
+            (
+                "data",
+                Arc::new(BinaryArray::from(vec![data.as_slice()])) as ArrayRef,
+            ),
+        ])
+        .unwrap();
+
+        let decoded = columns.decode_batch(&batch, &options).unwrap();
+        for (i, hash) in hashes.iter().enumerate() {
+            assert_eq!(
+                decoded.column(i).as_binary::<i32>().value(0),
+                hash.as_slice()
+            );
+        }
+        assert_eq!(decoded.column(3).as_string::<i32>().value(0), "hi");
+    }
+
+    #[test]
+    fn test_big_int_format() {
+        assert_eq!(
+            BigIntFormat::parse("decimal256", Some(18)).unwrap(),
+            BigIntFormat::Decimal256 { decimals: 18 }
+        );
+        assert!(BigIntFormat::parse("decimal256", Some(77)).is_err());
+        assert!(BigIntFormat::parse("intstr", None).is_err());
+
+        let values = [
+            DynSolValue::Uint(U256::from(1_500_000u64), 256),
+            DynSolValue::Int(
+                alloy_primitives::I256::try_from(-2_000_000i64).unwrap(),
+                256,
+            ),
+            DynSolValue::Uint(U256::MAX, 256),
+        ];
+        let values = values.iter().map(Some).collect::<Vec<_>>();
+
+        let floats = build_big_int_array(&values, BigIntFormat::Float64 { decimals: 6 }).unwrap();
+        let floats = floats.as_primitive::<arrow::datatypes::Float64Type>();
+        assert_eq!(floats.value(0), 1.5);
+        assert_eq!(floats.value(1), -2.0);
+
+        let decimals =
+            build_big_int_array(&values, BigIntFormat::Decimal256 { decimals: 0 }).unwrap();
+        let decimals = decimals.as_primitive::<Decimal256Type>();
+        assert_eq!(decimals.value(1), i256::from_i128(-2_000_000));
+        assert!(decimals.is_null(2));
+    }
+}
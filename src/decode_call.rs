@@ -1,8 +1,12 @@
-use crate::types::{DecodedSolValue, Trace, Transaction};
+use crate::types::{plain_params, DecodedSolValue, Trace, Transaction, ValueFormat};
 use anyhow::Context;
 use hypersync_client::format::{Data, Hex};
-use pyo3::{exceptions::PyValueError, pyclass, pymethods, Bound, PyAny, PyResult, Python};
+use pyo3::{
+    exceptions::PyValueError, pyclass, pymethods, Bound, IntoPyObjectExt, Py, PyAny, PyResult,
+    Python,
+};
 use pyo3_async_runtimes::tokio::future_into_py;
+use std::collections::HashMap;
 use std::sync::Arc;
 
 #[pyclass]
@@ -10,6 +14,9 @@ use std::sync::Arc;
 pub struct CallDecoder {
     inner: Arc<hypersync_client::CallDecoder>,
     checksummed_addresses: bool,
+    format: ValueFormat,
+    /// Input names of the functions by selector, for plain values keyed by name.
+    input_names: Arc<HashMap<[u8; 4], Vec<String>>>,
 }
 
 #[pymethods]
@@ -20,9 +27,33 @@ impl CallDecoder {
             .context("build inner decoder")
             .map_err(|e| PyValueError::new_err(format!("{:?}", e)))?;
 
+        let input_names = signatures
+            .iter()
+            .map(|sig| {
+                let function =
+                    alloy_json_abi::Function::parse(sig).context("parse function signature")?;
+                let names = function
+                    .inputs
+                    .iter()
+                    .enumerate()
+                    .map(|(i, param)| {
+                        if param.name.is_empty() {
+                            format!("param{i}")
+                        } else {
+                            param.name.clone()
+                        }
+                    })
+                    .collect();
+                Ok((function.selector().0, names))
+            })
+            .collect::<anyhow::Result<HashMap<_, _>>>()
+            .map_err(|e| PyValueError::new_err(format!("{:?}", e)))?;
+
         Ok(Self {
             inner: Arc::new(inner),
             checksummed_addresses: false,
+            format: ValueFormat::Wrapped,
+            input_names: Arc::new(input_names),
         })
     }
 
@@ -34,6 +65,17 @@ impl CallDecoder {
         self.checksummed_addresses = false;
     }
 
+    /// Return decoded inputs as plain python values instead of lists of `DecodedSolValue`. A
+    /// dict keyed by input name if `named` is set, a tuple in signature order otherwise.
+    #[pyo3(signature = (named=false))]
+    pub fn enable_plain_values(&mut self, named: bool) {
+        self.format = ValueFormat::plain(named);
+    }
+
+    pub fn disable_plain_values(&mut self) {
+        self.format = ValueFormat::Wrapped;
+    }
+
     pub fn decode_inputs<'py>(
         &self,
         input: Vec<String>,
@@ -42,12 +84,11 @@ impl CallDecoder {
         let decoder = self.clone();
 
         future_into_py(py, async move {
-            let result = tokio::task::spawn_blocking(move || {
+            tokio::task::spawn_blocking(move || {
                 Python::attach(|py| decoder.decode_inputs_sync(input, py))
             })
             .await
-            .unwrap();
-            Ok(result)
+            .unwrap()
         })
     }
 
@@ -59,12 +100,11 @@ impl CallDecoder {
         let decoder = self.clone();
 
         future_into_py(py, async move {
-            let result = tokio::task::spawn_blocking(move || {
+            tokio::task::spawn_blocking(move || {
                 Python::attach(|py| decoder.decode_transactions_input_sync(txs, py))
             })
             .await
-            .unwrap();
-            Ok(result)
+            .unwrap()
         })
     }
 
@@ -76,12 +116,11 @@ impl CallDecoder {
         let decoder = self.clone();
 
         future_into_py(py, async move {
-            let result = tokio::task::spawn_blocking(move || {
+            tokio::task::spawn_blocking(move || {
                 Python::attach(|py| decoder.decode_traces_input_sync(traces, py))
             })
             .await
-            .unwrap();
-            Ok(result)
+            .unwrap()
         })
     }
 
@@ -89,7 +128,7 @@ impl CallDecoder {
         &self,
         inputs: Vec<String>,
         py: Python,
-    ) -> Vec<Option<Vec<DecodedSolValue>>> {
+    ) -> PyResult<Vec<Option<Py<PyAny>>>> {
         inputs
             .into_iter()
             .map(|input| self.decode_impl(input.as_str(), py))
@@ -100,9 +139,12 @@ impl CallDecoder {
         &self,
         txs: Vec<Transaction>,
         py: Python,
-    ) -> Vec<Option<Vec<DecodedSolValue>>> {
+    ) -> PyResult<Vec<Option<Py<PyAny>>>> {
         txs.into_iter()
-            .map(|tx| self.decode_impl(tx.input?.as_str(), py))
+            .map(|tx| match tx.input {
+                Some(input) => self.decode_impl(input.as_str(), py),
+                None => Ok(None),
+            })
             .collect()
     }
 
@@ -110,25 +152,45 @@ impl CallDecoder {
         &self,
         traces: Vec<Trace>,
         py: Python,
-    ) -> Vec<Option<Vec<DecodedSolValue>>> {
+    ) -> PyResult<Vec<Option<Py<PyAny>>>> {
         traces
             .into_iter()
-            .map(|trace| self.decode_impl(trace.input?.as_str(), py))
+            .map(|trace| match trace.input {
+                Some(input) => self.decode_impl(input.as_str(), py),
+                None => Ok(None),
+            })
             .collect()
     }
 
-    pub fn decode_impl(&self, input: &str, py: Python) -> Option<Vec<DecodedSolValue>> {
+    pub fn decode_impl(&self, input: &str, py: Python) -> PyResult<Option<Py<PyAny>>> {
         let input = Data::decode_hex(input).context("decode input").unwrap();
         let decoded_input = self
             .inner
             .decode_input(&input)
             .context("decode log")
             .unwrap();
-        decoded_input.map(|decoded_input| {
-            decoded_input
+        let decoded_input = match decoded_input {
+            Some(decoded_input) => decoded_input,
+            None => return Ok(None),
+        };
+
+        match self.format {
+            ValueFormat::Wrapped => decoded_input
                 .into_iter()
                 .map(|value| DecodedSolValue::new(py, value, self.checksummed_addresses))
-                .collect()
-        })
+                .collect::<Vec<_>>()
+                .into_py_any(py)
+                .map(Some),
+            ValueFormat::Tuple | ValueFormat::Dict => {
+                let names = match self.format {
+                    ValueFormat::Dict => input
+                        .get(..4)
+                        .and_then(|selector| self.input_names.get(selector))
+                        .map(|names| names.iter().map(String::as_str)),
+                    _ => None,
+                };
+                plain_params(py, decoded_input, names, self.checksummed_addresses).map(Some)
+            }
+        }
     }
 }
@@ -0,0 +1,306 @@
+//! Logs of arrow responses joined with their transactions and blocks.
+//!
+//! Transactions are matched by `(block_number, transaction_index)` and blocks by `number`,
+//! through hash indexes built per response. The joined table has the selected log columns,
+//! followed by the selected transaction columns prefixed with `transaction_` and the selected
+//! block columns prefixed with `block_`. Columns that repeat a log column are left out.
+
+use std::collections::HashMap;
+use std::sync::Arc;
+
+use anyhow::{anyhow, Context, Result};
+use arrow::{
+    array::{Array, ArrayRef, AsArray, RecordBatch, UInt32Array},
+    compute::{cast, concat_batches, take},
+    datatypes::{DataType, Field, FieldRef, Schema, UInt64Type},
+};
+
+use crate::query::Query;
+
+/// Log columns that identify the transaction and block of a log.
+const LOG_KEYS: [&str; 2] = ["block_number", "transaction_index"];
+
+/// Transactions or blocks joined to logs.
+struct Side {
+    /// Columns that identify a row, matched with `LOG_KEYS`.
+    keys: &'static [&'static str],
+    /// Columns left out of the joined table as logs already carry them.
+    skip: &'static [&'static str],
+    prefix: &'static str,
+}
+
+const TRANSACTIONS: Side = Side {
+    keys: &["block_number", "transaction_index"],
+    skip: &["block_number", "transaction_index", "block_hash"],
+    prefix: "transaction_",
+};
+
+const BLOCKS: Side = Side {
+    keys: &["number"],
+    skip: &["number"],
+    prefix: "block_",
+};
+
+/// Joins the logs of the responses of a query with their transactions and blocks.
+#[derive(Clone, Debug, Default)]
+pub struct EventJoin {
+    /// Log columns that were only selected for the join.
+    hidden: Vec<String>,
+}
+
+impl EventJoin {
+    /// Select the fields needed to join the logs of `query` with their transactions and
+    /// blocks. Transactions and blocks are only joined if some of their fields are selected.
+    pub fn prepare(query: &mut Query) -> Self {
+        let selection = &mut query.field_selection;
+        let joins_transactions = selection
+            .transaction
+            .as_ref()
+            .is_some_and(|f| !f.is_empty());
+        let joins_blocks = selection.block.as_ref().is_some_and(|f| !f.is_empty());
+
+        let mut hidden = Vec::new();
+        if joins_transactions || joins_blocks {
+            let log = selection.log.get_or_insert_with(Vec::new);
+            for key in LOG_KEYS {
+                if !log.iter().any(|f| f == key) {
+                    log.push(key.to_owned());
+                    hidden.push(key.to_owned());
+                }
+            }
+        }
+        if joins_transactions {
+            select(&mut selection.transaction, TRANSACTIONS.keys);
+        }
+        if joins_blocks {
+            select(&mut selection.block, BLOCKS.keys);
+        }
+
+        Self { hidden }
+    }
+
+    /// Join `logs` with `transactions` and `blocks`, one output batch per log batch.
+    ///
+    /// Logs without a matching transaction or block get nulls in its columns.
+    pub fn join(
+        &self,
+        logs: &[RecordBatch],
+        transactions: &[RecordBatch],
+        blocks: &[RecordBatch],
+    ) -> Result<Vec<RecordBatch>> {
+        let transactions = Index::new(&TRANSACTIONS, transactions).context("index transactions")?;
+        let blocks = Index::new(&BLOCKS, blocks).context("index blocks")?;
+
+        logs.iter()
+            .map(|batch| {
+                let mut fields = Vec::<FieldRef>::new();
+                let mut columns = Vec::<ArrayRef>::new();
+                for (field, column) in batch.schema().fields().iter().zip(batch.columns()) {
+                    if !self.hidden.contains(field.name()) {
+                        fields.push(Arc::clone(field));
+                        columns.push(Arc::clone(column));
+                    }
+                }
+
+                if transactions.is_some() || blocks.is_some() {
+                    let keys = log_keys(batch).context("read log keys")?;
+                    for index in [&transactions, &blocks].into_iter().flatten() {
+                        index.take(&keys, &mut fields, &mut columns)?;
+                    }
+                }
+
+                RecordBatch::try_new(Arc::new(Schema::new(fields)), columns)
+                    .context("build joined batch")
+            })
+            .collect()
+    }
+}
+
+fn select(fields: &mut Option<Vec<String>>, keys: &[&str]) {
+    let fields = fields.get_or_insert_with(Vec::new);
+    for key in keys {
+        if !fields.iter().any(|f| f == key) {
+            fields.push((*key).to_owned());
+        }
+    }
+}
+
+/// Transactions or blocks of a response, indexed by their key.
+struct Index {
+    side: &'static Side,
+    /// All batches concatenated, so rows can be taken with a single index array.
+    batch: RecordBatch,
+    rows: HashMap<(u64, u64), u32>,
+}
+
+impl Index {
+    /// `None` if there are no rows to join.
+    fn new(side: &'static Side, batches: &[RecordBatch]) -> Result<Option<Self>> {
+        let schema = match batches.first() {
+            Some(batch) => batch.schema(),
+            None => return Ok(None),
+        };
+        let batch = concat_batches(&schema, batches).context("concat batches")?;
+        let keys = key_columns(&batch, side.keys)?;
+
+        let mut rows = HashMap::with_capacity(batch.num_rows());
+        for row in 0..batch.num_rows() {
+            if let Some(key) = key_at(&keys, row) {
+                let row = u32::try_from(row).context("too many rows to join")?;
+                rows.entry(key).or_insert(row);
+            }
+        }
+
+        Ok(Some(Self { side, batch, rows }))
+    }
+
+    /// Append the columns of the rows matching `keys` to `fields` and `columns`.
+    fn take(
+        &self,
+        keys: &[ArrayRef],
+        fields: &mut Vec<FieldRef>,
+        columns: &mut Vec<ArrayRef>,
+    ) -> Result<()> {
+        let keys = &keys[..self.side.keys.len()];
+        let num_rows = keys.first().map_or(0, |k| k.len());
+        let indices = (0..num_rows)
+            .map(|row| key_at(keys, row).and_then(|key| self.rows.get(&key).copied()))
+            .collect::<UInt32Array>();
+
+        for (field, column) in self
+            .batch
+            .schema()
+            .fields()
+            .iter()
+            .zip(self.batch.columns())
+        {
+            if self.side.skip.contains(&field.name().as_str()) {
+                continue;
+            }
+            let name = if field.name().starts_with(self.side.prefix) {
+                field.name().clone()
+            } else {
+                format!("{}{}", self.side.prefix, field.name())
+            };
+            if fields.iter().any(|f| *f.name() == name) {
+                continue;
+            }
+
+            let column = take(column.as_ref(), &indices, None)
+                .with_context(|| format!("take {}", field.name()))?;
+            fields.push(Arc::new(Field::new(name, column.data_type().clone(), true)));
+            columns.push(column);
+        }
+
+        Ok(())
+    }
+}
+
+fn log_keys(batch: &RecordBatch) -> Result<Vec<ArrayRef>> {
+    key_columns(batch, &LOG_KEYS)
+}
+
+/// Key columns of `batch` as `UInt64` arrays.
+fn key_columns(batch: &RecordBatch, keys: &[&str]) -> Result<Vec<ArrayRef>> {
+    keys.iter()
+        .map(|key| {
+            let column = batch
+                .column_by_name(key)
+                .ok_or_else(|| anyhow!("{key} column is missing"))?;
+            cast(column, &DataType::UInt64).with_context(|| format!("cast {key}"))
+        })
+        .collect()
+}
+
+fn key_at(keys: &[ArrayRef], row: usize) -> Option<(u64, u64)> {
+    let value = |idx: usize| {
+        keys.get(idx).map_or(Some(0), |k| {
+            let k = k.as_primitive::<UInt64Type>();
+            k.is_valid(row).then(|| k.value(row))
+        })
+    };
+
+    Some((value(0)?, value(1)?))
+}
+
+#[cfg(test)]
+mod tests {
+    use arrow::array::{StringArray, UInt64Array};
+
+    use super::*;
+
+    fn batch(columns: Vec<(&str, ArrayRef)>) -> RecordBatch {
+        RecordBatch::try_from_iter(columns).unwrap()
+    }
+
+    #[test]
+    fn test_join() {
+        let logs = batch(vec![
+            (
+                "block_number",
+                Arc::new(UInt64Array::from(vec![1, 1, 2])) as ArrayRef,
+            ),
+            (
+                "transaction_index",
+                Arc::new(UInt64Array::from(vec![0, 1, 0])) as ArrayRef,
+            ),
+            (
+                "data",
+                Arc::new(StringArray::from(vec!["a", "b", "c"])) as ArrayRef,
+            ),
+        ]);
+        let transactions = batch(vec![
+            (
+                "block_number",
+                Arc::new(UInt64Array::from(vec![1, 1])) as ArrayRef,
+            ),
+            (
+                "transaction_index",
+                Arc::new(UInt64Array::from(vec![1, 0])) as ArrayRef,
+            ),
+            (
+                "hash",
+                Arc::new(StringArray::from(vec!["t1", "t0"])) as ArrayRef,
+            ),
+        ]);
+        let blocks = batch(vec![
+            (
+                "number",
+                Arc::new(UInt64Array::from(vec![1, 2])) as ArrayRef,
+            ),
+            (
+                "timestamp",
+                Arc::new(UInt64Array::from(vec![10, 20])) as ArrayRef,
+            ),
+        ]);
+
+        let join = EventJoin {
+            hidden: vec!["transaction_index".to_owned()],
+        };
+        let joined = join.join(&[logs], &[transactions], &[blocks]).unwrap();
+
+        let joined = &joined[0];
+        let names = joined
+            .schema()
+            .fields()
+            .iter()
+            .map(|f| f.name().clone())
+            .collect::<Vec<_>>();
+        assert_eq!(
+            names,
+            [
+                "block_number",
+                "data",
+                "transaction_hash",
+                "block_timestamp"
+            ]
+        );
+
+        let hashes = joined.column(2).as_string::<i32>();
+        assert_eq!(hashes.value(0), "t0");
+        assert_eq!(hashes.value(1), "t1");
+        assert!(hashes.is_null(2));
+        let timestamps = joined.column(3).as_primitive::<UInt64Type>();
+        assert_eq!(timestamps.values().as_ref(), &[10, 10, 20]);
+    }
+}
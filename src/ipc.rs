@@ -0,0 +1,1222 @@
+//! Pickling of responses and their rows.
+//!
+//! Responses are pickled as Arrow IPC instead of field by field, so sending one to a worker
+//! process costs a copy of its buffers rather than a python object per value. A serialized
+//! response is a sequence of frames, each a length prefixed Arrow IPC stream. The first frame
+//! has no columns and carries the scalar fields of the response as JSON in its schema
+//! metadata, the following frames hold its tables.
+//!
+//! Single rows are pickled as the tuple of their fields, which is smaller than an IPC stream
+//! with a single row.
+
+use std::collections::HashMap;
+use std::sync::Arc;
+
+use anyhow::{anyhow, Context, Result};
+use arrow::{
+    array::{
+        Array, ArrayRef, AsArray, BooleanArray, ListArray, PrimitiveArray, RecordBatch,
+        StringArray, StructArray, UInt32Array,
+    },
+    buffer::{NullBuffer, OffsetBuffer},
+    compute::concat_batches,
+    datatypes::{Field, Float64Type, Int64Type, Schema, SchemaRef, UInt32Type},
+    ipc::{reader::StreamReader, writer::StreamWriter},
+};
+use pyo3::{
+    exceptions::PyValueError,
+    prelude::*,
+    types::{PyBytes, PyDict, PyTuple, PyType},
+};
+use serde::{Deserialize, Serialize};
+
+use crate::{
+    arrow_ffi::{batches_to_pyarrow, table_batches, ArrowTable},
+    metrics::ResponseTiming,
+    response::{
+        ArrowEventResponse, ArrowResponse, ArrowResponseData, EventResponse, QueryResponse,
+        QueryResponseData,
+    },
+    rows::{RowObject, Rows},
+    types::{
+        AccessList, Block, DecodedEvent, DecodedSolValue, Event, Log, Rollback, RollbackGuard,
+        Trace, Transaction, Withdrawal,
+    },
+};
+
+/// Schema metadata key of the header frame.
+const HEADER_KEY: &str = "hypersync.response";
+
+/// Scalar fields of a serialized response.
+#[derive(Default, Serialize, Deserialize)]
+struct Header<N> {
+    /// Name of the response class, checked when reading so bytes of one response type are not
+    /// read as another.
+    kind: String,
+    archive_height: Option<N>,
+    next_block: N,
+    total_execution_time: N,
+    rollback_guard: Option<RollbackGuard>,
+    timing: ResponseTiming,
+    /// Tables of arrow responses are `ArrowTable`s instead of pyarrow Tables.
+    #[serde(default)]
+    capsule: bool,
+    /// Names of the tables of `ArrowResponseData.decoded_events`, `None` if it is `None`.
+    #[serde(default)]
+    decoded_events: Option<Vec<String>>,
+}
+
+#[derive(Default)]
+struct FrameWriter {
+    buf: Vec<u8>,
+}
+
+impl FrameWriter {
+    fn write(&mut self, schema: &Schema, batches: &[RecordBatch]) -> Result<()> {
+        let frame = write_stream(schema, batches)?;
+
+        self.buf
+            .extend_from_slice(&(frame.len() as u64).to_le_bytes());
+        self.buf.extend_from_slice(&frame);
+
+        Ok(())
+    }
+
+    fn write_header<N: Serialize>(&mut self, header: &Header<N>) -> Result<()> {
+        let header = serde_json::to_string(header).context("serialize header")?;
+        let schema =
+            Schema::empty().with_metadata(HashMap::from([(HEADER_KEY.to_owned(), header)]));
+        self.write(&schema, &[])
+    }
+
+    fn write_batch(&mut self, batch: RecordBatch) -> Result<()> {
+        self.write(&batch.schema(), &[batch])
+    }
+
+    fn write_rows<T: IpcRow>(&mut self, rows: &[&T]) -> Result<()> {
+        self.write_batch(T::to_batch(rows)?)
+    }
+
+    /// Write the rows of a query response table.
+    ///
+    /// Only objects are written. `RowSequence`s and records would be read back as objects with
+    /// hex string fields, so the reading process would see different types than the writing one.
+    fn write_objects<T: RowObject + IpcRow>(&mut self, rows: &Rows<T>) -> Result<()> {
+        let objects = rows
+            .objects()
+            .context("only responses of the objects row format can be serialized")?;
+        self.write_rows(&objects.iter().collect::<Vec<_>>())
+    }
+
+    /// Write a pyarrow Table, an `ArrowTable` or `None`, which is written without batches.
+    fn write_table(&mut self, table: &Bound<'_, PyAny>) -> Result<()> {
+        let batches = table_batches(table)?;
+        match batches.first() {
+            Some(batch) => self.write(&batch.schema(), &batches),
+            None => self.write(&Schema::empty(), &[]),
+        }
+    }
+}
+
+struct FrameReader<'a> {
+    bytes: &'a [u8],
+}
+
+impl<'a> FrameReader<'a> {
+    fn read(&mut self) -> Result<(SchemaRef, Vec<RecordBatch>)> {
+        let (len, rest) = self
+            .bytes
+            .split_first_chunk::<8>()
+            .ok_or_else(|| anyhow!("ipc bytes are truncated"))?;
+        let len = usize::try_from(u64::from_le_bytes(*len)).context("convert frame length")?;
+        if rest.len() < len {
+            return Err(anyhow!("ipc bytes are truncated"));
+        }
+        let (frame, rest) = rest.split_at(len);
+        self.bytes = rest;
+
+        read_stream(frame)
+    }
+
+    fn read_header<N: for<'de> Deserialize<'de>>(&mut self, kind: &str) -> Result<Header<N>> {
+        let (schema, _) = self.read().context("read header")?;
+        let header = schema
+            .metadata()
+            .get(HEADER_KEY)
+            .ok_or_else(|| anyhow!("bytes are not a serialized response"))?;
+        let header: Header<N> = serde_json::from_str(header).context("parse header")?;
+        if header.kind != kind {
+            return Err(anyhow!(
+                "bytes are a serialized {}, not a {kind}",
+                header.kind
+            ));
+        }
+
+        Ok(header)
+    }
+
+    /// Read a frame that was written as a single batch.
+    fn read_batch(&mut self) -> Result<RecordBatch> {
+        let (schema, batches) = self.read()?;
+        concat_batches(&schema, &batches).context("concat batches")
+    }
+
+    fn read_rows<T: IpcRow>(&mut self) -> Result<Vec<T>> {
+        self.read_batch().and_then(|batch| T::from_batch(&batch))
+    }
+
+    /// Read a table written by `FrameWriter::write_table`, `None` if it has no batches.
+    fn read_table(&mut self, py: Python, capsule: bool) -> Result<Py<PyAny>> {
+        let (_, batches) = self.read()?;
+        if capsule {
+            ArrowTable::to_python(py, batches)
+        } else {
+            batches_to_pyarrow(py, batches)
+        }
+    }
+}
+
+/// Responses that are pickled as Arrow IPC.
+trait IpcResponse: Sized {
+    const KIND: &'static str;
+
+    fn write_ipc(&self, py: Python, writer: &mut FrameWriter) -> Result<()>;
+
+    fn read_ipc(py: Python, reader: &mut FrameReader) -> Result<Self>;
+}
+
+/// Add `to_ipc_bytes`, `from_ipc_bytes` and `__reduce__` to a response class implementing
+/// `IpcResponse`.
+macro_rules! ipc_response {
+    ($ty:ident) => {
+        #[pymethods]
+        impl $ty {
+            /// Serialize the response to Arrow IPC, see `from_ipc_bytes`.
+            pub fn to_ipc_bytes<'py>(&self, py: Python<'py>) -> Result<Bound<'py, PyBytes>> {
+                let mut writer = FrameWriter::default();
+                self.write_ipc(py, &mut writer)?;
+                Ok(PyBytes::new(py, &writer.buf))
+            }
+
+            /// Read a response serialized by `to_ipc_bytes`.
+            #[classmethod]
+            pub fn from_ipc_bytes(
+                _cls: &Bound<'_, PyType>,
+                py: Python<'_>,
+                data: &[u8],
+            ) -> Result<Self> {
+                Self::read_ipc(py, &mut FrameReader { bytes: data })
+                    .context(concat!("read ", stringify!($ty)))
+            }
+
+            pub fn __reduce__<'py>(
+                slf: &Bound<'py, Self>,
+            ) -> Result<(Bound<'py, PyAny>, (Bound<'py, PyBytes>,))> {
+                let bytes = slf.borrow().to_ipc_bytes(slf.py())?;
+                Ok((slf.get_type().getattr("from_ipc_bytes")?, (bytes,)))
+            }
+        }
+    };
+}
+
+ipc_response!(QueryResponse);
+ipc_response!(EventResponse);
+ipc_response!(ArrowResponse);
+ipc_response!(ArrowEventResponse);
+
+impl IpcResponse for QueryResponse {
+    const KIND: &'static str = "QueryResponse";
+
+    fn write_ipc(&self, _py: Python, writer: &mut FrameWriter) -> Result<()> {
+        writer.write_header(&Header {
+            kind: Self::KIND.to_owned(),
+            archive_height: self.archive_height,
+            next_block: self.next_block,
+            total_execution_time: self.total_execution_time,
+            rollback_guard: self.rollback_guard.clone(),
+            timing: self.timing.clone(),
+            ..Default::default()
+        })?;
+
+        let data = &self.data;
+        writer.write_objects(&data.blocks)?;
+        writer.write_objects(&data.transactions)?;
+        writer.write_objects(&data.logs)?;
+        writer.write_objects(&data.traces)
+    }
+
+    fn read_ipc(_py: Python, reader: &mut FrameReader) -> Result<Self> {
+        let header = reader.read_header::<i64>(Self::KIND)?;
+
+        Ok(Self {
+            archive_height: header.archive_height,
+            next_block: header.next_block,
+            total_execution_time: header.total_execution_time,
+            data: QueryResponseData {
+                blocks: Rows::Objects(reader.read_rows().context("read blocks")?),
+                transactions: Rows::Objects(reader.read_rows().context("read transactions")?),
+                logs: Rows::Objects(reader.read_rows().context("read logs")?),
+                traces: Rows::Objects(reader.read_rows().context("read traces")?),
+            },
+            rollback_guard: header.rollback_guard,
+            timing: header.timing,
+        })
+    }
+}
+
+/// Transactions or blocks shared between the events of a response, serialized once each.
+struct Shared<'py, T: PyClass> {
+    rows: HashMap<*mut pyo3::ffi::PyObject, u32>,
+    objects: Vec<PyRef<'py, T>>,
+}
+
+impl<'py, T: PyClass> Shared<'py, T> {
+    fn new() -> Self {
+        Self {
+            rows: HashMap::new(),
+            objects: Vec::new(),
+        }
+    }
+
+    /// Row of `obj` in the serialized table.
+    fn row(&mut self, obj: &Bound<'py, T>) -> Result<u32> {
+        if let Some(&row) = self.rows.get(&obj.as_ptr()) {
+            return Ok(row);
+        }
+        let row = u32::try_from(self.objects.len()).context("too many shared rows")?;
+        self.rows.insert(obj.as_ptr(), row);
+        self.objects.push(obj.try_borrow()?);
+
+        Ok(row)
+    }
+
+    fn refs(&self) -> Vec<&T> {
+        self.objects.iter().map(|obj| &**obj).collect()
+    }
+}
+
+impl IpcResponse for EventResponse {
+    const KIND: &'static str = "EventResponse";
+
+    /// Logs are written with a row per event, followed by the rows of the transaction and block
+    /// of each event in the other tables.
+    fn write_ipc(&self, py: Python, writer: &mut FrameWriter) -> Result<()> {
+        writer.write_header(&Header {
+            kind: Self::KIND.to_owned(),
+            archive_height: self.archive_height,
+            next_block: self.next_block,
+            total_execution_time: self.total_execution_time,
+            rollback_guard: self.rollback_guard.clone(),
+            timing: self.timing.clone(),
+            ..Default::default()
+        })?;
+
+        let mut transactions = Shared::<Transaction>::new();
+        let mut blocks = Shared::<Block>::new();
+        let mut transaction_rows = Vec::with_capacity(self.data.len());
+        let mut block_rows = Vec::with_capacity(self.data.len());
+        for event in self.data.iter() {
+            transaction_rows.push(
+                event
+                    .transaction
+                    .as_ref()
+                    .map(|tx| transactions.row(tx.bind(py)))
+                    .transpose()?,
+            );
+            block_rows.push(
+                event
+                    .block
+                    .as_ref()
+                    .map(|block| blocks.row(block.bind(py)))
+                    .transpose()?,
+            );
+        }
+
+        writer.write_rows(&self.data.iter().map(|e| &e.log).collect::<Vec<_>>())?;
+        writer.write_batch(
+            RecordBatch::try_from_iter([
+                (
+                    "transaction",
+                    Arc::new(UInt32Array::from(transaction_rows)) as ArrayRef,
+                ),
+                ("block", Arc::new(UInt32Array::from(block_rows)) as ArrayRef),
+            ])
+            .context("build event rows")?,
+        )?;
+        writer.write_rows(&transactions.refs())?;
+        writer.write_rows(&blocks.refs())
+    }
+
+    fn read_ipc(py: Python, reader: &mut FrameReader) -> Result<Self> {
+        let header = reader.read_header::<i64>(Self::KIND)?;
+
+        let logs = reader.read_rows::<Log>().context("read logs")?;
+        let rows = reader.read_batch().context("read event rows")?;
+        let transactions = reader
+            .read_rows::<Transaction>()
+            .context("read transactions")?
+            .into_iter()
+            .map(|tx| Py::new(py, tx))
+            .collect::<PyResult<Vec<_>>>()?;
+        let blocks = reader
+            .read_rows::<Block>()
+            .context("read blocks")?
+            .into_iter()
+            .map(|block| Py::new(py, block))
+            .collect::<PyResult<Vec<_>>>()?;
+
+        if rows.num_rows() != logs.len() {
+            return Err(anyhow!("event rows don't match the logs"));
+        }
+        let transaction_rows = row_column(&rows, "transaction")?;
+        let block_rows = row_column(&rows, "block")?;
+        let data = logs
+            .into_iter()
+            .enumerate()
+            .map(|(i, log)| {
+                Ok(Event {
+                    transaction: shared_at(py, &transactions, transaction_rows, i)?,
+                    block: shared_at(py, &blocks, block_rows, i)?,
+                    log,
+                })
+            })
+            .collect::<Result<Vec<_>>>()?;
+
+        Ok(Self {
+            archive_height: header.archive_height,
+            next_block: header.next_block,
+            total_execution_time: header.total_execution_time,
+            data,
+            rollback_guard: header.rollback_guard,
+            timing: header.timing,
+        })
+    }
+}
+
+fn row_column<'a>(batch: &'a RecordBatch, name: &str) -> Result<&'a UInt32Array> {
+    batch
+        .column_by_name(name)
+        .and_then(|column| column.as_primitive_opt::<UInt32Type>())
+        .ok_or_else(|| anyhow!("{name} rows are missing"))
+}
+
+fn shared_at<T: PyClass>(
+    py: Python,
+    objects: &[Py<T>],
+    rows: &UInt32Array,
+    index: usize,
+) -> Result<Option<Py<T>>> {
+    if rows.is_null(index) {
+        return Ok(None);
+    }
+    let row = usize::try_from(rows.value(index)).context("convert row")?;
+    objects
+        .get(row)
+        .map(|obj| Some(obj.clone_ref(py)))
+        .ok_or_else(|| anyhow!("shared row {row} is out of range"))
+}
+
+impl IpcResponse for ArrowResponse {
+    const KIND: &'static str = "ArrowResponse";
+
+    fn write_ipc(&self, py: Python, writer: &mut FrameWriter) -> Result<()> {
+        let data = &self.data;
+        let tables = [
+            &data.blocks,
+            &data.transactions,
+            &data.logs,
+            &data.traces,
+            &data.decoded_logs,
+        ]
+        .map(|table| table.bind(py));
+        let decoded_events = data.decoded_events.bind(py);
+        let decoded_events = if decoded_events.is_none() {
+            None
+        } else {
+            Some(
+                decoded_events
+                    .downcast::<PyDict>()
+                    .map_err(PyErr::from)?
+                    .iter()
+                    .map(|(name, table)| Ok((name.extract::<String>()?, table)))
+                    .collect::<PyResult<Vec<_>>>()?,
+            )
+        };
+        let capsule = tables
+            .iter()
+            .copied()
+            .chain(decoded_events.iter().flatten().map(|(_, table)| table))
+            .any(|table| table.is_instance_of::<ArrowTable>());
+
+        writer.write_header(&Header {
+            kind: Self::KIND.to_owned(),
+            archive_height: self.archive_height,
+            next_block: self.next_block,
+            total_execution_time: self.total_execution_time,
+            rollback_guard: self.rollback_guard.clone(),
+            timing: self.timing.clone(),
+            capsule,
+            decoded_events: decoded_events
+                .as_ref()
+                .map(|tables| tables.iter().map(|(name, _)| name.clone()).collect()),
+        })?;
+        for table in tables.iter() {
+            writer.write_table(table)?;
+        }
+        for (name, table) in decoded_events.iter().flatten() {
+            writer
+                .write_table(table)
+                .with_context(|| format!("write {name}"))?;
+        }
+
+        Ok(())
+    }
+
+    fn read_ipc(py: Python, reader: &mut FrameReader) -> Result<Self> {
+        let header = reader.read_header::<u64>(Self::KIND)?;
+        let capsule = header.capsule;
+
+        let blocks = reader.read_table(py, capsule).context("read blocks")?;
+        let transactions = reader
+            .read_table(py, capsule)
+            .context("read transactions")?;
+        let logs = reader.read_table(py, capsule).context("read logs")?;
+        let traces = reader.read_table(py, capsule).context("read traces")?;
+        let decoded_logs = reader
+            .read_table(py, capsule)
+            .context("read decoded_logs")?;
+        let decoded_events = match header.decoded_events {
+            Some(names) => {
+                let tables = PyDict::new(py);
+                for name in names {
+                    let table = reader
+                        .read_table(py, capsule)
+                        .with_context(|| format!("read {name}"))?;
+                    tables.set_item(name, table)?;
+                }
+                tables.into_any().unbind()
+            }
+            None => py.None(),
+        };
+
+        Ok(Self {
+            archive_height: header.archive_height,
+            next_block: header.next_block,
+            total_execution_time: header.total_execution_time,
+            data: ArrowResponseData {
+                blocks,
+                transactions,
+                logs,
+                traces,
+                decoded_logs,
+                decoded_events,
+            },
+            rollback_guard: header.rollback_guard,
+            timing: header.timing,
+            batches: None,
+        })
+    }
+}
+
+impl IpcResponse for ArrowEventResponse {
+    const KIND: &'static str = "ArrowEventResponse";
+
+    fn write_ipc(&self, py: Python, writer: &mut FrameWriter) -> Result<()> {
+        let data = self.data.bind(py);
+
+        writer.write_header(&Header {
+            kind: Self::KIND.to_owned(),
+            archive_height: self.archive_height,
+            next_block: self.next_block,
+            total_execution_time: self.total_execution_time,
+            rollback_guard: self.rollback_guard.clone(),
+            timing: self.timing.clone(),
+            capsule: data.is_instance_of::<ArrowTable>(),
+            ..Default::default()
+        })?;
+        writer.write_table(data)
+    }
+
+    fn read_ipc(py: Python, reader: &mut FrameReader) -> Result<Self> {
+        let header = reader.read_header::<u64>(Self::KIND)?;
+
+        Ok(Self {
+            archive_height: header.archive_height,
+            next_block: header.next_block,
+            total_execution_time: header.total_execution_time,
+            data: reader.read_table(py, header.capsule).context("read data")?,
+            rollback_guard: header.rollback_guard,
+            timing: header.timing,
+        })
+    }
+}
+
+/// Serialize `batches` as an Arrow IPC stream.
+pub fn write_stream(schema: &Schema, batches: &[RecordBatch]) -> Result<Vec<u8>> {
+    let mut writer = StreamWriter::try_new(Vec::new(), schema).context("create ipc writer")?;
+    for batch in batches {
+        writer.write(batch).context("write batch")?;
+    }
+    writer.finish().context("finish ipc stream")?;
+    writer.into_inner().context("finish ipc stream")
+}
+
+/// Read an Arrow IPC stream written by `write_stream` or any other arrow implementation.
+pub fn read_stream(bytes: &[u8]) -> Result<(SchemaRef, Vec<RecordBatch>)> {
+    let reader = StreamReader::try_new(bytes, None).context("read ipc stream")?;
+    let schema = reader.schema();
+    let batches = reader
+        .collect::<Result<Vec<_>, _>>()
+        .context("read record batches")?;
+
+    Ok((schema, batches))
+}
+
+/// Rows that are serialized as a record batch with a column per field.
+trait IpcRow: Sized {
+    fn to_batch(rows: &[&Self]) -> Result<RecordBatch>;
+
+    fn from_batch(batch: &RecordBatch) -> Result<Vec<Self>>;
+}
+
+/// Types of the fields of serialized rows.
+trait Column: Sized {
+    fn to_array(values: &[&Self]) -> Result<ArrayRef>;
+
+    fn from_array(array: &ArrayRef) -> Result<Vec<Self>>;
+}
+
+fn column<'a, T: Column>(rows: impl Iterator<Item = &'a T>) -> Result<ArrayRef> {
+    T::to_array(&rows.collect::<Vec<_>>())
+}
+
+fn read_column<T: Column>(batch: &RecordBatch, name: &str) -> Result<std::vec::IntoIter<T>> {
+    let array = batch
+        .column_by_name(name)
+        .ok_or_else(|| anyhow!("{name} column is missing"))?;
+    let values = T::from_array(array).with_context(|| format!("read {name}"))?;
+
+    Ok(values.into_iter())
+}
+
+/// Implement `IpcRow` and `Column` for a row type from the list of its fields.
+macro_rules! ipc_row {
+    ($ty:ident { $($field:ident),* $(,)? }) => {
+        impl IpcRow for $ty {
+            fn to_batch(rows: &[&Self]) -> Result<RecordBatch> {
+                RecordBatch::try_from_iter([
+                    $((stringify!($field), column(rows.iter().map(|row| &row.$field))?),)*
+                ])
+                .context(concat!("build ", stringify!($ty), " batch"))
+            }
+
+            fn from_batch(batch: &RecordBatch) -> Result<Vec<Self>> {
+                $(let mut $field = read_column(batch, stringify!($field))?;)*
+                Ok((0..batch.num_rows())
+                    .map(|_| Self {
+                        $($field: $field.next().unwrap(),)*
+                    })
+                    .collect())
+            }
+        }
+
+        impl Column for $ty {
+            fn to_array(values: &[&Self]) -> Result<ArrayRef> {
+                Ok(Arc::new(StructArray::from(Self::to_batch(values)?)))
+            }
+
+            fn from_array(array: &ArrayRef) -> Result<Vec<Self>> {
+                let array = array
+                    .as_struct_opt()
+                    .ok_or_else(|| anyhow!("expected a struct column"))?;
+                Self::from_batch(&RecordBatch::from(array.clone()))
+            }
+        }
+    };
+}
+
+macro_rules! primitive_column {
+    ($ty:ty, $arrow:ty) => {
+        impl Column for Option<$ty> {
+            fn to_array(values: &[&Self]) -> Result<ArrayRef> {
+                Ok(Arc::new(
+                    values
+                        .iter()
+                        .map(|v| **v)
+                        .collect::<PrimitiveArray<$arrow>>(),
+                ))
+            }
+
+            fn from_array(array: &ArrayRef) -> Result<Vec<Self>> {
+                let array = array
+                    .as_primitive_opt::<$arrow>()
+                    .ok_or_else(|| anyhow!("expected a {} column", stringify!($ty)))?;
+                Ok(array.iter().collect())
+            }
+        }
+
+        impl Column for $ty {
+            fn to_array(values: &[&Self]) -> Result<ArrayRef> {
+                Ok(Arc::new(PrimitiveArray::<$arrow>::from_iter_values(
+                    values.iter().map(|v| **v),
+                )))
+            }
+
+            fn from_array(array: &ArrayRef) -> Result<Vec<Self>> {
+                let array = array
+                    .as_primitive_opt::<$arrow>()
+                    .ok_or_else(|| anyhow!("expected a {} column", stringify!($ty)))?;
+                Ok(array.values().to_vec())
+            }
+        }
+    };
+}
+
+primitive_column!(i64, Int64Type);
+primitive_column!(f64, Float64Type);
+
+impl Column for Option<bool> {
+    fn to_array(values: &[&Self]) -> Result<ArrayRef> {
+        Ok(Arc::new(
+            values.iter().map(|v| **v).collect::<BooleanArray>(),
+        ))
+    }
+
+    fn from_array(array: &ArrayRef) -> Result<Vec<Self>> {
+        let array = array
+            .as_boolean_opt()
+            .ok_or_else(|| anyhow!("expected a bool column"))?;
+        Ok(array.iter().collect())
+    }
+}
+
+impl Column for Option<String> {
+    fn to_array(values: &[&Self]) -> Result<ArrayRef> {
+        Ok(Arc::new(
+            values.iter().map(|v| v.as_deref()).collect::<StringArray>(),
+        ))
+    }
+
+    fn from_array(array: &ArrayRef) -> Result<Vec<Self>> {
+        let array = array
+            .as_string_opt::<i32>()
+            .ok_or_else(|| anyhow!("expected a string column"))?;
+        Ok(array.iter().map(|v| v.map(str::to_owned)).collect())
+    }
+}
+
+impl Column for String {
+    fn to_array(values: &[&Self]) -> Result<ArrayRef> {
+        Ok(Arc::new(
+            values
+                .iter()
+                .map(|v| Some(v.as_str()))
+                .collect::<StringArray>(),
+        ))
+    }
+
+    fn from_array(array: &ArrayRef) -> Result<Vec<Self>> {
+        let array = array
+            .as_string_opt::<i32>()
+            .ok_or_else(|| anyhow!("expected a string column"))?;
+        Ok(array
+            .iter()
+            .map(|v| v.unwrap_or_default().to_owned())
+            .collect())
+    }
+}
+
+impl<T: Column> Column for Vec<T> {
+    fn to_array(values: &[&Self]) -> Result<ArrayRef> {
+        list_array(values.iter().map(|v| Some(v.as_slice())))
+    }
+
+    fn from_array(array: &ArrayRef) -> Result<Vec<Self>> {
+        Ok(read_lists(array)?
+            .into_iter()
+            .map(Option::unwrap_or_default)
+            .collect())
+    }
+}
+
+impl<T: Column> Column for Option<Vec<T>> {
+    fn to_array(values: &[&Self]) -> Result<ArrayRef> {
+        list_array(values.iter().map(|v| v.as_deref()))
+    }
+
+    fn from_array(array: &ArrayRef) -> Result<Vec<Self>> {
+        read_lists(array)
+    }
+}
+
+fn list_array<'a, T: Column + 'a>(
+    lists: impl Iterator<Item = Option<&'a [T]>>,
+) -> Result<ArrayRef> {
+    let mut offsets = vec![0i32];
+    let mut valid = Vec::new();
+    let mut items = Vec::new();
+    for list in lists {
+        valid.push(list.is_some());
+        items.extend(list.into_iter().flatten());
+        offsets.push(i32::try_from(items.len()).context("list column is too large")?);
+    }
+
+    let values = T::to_array(&items)?;
+    let field = Arc::new(Field::new_list_field(values.data_type().clone(), true));
+    let nulls = valid.contains(&false).then(|| NullBuffer::from(valid));
+    let lists = ListArray::try_new(field, OffsetBuffer::new(offsets.into()), values, nulls)
+        .context("build list column")?;
+
+    Ok(Arc::new(lists))
+}
+
+fn read_lists<T: Column>(array: &ArrayRef) -> Result<Vec<Option<Vec<T>>>> {
+    let lists = array
+        .as_list_opt::<i32>()
+        .ok_or_else(|| anyhow!("expected a list column"))?;
+    let offsets = lists.value_offsets();
+
+    let mut items = T::from_array(lists.values())?.into_iter();
+    if let Some(&first) = offsets.first().filter(|&&first| first > 0) {
+        items.nth(first as usize - 1);
+    }
+
+    Ok(offsets
+        .windows(2)
+        .enumerate()
+        .map(|(i, bounds)| {
+            let list = items
+                .by_ref()
+                .take((bounds[1] - bounds[0]) as usize)
+                .collect();
+            lists.is_valid(i).then_some(list)
+        })
+        .collect())
+}
+
+ipc_row!(Log {
+    removed,
+    log_index,
+    transaction_index,
+    transaction_hash,
+    block_hash,
+    block_number,
+    address,
+    data,
+    topics,
+});
+
+ipc_row!(Transaction {
+    block_hash,
+    block_number,
+    from_,
+    gas,
+    gas_price,
+    hash,
+    input,
+    nonce,
+    to,
+    transaction_index,
+    value,
+    v,
+    r,
+    s,
+    y_parity,
+    max_priority_fee_per_gas,
+    max_fee_per_gas,
+    chain_id,
+    access_list,
+    max_fee_per_blob_gas,
+    blob_versioned_hashes,
+    cumulative_gas_used,
+    effective_gas_price,
+    gas_used,
+    contract_address,
+    logs_bloom,
+    kind,
+    root,
+    status,
+    l1_fee,
+    l1_gas_price,
+    l1_gas_used,
+    l1_fee_scalar,
+    gas_used_for_l1,
+    blob_gas_price,
+    blob_gas_used,
+    deposit_nonce,
+    deposit_receipt_version,
+    l1_base_fee_scalar,
+    l1_blob_base_fee,
+    l1_blob_base_fee_scalar,
+    l1_block_number,
+    mint,
+    sighash,
+    source_hash,
+});
+
+ipc_row!(AccessList {
+    address,
+    storage_keys,
+});
+
+ipc_row!(Withdrawal {
+    index,
+    validator_index,
+    address,
+    amount,
+});
+
+ipc_row!(Block {
+    number,
+    hash,
+    parent_hash,
+    nonce,
+    sha3_uncles,
+    logs_bloom,
+    transactions_root,
+    state_root,
+    receipts_root,
+    miner,
+    difficulty,
+    total_difficulty,
+    extra_data,
+    size,
+    gas_limit,
+    gas_used,
+    timestamp,
+    uncles,
+    base_fee_per_gas,
+    blob_gas_used,
+    excess_blob_gas,
+    parent_beacon_block_root,
+    withdrawals_root,
+    withdrawals,
+    l1_block_number,
+    send_count,
+    send_root,
+    mix_hash,
+});
+
+ipc_row!(Trace {
+    from_,
+    to,
+    call_type,
+    gas,
+    input,
+    init,
+    value,
+    author,
+    reward_type,
+    block_hash,
+    block_number,
+    address,
+    code,
+    gas_used,
+    output,
+    subtraces,
+    trace_address,
+    transaction_hash,
+    transaction_position,
+    kind,
+    error,
+    sighash,
+    action_address,
+    balance,
+    refund_address,
+});
+
+/// Pickle a class as the tuple of its attributes, which are passed back to `_from_fields` on
+/// unpickling.
+macro_rules! reduce_fields {
+    ($ty:ident { $($field:ident),* $(,)? }) => {
+        #[pymethods]
+        impl $ty {
+            pub fn __reduce__<'py>(
+                slf: &Bound<'py, Self>,
+            ) -> PyResult<(Bound<'py, PyAny>, (Bound<'py, PyTuple>,))> {
+                let fields = PyTuple::new(
+                    slf.py(),
+                    [$(slf.getattr(stringify!($field))?,)*],
+                )?;
+                Ok((slf.get_type().getattr("_from_fields")?, (fields,)))
+            }
+
+            #[classmethod]
+            pub fn _from_fields(
+                _cls: &Bound<'_, PyType>,
+                fields: &Bound<'_, PyTuple>,
+            ) -> PyResult<Self> {
+                let mut fields = fields.iter();
+                let mut next = || {
+                    fields.next().ok_or_else(|| {
+                        PyValueError::new_err(concat!(
+                            "missing fields of ",
+                            stringify!($ty)
+                        ))
+                    })
+                };
+                Ok(Self {
+                    $($field: next()?.extract()?,)*
+                })
+            }
+        }
+    };
+}
+
+reduce_fields!(Log {
+    removed,
+    log_index,
+    transaction_index,
+    transaction_hash,
+    block_hash,
+    block_number,
+    address,
+    data,
+    topics,
+});
+
+reduce_fields!(Transaction {
+    block_hash,
+    block_number,
+    from_,
+    gas,
+    gas_price,
+    hash,
+    input,
+    nonce,
+    to,
+    transaction_index,
+    value,
+    v,
+    r,
+    s,
+    y_parity,
+    max_priority_fee_per_gas,
+    max_fee_per_gas,
+    chain_id,
+    access_list,
+    max_fee_per_blob_gas,
+    blob_versioned_hashes,
+    cumulative_gas_used,
+    effective_gas_price,
+    gas_used,
+    contract_address,
+    logs_bloom,
+    kind,
+    root,
+    status,
+    l1_fee,
+    l1_gas_price,
+    l1_gas_used,
+    l1_fee_scalar,
+    gas_used_for_l1,
+    blob_gas_price,
+    blob_gas_used,
+    deposit_nonce,
+    deposit_receipt_version,
+    l1_base_fee_scalar,
+    l1_blob_base_fee,
+    l1_blob_base_fee_scalar,
+    l1_block_number,
+    mint,
+    sighash,
+    source_hash,
+});
+
+reduce_fields!(AccessList {
+    address,
+    storage_keys,
+});
+
+reduce_fields!(Withdrawal {
+    index,
+    validator_index,
+    address,
+    amount,
+});
+
+reduce_fields!(Block {
+    number,
+    hash,
+    parent_hash,
+    nonce,
+    sha3_uncles,
+    logs_bloom,
+    transactions_root,
+    state_root,
+    receipts_root,
+    miner,
+    difficulty,
+    total_difficulty,
+    extra_data,
+    size,
+    gas_limit,
+    gas_used,
+    timestamp,
+    uncles,
+    base_fee_per_gas,
+    blob_gas_used,
+    excess_blob_gas,
+    parent_beacon_block_root,
+    withdrawals_root,
+    withdrawals,
+    l1_block_number,
+    send_count,
+    send_root,
+    mix_hash,
+});
+
+reduce_fields!(Trace {
+    from_,
+    to,
+    call_type,
+    gas,
+    input,
+    init,
+    value,
+    author,
+    reward_type,
+    block_hash,
+    block_number,
+    address,
+    code,
+    gas_used,
+    output,
+    subtraces,
+    trace_address,
+    transaction_hash,
+    transaction_position,
+    kind,
+    error,
+    sighash,
+    action_address,
+    balance,
+    refund_address,
+});
+
+reduce_fields!(Event {
+    transaction,
+    block,
+    log,
+});
+
+reduce_fields!(DecodedEvent { indexed, body });
+
+reduce_fields!(DecodedSolValue { val });
+
+reduce_fields!(RollbackGuard {
+    block_number,
+    timestamp,
+    hash,
+    first_block_number,
+    first_parent_hash,
+});
+
+reduce_fields!(Rollback { block_number });
+
+reduce_fields!(ResponseTiming {
+    fetch_wait_ms,
+    server_execution_time_ms,
+    decoded_bytes,
+    arrow_conversion_ms,
+    response_conversion_ms,
+    queued_ms,
+});
+
+#[cfg(test)]
+mod tests {
+    use hypersync_client::simple_types;
+
+    use super::*;
+    use crate::{
+        response::ConvertOptions,
+        rows::{Columns, RowFormat, ValueConverter},
+    };
+
+    fn log(index: i64, topics: Vec<Option<String>>) -> Log {
+        Log {
+            removed: Some(false),
+            log_index: Some(index),
+            transaction_index: None,
+            transaction_hash: Some(format!("0x{index:02x}")),
+            block_hash: None,
+            block_number: Some(7),
+            address: None,
+            data: Some("0x".to_owned()),
+            topics,
+        }
+    }
+
+    #[test]
+    fn test_rows_roundtrip() {
+        let logs = [
+            log(0, vec![Some("0xaa".to_owned()), None]),
+            log(1, Vec::new()),
+        ];
+        let access_lists = [
+            AccessList {
+                address: Some("0x01".to_owned()),
+                storage_keys: Some(vec!["0x02".to_owned(), "0x03".to_owned()]),
+            },
+            AccessList {
+                address: None,
+                storage_keys: None,
+            },
+        ];
+
+        let mut writer = FrameWriter::default();
+        writer.write_rows(&logs.iter().collect::<Vec<_>>()).unwrap();
+        writer
+            .write_rows(&access_lists.iter().collect::<Vec<_>>())
+            .unwrap();
+
+        let mut reader = FrameReader { bytes: &writer.buf };
+        let read_logs = reader.read_rows::<Log>().unwrap();
+        let read_access_lists = reader.read_rows::<AccessList>().unwrap();
+        assert!(reader.bytes.is_empty());
+
+        assert_eq!(read_logs.len(), 2);
+        assert_eq!(read_logs[0].topics, logs[0].topics);
+        assert!(read_logs[1].topics.is_empty());
+        assert_eq!(read_logs[1].transaction_hash.as_deref(), Some("0x01"));
+        assert_eq!(read_logs[1].removed, Some(false));
+        assert_eq!(
+            read_access_lists[0].storage_keys,
+            access_lists[0].storage_keys
+        );
+        assert_eq!(read_access_lists[1].storage_keys, None);
+    }
+
+    #[test]
+    fn test_only_object_rows_are_written() {
+        let mut writer = FrameWriter::default();
+        writer
+            .write_objects(&Rows::Objects(vec![log(0, Vec::new())]))
+            .unwrap();
+        let mut reader = FrameReader { bytes: &writer.buf };
+        assert_eq!(reader.read_rows::<Log>().unwrap().len(), 1);
+
+        let columns = Arc::new(Columns::new::<simple_types::Log>(None));
+        for row_format in [
+            RowFormat::Records,
+            RowFormat::NativeRecords,
+            RowFormat::Lazy,
+            RowFormat::NativeLazy,
+        ] {
+            let options = ConvertOptions {
+                row_format,
+                ..Default::default()
+            };
+            let rows = Rows::<Log>::convert(
+                Vec::new(),
+                &options,
+                &columns,
+                &ValueConverter::new(&options),
+            );
+            assert!(
+                FrameWriter::default().write_objects(&rows).is_err(),
+                "{row_format:?}"
+            );
+        }
+    }
+}
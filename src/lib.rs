@@ -1,4 +1,4 @@
-use anyhow::{Context, Result};
+use anyhow::Result;
 use mimalloc::MiMalloc;
 use pyo3::prelude::*;
 use pyo3::types::PyModule;
@@ -7,35 +7,84 @@ use pyo3_async_runtimes::tokio::future_into_py;
 #[global_allocator]
 static GLOBAL: MiMalloc = MiMalloc;
 
-use std::sync::Arc;
-
 mod arrow_ffi;
+mod checkpoint;
+mod client;
+mod column_layout;
 mod config;
 mod decode;
+mod decode_arrow;
 mod decode_call;
+mod event_join;
+mod ipc;
+mod metrics;
+mod multi;
+mod parquet_sink;
 mod query;
+mod reorg;
 mod response;
+mod rows;
+mod shard;
+mod stream;
+mod sync_client;
+mod tail;
 mod types;
 
-use arrow_ffi::response_to_pyarrow;
+use arrow_ffi::ArrowTable;
+use client::ClientCore;
 use config::{ClientConfig, StreamConfig};
 use decode::Decoder;
 use decode_call::CallDecoder;
+use metrics::{ClientMetrics, ResponseTiming};
 use query::Query;
 use response::{
-    convert_event_response, convert_response, ArrowStream, EventStream, QueryResponseStream,
+    ArrowBatch, ArrowBatchStream, ArrowEventResponse, ArrowEventStream, ArrowResponse, ArrowStream,
+    ArrowStreamTable, EventResponse, EventStream, MultiQueryStream, QueryResponse,
+    QueryResponseStream,
+};
+use rows::{Record, RowSequence, RowView};
+use sync_client::SyncHypersyncClient;
+use types::{
+    AccessList, Block, DecodedEvent, DecodedSolValue, Event, Log, RateLimitInfo, Rollback,
+    RollbackGuard, Trace, Transaction, Withdrawal,
 };
-use types::RateLimitInfo;
 
 #[pymodule]
 fn hypersync(m: &Bound<'_, PyModule>) -> PyResult<()> {
     m.add_class::<HypersyncClient>()?;
+    m.add_class::<SyncHypersyncClient>()?;
     m.add_class::<Decoder>()?;
     m.add_class::<CallDecoder>()?;
     m.add_class::<ArrowStream>()?;
+    m.add_class::<ArrowStreamTable>()?;
+    m.add_class::<ArrowBatchStream>()?;
+    m.add_class::<ArrowBatch>()?;
+    m.add_class::<ArrowEventStream>()?;
+    m.add_class::<ArrowEventResponse>()?;
+    m.add_class::<ArrowTable>()?;
+    m.add_class::<ArrowResponse>()?;
+    m.add_class::<QueryResponse>()?;
+    m.add_class::<EventResponse>()?;
     m.add_class::<EventStream>()?;
     m.add_class::<QueryResponseStream>()?;
+    m.add_class::<MultiQueryStream>()?;
     m.add_class::<RateLimitInfo>()?;
+    m.add_class::<Rollback>()?;
+    m.add_class::<RollbackGuard>()?;
+    m.add_class::<Log>()?;
+    m.add_class::<Transaction>()?;
+    m.add_class::<Block>()?;
+    m.add_class::<Trace>()?;
+    m.add_class::<Withdrawal>()?;
+    m.add_class::<AccessList>()?;
+    m.add_class::<Event>()?;
+    m.add_class::<DecodedEvent>()?;
+    m.add_class::<DecodedSolValue>()?;
+    m.add_class::<ResponseTiming>()?;
+    m.add_class::<ClientMetrics>()?;
+    m.add_class::<Record>()?;
+    m.add_class::<RowSequence>()?;
+    m.add_class::<RowView>()?;
     m.add_function(wrap_pyfunction!(decode::signature_to_topic0, m)?)?;
 
     Ok(())
@@ -43,7 +92,7 @@ fn hypersync(m: &Bound<'_, PyModule>) -> PyResult<()> {
 
 #[pyclass]
 pub struct HypersyncClient {
-    inner: Arc<hypersync_client::Client>,
+    core: ClientCore,
 }
 
 #[pymethods]
@@ -51,31 +100,26 @@ impl HypersyncClient {
     /// Create a new client with given config
     #[new]
     fn new(config: ClientConfig) -> Result<HypersyncClient> {
-        env_logger::try_init().ok();
-
-        let config = config.try_convert().context("parse config")?;
-
         Ok(HypersyncClient {
-            inner: Arc::new(hypersync_client::Client::new(config).context("create client")?),
+            core: ClientCore::new(config)?,
         })
     }
 
+    /// Counters aggregated over all responses delivered by this client
+    pub fn metrics(&self) -> ClientMetrics {
+        self.core.metrics()
+    }
+
     /// Get the height of the source hypersync instance
     pub fn get_height<'py>(&'py self, py: Python<'py>) -> PyResult<Bound<'py, PyAny>> {
-        let inner = Arc::clone(&self.inner);
-        future_into_py(py, async move {
-            let height: u64 = inner.get_height().await?;
-            Ok(height)
-        })
+        let core = self.core.clone();
+        future_into_py(py, async move { Ok(core.get_height().await?) })
     }
 
     /// Get the chain_id of the source hypersync instance
     pub fn get_chain_id<'py>(&'py self, py: Python<'py>) -> PyResult<Bound<'py, PyAny>> {
-        let inner = Arc::clone(&self.inner);
-        future_into_py(py, async move {
-            let chain_id: u64 = inner.get_chain_id().await?;
-            Ok(chain_id)
-        })
+        let core = self.core.clone();
+        future_into_py(py, async move { Ok(core.get_chain_id().await?) })
     }
 
     pub fn collect<'py>(
@@ -84,21 +128,8 @@ impl HypersyncClient {
         config: StreamConfig,
         py: Python<'py>,
     ) -> PyResult<Bound<'py, PyAny>> {
-        let inner = Arc::clone(&self.inner);
-
-        future_into_py(py, async move {
-            let query = query.try_convert().context("parse query")?;
-            let config = config.try_convert().context("parse config")?;
-
-            let res = inner
-                .collect(query, config)
-                .await
-                .context("collect arrow")?;
-
-            let res = convert_response(res).context("convert response to pyarrow")?;
-
-            Ok(res)
-        })
+        let core = self.core.clone();
+        future_into_py(py, async move { Ok(core.collect(query, config).await?) })
     }
 
     pub fn collect_events<'py>(
@@ -107,21 +138,11 @@ impl HypersyncClient {
         config: StreamConfig,
         py: Python<'py>,
     ) -> PyResult<Bound<'py, PyAny>> {
-        let inner = Arc::clone(&self.inner);
-
-        future_into_py(py, async move {
-            let query = query.try_convert().context("parse query")?;
-            let config = config.try_convert().context("parse config")?;
-
-            let res = inner
-                .collect_events(query, config)
-                .await
-                .context("collect arrow")?;
-
-            let res = convert_event_response(res).context("convert response to pyarrow")?;
-
-            Ok(res)
-        })
+        let core = self.core.clone();
+        future_into_py(
+            py,
+            async move { Ok(core.collect_events(query, config).await?) },
+        )
     }
 
     pub fn collect_arrow<'py>(
@@ -130,20 +151,23 @@ impl HypersyncClient {
         config: StreamConfig,
         py: Python<'py>,
     ) -> PyResult<Bound<'py, PyAny>> {
-        let inner = Arc::clone(&self.inner);
+        let core = self.core.clone();
+        future_into_py(
+            py,
+            async move { Ok(core.collect_arrow(query, config).await?) },
+        )
+    }
 
+    /// Collect the logs of `query` joined with their transactions and blocks into one table.
+    pub fn collect_events_arrow<'py>(
+        &'py self,
+        query: Query,
+        config: StreamConfig,
+        py: Python<'py>,
+    ) -> PyResult<Bound<'py, PyAny>> {
+        let core = self.core.clone();
         future_into_py(py, async move {
-            let query = query.try_convert().context("parse query")?;
-            let config = config.try_convert().context("parse config")?;
-
-            let res = inner
-                .collect_arrow(query, config)
-                .await
-                .context("collect arrow")?;
-
-            let res = response_to_pyarrow(res).context("convert response to pyarrow")?;
-
-            Ok(res)
+            Ok(core.collect_events_arrow(query, config).await?)
         })
     }
 
@@ -154,33 +178,15 @@ impl HypersyncClient {
         config: StreamConfig,
         py: Python<'py>,
     ) -> PyResult<Bound<'py, PyAny>> {
-        let inner = Arc::clone(&self.inner);
-
+        let core = self.core.clone();
         future_into_py(py, async move {
-            let query = query.try_convert().context("parse query")?;
-            let config = config.try_convert().context("parse config")?;
-
-            inner
-                .collect_parquet(&path, query, config)
-                .await
-                .context("collect parquet")?;
-
-            Ok(())
+            Ok(core.collect_parquet(path, query, config).await?)
         })
     }
 
     pub fn get<'py>(&'py self, query: Query, py: Python<'py>) -> PyResult<Bound<'py, PyAny>> {
-        let inner = Arc::clone(&self.inner);
-
-        future_into_py(py, async move {
-            let query = query.try_convert().context("parse query")?;
-
-            let res = inner.get(&query).await.context("get arrow")?;
-
-            let res = convert_response(res).context("convert response to pyarrow")?;
-
-            Ok(res)
-        })
+        let core = self.core.clone();
+        future_into_py(py, async move { Ok(core.get(query).await?) })
     }
 
     pub fn get_events<'py>(
@@ -188,31 +194,13 @@ impl HypersyncClient {
         query: Query,
         py: Python<'py>,
     ) -> PyResult<Bound<'py, PyAny>> {
-        let inner = Arc::clone(&self.inner);
-
-        future_into_py(py, async move {
-            let query = query.try_convert().context("parse query")?;
-
-            let res = inner.get_events(query).await.context("get arrow")?;
-
-            let res = convert_event_response(res).context("convert response to pyarrow")?;
-
-            Ok(res)
-        })
+        let core = self.core.clone();
+        future_into_py(py, async move { Ok(core.get_events(query).await?) })
     }
 
     pub fn get_arrow<'py>(&'py self, query: Query, py: Python<'py>) -> PyResult<Bound<'py, PyAny>> {
-        let inner = Arc::clone(&self.inner);
-
-        future_into_py(py, async move {
-            let query = query.try_convert().context("parse query")?;
-
-            let res = inner.get_arrow(&query).await.context("get arrow")?;
-
-            let res = response_to_pyarrow(res).context("convert response to pyarrow")?;
-
-            Ok(res)
-        })
+        let core = self.core.clone();
+        future_into_py(py, async move { Ok(core.get_arrow(query).await?) })
     }
 
     /// Get blockchain data for a single query, with rate limit info
@@ -221,35 +209,25 @@ impl HypersyncClient {
         query: Query,
         py: Python<'py>,
     ) -> PyResult<Bound<'py, PyAny>> {
-        let inner = Arc::clone(&self.inner);
-
-        future_into_py(py, async move {
-            let query = query.try_convert().context("parse query")?;
-
-            let res = inner
-                .get_with_rate_limit(&query)
-                .await
-                .context("get with rate limit")?;
-
-            let response = convert_response(res.response).context("convert response")?;
-            let rate_limit: RateLimitInfo = res.rate_limit.into();
-
-            Ok((response, rate_limit))
-        })
+        let core = self.core.clone();
+        future_into_py(
+            py,
+            async move { Ok(core.get_with_rate_limit(query).await?) },
+        )
     }
 
     /// Get the most recently observed rate limit information.
     /// Returns None if no requests have been made yet.
     pub fn rate_limit_info(&self) -> Option<RateLimitInfo> {
-        self.inner.rate_limit_info().map(|info| info.into())
+        self.core.rate_limit_info()
     }
 
     /// Wait until the current rate limit window resets.
     /// Returns immediately if no rate limit info observed or quota available.
     pub fn wait_for_rate_limit<'py>(&'py self, py: Python<'py>) -> PyResult<Bound<'py, PyAny>> {
-        let inner = Arc::clone(&self.inner);
+        let core = self.core.clone();
         future_into_py(py, async move {
-            inner.wait_for_rate_limit().await;
+            core.wait_for_rate_limit().await;
             Ok(())
         })
     }
@@ -260,19 +238,8 @@ impl HypersyncClient {
         config: StreamConfig,
         py: Python<'py>,
     ) -> PyResult<Bound<'py, PyAny>> {
-        let inner = Arc::clone(&self.inner);
-
-        future_into_py(py, async move {
-            let query = query.try_convert().context("parse query")?;
-            let config = config.try_convert().context("parse config")?;
-
-            let inner = inner
-                .stream(query, config)
-                .await
-                .context("start inner stream")?;
-
-            Ok(QueryResponseStream::new(inner))
-        })
+        let core = self.core.clone();
+        future_into_py(py, async move { Ok(core.stream(query, config).await?) })
     }
 
     pub fn stream_events<'py>(
@@ -281,19 +248,11 @@ impl HypersyncClient {
         config: StreamConfig,
         py: Python<'py>,
     ) -> PyResult<Bound<'py, PyAny>> {
-        let inner = Arc::clone(&self.inner);
-
-        future_into_py(py, async move {
-            let query = query.try_convert().context("parse query")?;
-            let config = config.try_convert().context("parse config")?;
-
-            let inner = inner
-                .stream_events(query, config)
-                .await
-                .context("start inner stream")?;
-
-            Ok(EventStream::new(inner))
-        })
+        let core = self.core.clone();
+        future_into_py(
+            py,
+            async move { Ok(core.stream_events(query, config).await?) },
+        )
     }
 
     pub fn stream_arrow<'py>(
@@ -302,18 +261,54 @@ impl HypersyncClient {
         config: StreamConfig,
         py: Python<'py>,
     ) -> PyResult<Bound<'py, PyAny>> {
-        let inner = Arc::clone(&self.inner);
+        let core = self.core.clone();
+        future_into_py(
+            py,
+            async move { Ok(core.stream_arrow(query, config).await?) },
+        )
+    }
 
+    /// Stream the logs of `query` joined with their transactions and blocks, one table per
+    /// response.
+    pub fn stream_events_arrow<'py>(
+        &'py self,
+        query: Query,
+        config: StreamConfig,
+        py: Python<'py>,
+    ) -> PyResult<Bound<'py, PyAny>> {
+        let core = self.core.clone();
         future_into_py(py, async move {
-            let query = query.try_convert().context("parse query")?;
-            let config = config.try_convert().context("parse config")?;
-
-            let inner = inner
-                .stream_arrow(query, config)
-                .await
-                .context("start inner stream")?;
+            Ok(core.stream_events_arrow(query, config).await?)
+        })
+    }
 
-            Ok(ArrowStream::new(inner))
+    /// Like `stream_arrow`, but delivers every record batch of the responses on its own as
+    /// soon as its response arrives, instead of a table per response.
+    pub fn stream_arrow_batches<'py>(
+        &'py self,
+        query: Query,
+        config: StreamConfig,
+        py: Python<'py>,
+    ) -> PyResult<Bound<'py, PyAny>> {
+        let core = self.core.clone();
+        future_into_py(py, async move {
+            Ok(core.stream_arrow_batches(query, config).await?)
         })
     }
+
+    /// Stream many queries at once, sharing one request concurrency limit and one buffer.
+    ///
+    /// Responses are tagged with the index of their query in `queries`.
+    pub fn stream_many<'py>(
+        &'py self,
+        queries: Vec<Query>,
+        config: StreamConfig,
+        py: Python<'py>,
+    ) -> PyResult<Bound<'py, PyAny>> {
+        let core = self.core.clone();
+        future_into_py(
+            py,
+            async move { Ok(core.stream_many(queries, config).await?) },
+        )
+    }
 }
@@ -0,0 +1,187 @@
+//! Per-response timings and client-wide counters.
+
+use std::future::Future;
+use std::sync::atomic::{AtomicU64, Ordering};
+use std::time::{Duration, Instant};
+
+use anyhow::Result;
+use pyo3::pyclass;
+use serde::{Deserialize, Serialize};
+
+use crate::{
+    response::{ArrowBatch, ArrowEventResponse, ArrowResponse, EventResponse, QueryResponse},
+    stream::Message,
+};
+
+/// Where the time went for a single response.
+#[pyclass(module = "hypersync.hypersync")]
+#[pyo3(get_all)]
+#[derive(Default, Clone, Debug, Serialize, Deserialize)]
+pub struct ResponseTiming {
+    /// Time spent waiting for the inner client to deliver the response. For single requests this
+    /// is the whole request, for streams it is only the time the stream waited on the inner
+    /// client, which is zero if the inner client had already fetched the response.
+    pub fetch_wait_ms: f64,
+    /// Time it took the hypersync instance to execute the query.
+    pub server_execution_time_ms: u64,
+    /// Estimated in-memory size of the decoded response. This is not the number of bytes
+    /// received over the network, which the inner client doesn't report.
+    pub decoded_bytes: u64,
+    /// Time spent exporting arrow data to pyarrow.
+    pub arrow_conversion_ms: f64,
+    /// Time spent converting the response of the inner client into the returned response type.
+    pub response_conversion_ms: f64,
+    /// Time the response waited in the stream buffer until it was received.
+    pub queued_ms: f64,
+}
+
+/// Responses that carry a `ResponseTiming`.
+pub trait Timed {
+    fn timing_mut(&mut self) -> Option<&mut ResponseTiming>;
+}
+
+impl Timed for QueryResponse {
+    fn timing_mut(&mut self) -> Option<&mut ResponseTiming> {
+        Some(&mut self.timing)
+    }
+}
+
+impl Timed for EventResponse {
+    fn timing_mut(&mut self) -> Option<&mut ResponseTiming> {
+        Some(&mut self.timing)
+    }
+}
+
+impl Timed for ArrowResponse {
+    fn timing_mut(&mut self) -> Option<&mut ResponseTiming> {
+        Some(&mut self.timing)
+    }
+}
+
+impl Timed for ArrowEventResponse {
+    fn timing_mut(&mut self) -> Option<&mut ResponseTiming> {
+        Some(&mut self.timing)
+    }
+}
+
+impl Timed for ArrowBatch {
+    fn timing_mut(&mut self) -> Option<&mut ResponseTiming> {
+        Some(&mut self.timing)
+    }
+}
+
+impl<T: Timed> Timed for Message<T> {
+    fn timing_mut(&mut self) -> Option<&mut ResponseTiming> {
+        match self {
+            Self::Response(resp) => resp.timing_mut(),
+            Self::Rollback(_) => None,
+        }
+    }
+}
+
+/// Responses of `stream_many` tagged with their query index.
+impl<T: Timed> Timed for (usize, T) {
+    fn timing_mut(&mut self) -> Option<&mut ResponseTiming> {
+        self.1.timing_mut()
+    }
+}
+
+pub fn millis(d: Duration) -> f64 {
+    d.as_secs_f64() * 1000.0
+}
+
+/// Counters aggregated over all responses delivered by a client.
+#[derive(Default, Debug)]
+pub struct Metrics {
+    responses: AtomicU64,
+    errors: AtomicU64,
+    fetch_wait_us: AtomicU64,
+    server_execution_time_ms: AtomicU64,
+    decoded_bytes: AtomicU64,
+    arrow_conversion_us: AtomicU64,
+    response_conversion_us: AtomicU64,
+    queued_us: AtomicU64,
+}
+
+impl Metrics {
+    pub fn record(&self, timing: &ResponseTiming) {
+        fn add_ms(counter: &AtomicU64, ms: f64) {
+            counter.fetch_add((ms * 1000.0) as u64, Ordering::Relaxed);
+        }
+
+        self.responses.fetch_add(1, Ordering::Relaxed);
+        add_ms(&self.fetch_wait_us, timing.fetch_wait_ms);
+        self.server_execution_time_ms
+            .fetch_add(timing.server_execution_time_ms, Ordering::Relaxed);
+        self.decoded_bytes
+            .fetch_add(timing.decoded_bytes, Ordering::Relaxed);
+        add_ms(&self.arrow_conversion_us, timing.arrow_conversion_ms);
+        add_ms(&self.response_conversion_us, timing.response_conversion_ms);
+        add_ms(&self.queued_us, timing.queued_ms);
+    }
+
+    pub fn record_error(&self) {
+        self.errors.fetch_add(1, Ordering::Relaxed);
+    }
+
+    /// Run a request and measure how long it took, failures are counted as errors.
+    pub async fn time<T>(&self, request: impl Future<Output = Result<T>>) -> Result<(T, Duration)> {
+        let start = Instant::now();
+        match request.await {
+            Ok(res) => Ok((res, start.elapsed())),
+            Err(e) => {
+                self.record_error();
+                Err(e)
+            }
+        }
+    }
+
+    /// Fill in the timing of a response that was not delivered through a stream and record it.
+    pub fn observe<T: Timed>(&self, resp: &mut T, latency: Duration, bytes: usize) {
+        if let Some(timing) = resp.timing_mut() {
+            timing.fetch_wait_ms = millis(latency);
+            timing.decoded_bytes = bytes as u64;
+            self.record(timing);
+        }
+    }
+
+    pub fn snapshot(&self) -> ClientMetrics {
+        fn ms(counter: &AtomicU64) -> f64 {
+            counter.load(Ordering::Relaxed) as f64 / 1000.0
+        }
+
+        ClientMetrics {
+            responses_total: self.responses.load(Ordering::Relaxed),
+            errors_total: self.errors.load(Ordering::Relaxed),
+            fetch_wait_ms_total: ms(&self.fetch_wait_us),
+            server_execution_time_ms_total: self.server_execution_time_ms.load(Ordering::Relaxed),
+            decoded_bytes_total: self.decoded_bytes.load(Ordering::Relaxed),
+            arrow_conversion_ms_total: ms(&self.arrow_conversion_us),
+            response_conversion_ms_total: ms(&self.response_conversion_us),
+            queued_ms_total: ms(&self.queued_us),
+        }
+    }
+}
+
+/// Snapshot of the counters of a client, all values only ever increase.
+#[pyclass]
+#[pyo3(get_all)]
+#[derive(Clone, Debug)]
+pub struct ClientMetrics {
+    /// Number of responses delivered.
+    pub responses_total: u64,
+    /// Number of failed requests and streams.
+    pub errors_total: u64,
+    /// Sum of `ResponseTiming.fetch_wait_ms`.
+    pub fetch_wait_ms_total: f64,
+    /// Sum of `ResponseTiming.server_execution_time_ms`.
+    pub server_execution_time_ms_total: u64,
+    /// Sum of `ResponseTiming.decoded_bytes`.
+    pub decoded_bytes_total: u64,
+    /// Sum of `ResponseTiming.arrow_conversion_ms`.
+    pub arrow_conversion_ms_total: f64,
+    /// Sum of `ResponseTiming.response_conversion_ms`.
+    pub response_conversion_ms_total: f64,
+    /// Sum of `ResponseTiming.queued_ms`.
+    pub queued_ms_total: f64,
+}
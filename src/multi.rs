@@ -0,0 +1,279 @@
+//! Fan-in of many queries into a single stream.
+//!
+//! Every query is split into block ranges that are paginated by their own tasks, but all of
+//! them share one client, one limit on the ranges in flight and the buffer (and memory budget)
+//! of a single converted stream.
+
+use std::collections::VecDeque;
+use std::sync::Arc;
+
+use anyhow::{anyhow, Context, Result};
+use hypersync_client::{net_types, Client, QueryResponse};
+use tokio::sync::{mpsc, OwnedSemaphorePermit, Semaphore};
+use tokio::task::JoinHandle;
+
+use crate::{config::StreamConfig, query::Query, tail::DEFAULT_POLL_INTERVAL};
+
+/// Number of ranges in flight across all queries if the config doesn't set `concurrency`.
+const DEFAULT_CONCURRENCY: usize = 10;
+
+/// Number of blocks in a range of a query if the config doesn't set `batch_size`.
+const DEFAULT_BATCH_SIZE: u64 = 1000;
+
+/// Options of `stream_many`, taken from the `StreamConfig` shared by all queries.
+#[derive(Clone, Copy, Debug)]
+pub struct MultiOptions {
+    /// Ranges in flight across all queries, each of them runs one request at a time.
+    pub concurrency: usize,
+    /// Blocks per range, ranges of a query are requested concurrently.
+    pub batch_size: u64,
+    pub max_num_blocks: Option<u64>,
+    pub max_num_transactions: Option<u64>,
+    pub max_num_logs: Option<u64>,
+    pub max_num_traces: Option<u64>,
+}
+
+impl MultiOptions {
+    /// Get the options of `stream_many` from `config`, rejecting options that it can't honour.
+    pub fn new(config: &StreamConfig) -> Result<Self> {
+        let unsupported = [
+            ("reverse", config.reverse == Some(true)),
+            ("checkpoint", config.checkpoint.is_some()),
+            ("tail", config.tail == Some(true)),
+            ("shard_count", config.shard_count.is_some()),
+            ("column_mapping", config.column_mapping.is_some()),
+            ("event_signature", config.event_signature.is_some()),
+            ("hex_output", config.hex_output.is_some()),
+            ("max_batch_size", config.max_batch_size.is_some()),
+            ("min_batch_size", config.min_batch_size.is_some()),
+            (
+                "response_bytes_ceiling",
+                config.response_bytes_ceiling.is_some(),
+            ),
+            (
+                "response_bytes_floor",
+                config.response_bytes_floor.is_some(),
+            ),
+        ];
+        if let Some((name, _)) = unsupported.iter().find(|(_, set)| *set) {
+            return Err(anyhow!("{name} is not supported by stream_many"));
+        }
+
+        let concurrency = config
+            .concurrency
+            .map(usize::try_from)
+            .transpose()
+            .context("convert concurrency")?
+            .unwrap_or(DEFAULT_CONCURRENCY);
+        if concurrency == 0 {
+            return Err(anyhow!("concurrency must be greater than zero"));
+        }
+        let batch_size = config
+            .batch_size
+            .map(u64::try_from)
+            .transpose()
+            .context("convert batch_size")?
+            .unwrap_or(DEFAULT_BATCH_SIZE);
+        if batch_size == 0 {
+            return Err(anyhow!("batch_size must be greater than zero"));
+        }
+
+        let limit = |value: Option<i64>, name: &str| {
+            value
+                .map(u64::try_from)
+                .transpose()
+                .with_context(|| format!("convert {name}"))
+        };
+
+        Ok(Self {
+            concurrency,
+            batch_size,
+            max_num_blocks: limit(config.max_num_blocks, "max_num_blocks")?,
+            max_num_transactions: limit(config.max_num_transactions, "max_num_transactions")?,
+            max_num_logs: limit(config.max_num_logs, "max_num_logs")?,
+            max_num_traces: limit(config.max_num_traces, "max_num_traces")?,
+        })
+    }
+
+    /// Apply the response size limits of the config to `query`, unless it sets its own.
+    pub fn apply_limits(&self, query: &mut Query) {
+        query.max_num_blocks = query.max_num_blocks.or(self.max_num_blocks);
+        query.max_num_transactions = query.max_num_transactions.or(self.max_num_transactions);
+        query.max_num_logs = query.max_num_logs.or(self.max_num_logs);
+        query.max_num_traces = query.max_num_traces.or(self.max_num_traces);
+    }
+}
+
+/// Stream all of `queries` with at most `options.concurrency` block ranges in flight at a time.
+///
+/// Responses are tagged with the index of the query they belong to. Responses of a single query
+/// are delivered in order, responses of different queries are interleaved as they arrive.
+///
+/// Ranges hold a share of the concurrency limit until all of their responses are forwarded to
+/// the returned channel, which holds `prefetch` responses. Each range buffers at most two
+/// responses, so the data buffered ahead of the channel is bounded by the limit and not by the
+/// number of queries.
+pub fn stream_many(
+    client: Arc<Client>,
+    queries: Vec<net_types::Query>,
+    options: MultiOptions,
+    prefetch: usize,
+) -> mpsc::Receiver<Result<(usize, QueryResponse)>> {
+    let (tx, rx) = mpsc::channel(prefetch.max(1));
+    let semaphore = Arc::new(Semaphore::new(options.concurrency));
+
+    for (query_id, query) in queries.into_iter().enumerate() {
+        let client = Arc::clone(&client);
+        let semaphore = Arc::clone(&semaphore);
+        let tx = tx.clone();
+        tokio::spawn(async move {
+            if let Err(e) = run_query(client, semaphore, query_id, query, options, &tx).await {
+                let _ = tx
+                    .send(Err(e.context(format!("run query {query_id}"))))
+                    .await;
+            }
+        });
+    }
+
+    rx
+}
+
+/// A block range of a query that is being paginated by its own task.
+struct Range {
+    pages: mpsc::Receiver<Result<QueryResponse>>,
+    task: JoinHandle<()>,
+    /// Share of the concurrency limit, held until all pages of the range are forwarded.
+    _permit: OwnedSemaphorePermit,
+}
+
+impl Drop for Range {
+    fn drop(&mut self) {
+        self.task.abort();
+    }
+}
+
+/// Run `query` from its from_block to its to_block, or the current height of the server if it
+/// has none.
+///
+/// The block range is split into ranges of `options.batch_size` blocks that are requested
+/// concurrently, as far as the shared limit allows, and their responses are sent in order.
+async fn run_query(
+    client: Arc<Client>,
+    semaphore: Arc<Semaphore>,
+    query_id: usize,
+    query: net_types::Query,
+    options: MultiOptions,
+    tx: &mpsc::Sender<Result<(usize, QueryResponse)>>,
+) -> Result<()> {
+    let to_block = match query.to_block {
+        Some(to_block) => to_block,
+        None => {
+            let _permit = semaphore
+                .acquire()
+                .await
+                .expect("semaphore is never closed");
+            client.get_height().await.context("get height")?
+        }
+    };
+
+    let mut ranges = (query.from_block..to_block)
+        .step_by(usize::try_from(options.batch_size).unwrap_or(usize::MAX))
+        .map(|start| {
+            (
+                start,
+                to_block.min(start.saturating_add(options.batch_size)),
+            )
+        })
+        .peekable();
+    let mut in_flight: VecDeque<Range> = VecDeque::new();
+
+    loop {
+        while ranges.peek().is_some() {
+            // Only wait for the limit if no range of this query holds a share of it, ranges
+            // that are already running might need this task to drain them first.
+            let permit = if in_flight.is_empty() {
+                tokio::select! {
+                    permit = Arc::clone(&semaphore).acquire_owned() => {
+                        permit.expect("semaphore is never closed")
+                    }
+                    _ = tx.closed() => return Ok(()),
+                }
+            } else {
+                match Arc::clone(&semaphore).try_acquire_owned() {
+                    Ok(permit) => permit,
+                    Err(_) => break,
+                }
+            };
+            let (from_block, to_block) = ranges.next().expect("checked by peek");
+
+            let mut query = query.clone();
+            query.from_block = from_block;
+            query.to_block = Some(to_block);
+            let (pages_tx, pages) = mpsc::channel(1);
+            in_flight.push_back(Range {
+                pages,
+                task: tokio::spawn(run_range(Arc::clone(&client), query, pages_tx)),
+                _permit: permit,
+            });
+        }
+
+        let Some(range) = in_flight.front_mut() else {
+            return Ok(());
+        };
+
+        let page = tokio::select! {
+            page = range.pages.recv() => page,
+            _ = tx.closed() => return Ok(()),
+        };
+        match page {
+            Some(Ok(resp)) => {
+                if tx.send(Ok((query_id, resp))).await.is_err() {
+                    return Ok(());
+                }
+            }
+            Some(Err(e)) => return Err(e),
+            None => {
+                // The task dropped its sender, it either finished or panicked.
+                (&mut range.task).await.context("join range task")?;
+                in_flight.pop_front();
+            }
+        }
+    }
+}
+
+/// Paginate `query` until its to_block, waiting for the server to reach it if needed.
+///
+/// Pages are sent to `pages` as they arrive, the task stops after sending an error or when the
+/// receiver is dropped.
+async fn run_range(
+    client: Arc<Client>,
+    mut query: net_types::Query,
+    pages: mpsc::Sender<Result<QueryResponse>>,
+) {
+    let to_block = query.to_block.expect("ranges always have a to_block");
+
+    loop {
+        let resp = match client.get(&query).await {
+            Ok(resp) => resp,
+            Err(e) => {
+                let _ = pages.send(Err(e)).await;
+                return;
+            }
+        };
+
+        let next_block = resp.next_block;
+        let stalled = next_block <= query.from_block;
+        if !stalled && pages.send(Ok(resp)).await.is_err() {
+            return;
+        }
+        if next_block >= to_block {
+            return;
+        }
+
+        if stalled {
+            // The server hasn't reached the range yet.
+            tokio::time::sleep(DEFAULT_POLL_INTERVAL).await;
+        }
+        query.from_block = next_block.max(query.from_block);
+    }
+}
@@ -0,0 +1,217 @@
+//! Incremental parquet output.
+//!
+//! Arrow responses are written to parquet files as they arrive. Row groups are flushed by the
+//! writer once they reach the configured size, and files are only renamed to their final name
+//! once they are complete, so every `*.parquet` file in the output directory can be read while
+//! the collection is still running.
+
+use std::fs::{self, File};
+use std::path::{Path, PathBuf};
+
+use anyhow::{anyhow, Context, Result};
+use arrow::array::RecordBatch;
+use parquet::{
+    arrow::ArrowWriter,
+    basic::{Compression, GzipLevel, ZstdLevel},
+    file::properties::WriterProperties,
+};
+use pyo3::prelude::*;
+
+#[derive(Default, Clone, FromPyObject)]
+pub struct ParquetConfig {
+    /// "uncompressed", "snappy", "gzip", "lz4" or "zstd", defaults to "uncompressed".
+    pub compression: Option<String>,
+    /// Level for gzip and zstd compression.
+    pub compression_level: Option<i64>,
+    /// Maximum number of rows in a row group.
+    pub row_group_size: Option<i64>,
+    /// Dictionary encode columns, defaults to true.
+    pub dictionary: Option<bool>,
+    /// Start a new file at every multiple of this many blocks.
+    pub rotate_blocks: Option<i64>,
+    /// Start a new file once a file reaches this many bytes.
+    pub rotate_bytes: Option<i64>,
+}
+
+#[derive(Clone, Debug, Default)]
+pub struct ParquetOptions {
+    pub props: WriterProperties,
+    pub rotate_blocks: Option<u64>,
+    pub rotate_bytes: Option<usize>,
+}
+
+impl ParquetConfig {
+    pub fn try_convert(&self) -> Result<ParquetOptions> {
+        let mut props = WriterProperties::builder();
+
+        if let Some(compression) = &self.compression {
+            props = props.set_compression(
+                parse_compression(compression, self.compression_level)
+                    .context("parse compression")?,
+            );
+        }
+        if let Some(row_group_size) = self.row_group_size {
+            let row_group_size =
+                usize::try_from(row_group_size).context("convert row_group_size")?;
+            if row_group_size == 0 {
+                return Err(anyhow!("row_group_size must be greater than zero"));
+            }
+            props = props.set_max_row_group_size(row_group_size);
+        }
+        if let Some(dictionary) = self.dictionary {
+            props = props.set_dictionary_enabled(dictionary);
+        }
+
+        let rotate_blocks = self
+            .rotate_blocks
+            .map(u64::try_from)
+            .transpose()
+            .context("convert rotate_blocks")?
+            .filter(|&n| n > 0);
+        let rotate_bytes = self
+            .rotate_bytes
+            .map(usize::try_from)
+            .transpose()
+            .context("convert rotate_bytes")?
+            .filter(|&n| n > 0);
+
+        Ok(ParquetOptions {
+            props: props.build(),
+            rotate_blocks,
+            rotate_bytes,
+        })
+    }
+}
+
+impl ParquetOptions {
+    /// Block at which the file containing `block` ends, if files are rotated by block range.
+    pub fn rotation_boundary(&self, block: u64) -> Option<u64> {
+        self.rotate_blocks.map(|n| (block / n + 1) * n)
+    }
+}
+
+fn parse_compression(name: &str, level: Option<i64>) -> Result<Compression> {
+    match name {
+        "uncompressed" => Ok(Compression::UNCOMPRESSED),
+        "snappy" => Ok(Compression::SNAPPY),
+        "lz4" => Ok(Compression::LZ4_RAW),
+        "gzip" => {
+            let level = match level {
+                Some(level) => GzipLevel::try_new(u32::try_from(level).context("convert level")?)
+                    .context("gzip level")?,
+                None => GzipLevel::default(),
+            };
+            Ok(Compression::GZIP(level))
+        }
+        "zstd" => {
+            let level = match level {
+                Some(level) => ZstdLevel::try_new(i32::try_from(level).context("convert level")?)
+                    .context("zstd level")?,
+                None => ZstdLevel::default(),
+            };
+            Ok(Compression::ZSTD(level))
+        }
+        other => Err(anyhow!("unknown compression: {other}")),
+    }
+}
+
+/// Parquet files of a single block range, one per table.
+pub struct RangeFiles {
+    dir: PathBuf,
+    props: WriterProperties,
+    range_start: u64,
+    /// Open writers by table name, files are named after their range once it is finished.
+    tables: Vec<(&'static str, PathBuf, ArrowWriter<File>)>,
+}
+
+impl RangeFiles {
+    pub fn new(dir: PathBuf, props: WriterProperties, range_start: u64) -> Self {
+        Self {
+            dir,
+            props,
+            range_start,
+            tables: Vec::new(),
+        }
+    }
+
+    pub fn write(&mut self, resp: hypersync_client::ArrowResponse) -> Result<()> {
+        let data = resp.data;
+        for (name, batches) in [
+            ("blocks", data.blocks),
+            ("transactions", data.transactions),
+            ("logs", data.logs),
+            ("traces", data.traces),
+            ("decoded_logs", data.decoded_logs),
+        ] {
+            for batch in batches {
+                if batch.num_rows() > 0 {
+                    self.write_batch(name, &batch)
+                        .with_context(|| format!("write {name}"))?;
+                }
+            }
+        }
+
+        Ok(())
+    }
+
+    /// Bytes written to the files so far, including row groups that are not flushed yet.
+    pub fn size(&self) -> usize {
+        self.tables
+            .iter()
+            .map(|(_, _, writer)| writer.bytes_written() + writer.in_progress_size())
+            .sum()
+    }
+
+    fn write_batch(&mut self, name: &'static str, batch: &RecordBatch) -> Result<()> {
+        let idx = match self.tables.iter().position(|(n, _, _)| *n == name) {
+            Some(idx) => idx,
+            None => {
+                let path = self
+                    .dir
+                    .join(format!(".{}_{}.parquet.tmp", name, self.range_start));
+                let file = File::create(&path).context("create parquet file")?;
+                let writer = ArrowWriter::try_new(file, batch.schema(), Some(self.props.clone()))
+                    .context("create writer")?;
+                self.tables.push((name, path, writer));
+                self.tables.len() - 1
+            }
+        };
+
+        self.tables[idx].2.write(batch).context("write batch")
+    }
+
+    /// Close the files and name them after `[range_start, range_end)`.
+    pub fn finish(self, range_end: u64) -> Result<()> {
+        for (name, tmp_path, writer) in self.tables {
+            writer.close().context("close parquet writer")?;
+            fs::rename(
+                &tmp_path,
+                range_file_path(&self.dir, name, self.range_start, range_end),
+            )
+            .context("rename parquet file")?;
+        }
+
+        Ok(())
+    }
+}
+
+fn range_file_path(dir: &Path, table: &str, from: u64, to: u64) -> PathBuf {
+    dir.join(format!("{table}_{from}_{to}.parquet"))
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_rotation_boundary() {
+        let options = ParquetOptions {
+            rotate_blocks: Some(100_000),
+            ..Default::default()
+        };
+
+        assert_eq!(options.rotation_boundary(17_000_000), Some(17_100_000));
+        assert_eq!(options.rotation_boundary(17_099_999), Some(17_100_000));
+        assert_eq!(ParquetOptions::default().rotation_boundary(5), None);
+    }
+}
@@ -0,0 +1,237 @@
+//! Reorg detection for tail streams.
+//!
+//! Rollback guards of streamed responses vouch for the hash of the last block of the response
+//! and the parent hash of the first block the server still keeps in memory. The detector keeps
+//! a bounded buffer of these hashes and flags a response whose guard contradicts it. The block
+//! to rewind to is then found by comparing the buffered hashes with the ones the server reports.
+
+use std::collections::{HashMap, VecDeque};
+
+use anyhow::{anyhow, Context, Result};
+use hypersync_client::{format::Hash, net_types, Client};
+
+/// Default number of block hashes kept by the reorg detector.
+pub const DEFAULT_REORG_BUFFER_SIZE: usize = 256;
+
+pub struct ReorgDetector {
+    /// Recently streamed block hashes, sorted by block number.
+    blocks: VecDeque<(u64, Hash)>,
+    capacity: usize,
+}
+
+impl ReorgDetector {
+    pub fn new(capacity: usize) -> Self {
+        Self {
+            blocks: VecDeque::with_capacity(capacity),
+            capacity,
+        }
+    }
+
+    /// Check `guard` against the recorded blocks and record the blocks it vouches for.
+    ///
+    /// Returns the first block that is no longer part of the chain if `guard` shows that blocks
+    /// before `next_block` were rolled back.
+    pub async fn check(
+        &mut self,
+        client: &Client,
+        guard: &net_types::RollbackGuard,
+        next_block: u64,
+    ) -> Result<Option<u64>> {
+        if self.is_reorg(guard) {
+            let fork = self
+                .find_fork(client)
+                .await
+                .context("find rollback point")?;
+            // The server might confirm all recorded blocks if the guard came from a node that
+            // is behind, nothing was rolled back then.
+            if fork < next_block {
+                return Ok(Some(fork));
+            }
+        }
+
+        self.record(guard);
+
+        Ok(None)
+    }
+
+    /// Record the block hashes `guard` vouches for.
+    fn record(&mut self, guard: &net_types::RollbackGuard) {
+        if let Some(parent) = guard.first_block_number.checked_sub(1) {
+            self.insert(parent, guard.first_parent_hash.clone());
+        }
+        self.insert(guard.block_number, guard.hash.clone());
+    }
+
+    /// Check if `guard` contradicts any of the recorded block hashes.
+    fn is_reorg(&self, guard: &net_types::RollbackGuard) -> bool {
+        let parent_mismatch = guard
+            .first_block_number
+            .checked_sub(1)
+            .and_then(|parent| self.get(parent))
+            .is_some_and(|hash| *hash != guard.first_parent_hash);
+        let last_mismatch = self
+            .get(guard.block_number)
+            .is_some_and(|hash| *hash != guard.hash);
+
+        parent_mismatch || last_mismatch
+    }
+
+    /// Find the first block that is no longer part of the chain, see `rewind`.
+    async fn find_fork(&mut self, client: &Client) -> Result<u64> {
+        let (from_block, to_block) = match (self.blocks.front(), self.blocks.back()) {
+            (Some((first, _)), Some((last, _))) => (*first, *last + 1),
+            _ => return Err(anyhow!("no blocks recorded to find the rollback point")),
+        };
+
+        let canonical = get_block_hashes(client, from_block, to_block)
+            .await
+            .context("get block hashes")?;
+
+        self.rewind(&canonical)
+    }
+
+    /// Compare the recorded blocks with the `canonical` hashes, newest first, and return the
+    /// block after the newest one that matches.
+    ///
+    /// Blocks that don't match are dropped from the buffer. Fails if none of the recorded blocks
+    /// match, as the rollback is deeper than the buffer then.
+    fn rewind(&mut self, canonical: &HashMap<u64, Hash>) -> Result<u64> {
+        while let Some((number, hash)) = self.blocks.back() {
+            if canonical.get(number) == Some(hash) {
+                return Ok(number + 1);
+            }
+            self.blocks.pop_back();
+        }
+
+        Err(anyhow!(
+            "rollback is deeper than the {} blocks kept by the reorg detector",
+            self.capacity
+        ))
+    }
+
+    fn get(&self, number: u64) -> Option<&Hash> {
+        self.blocks
+            .binary_search_by_key(&number, |(n, _)| *n)
+            .ok()
+            .map(|idx| &self.blocks[idx].1)
+    }
+
+    fn insert(&mut self, number: u64, hash: Hash) {
+        match self.blocks.binary_search_by_key(&number, |(n, _)| *n) {
+            Ok(idx) => self.blocks[idx].1 = hash,
+            Err(idx) => self.blocks.insert(idx, (number, hash)),
+        }
+
+        while self.blocks.len() > self.capacity {
+            self.blocks.pop_front();
+        }
+    }
+}
+
+/// Get the hashes of all blocks in `[from_block, to_block)` from the server.
+async fn get_block_hashes(
+    client: &Client,
+    from_block: u64,
+    to_block: u64,
+) -> Result<HashMap<u64, Hash>> {
+    let mut query: net_types::Query = serde_json::from_value(serde_json::json!({
+        "from_block": from_block,
+        "to_block": to_block,
+        "include_all_blocks": true,
+        "field_selection": {
+            "block": ["number", "hash"],
+        },
+    }))
+    .context("build query")?;
+
+    let mut hashes = HashMap::new();
+    loop {
+        let res = client.get(&query).await.context("run query")?;
+
+        for block in res.data.blocks.iter().flatten() {
+            if let (Some(number), Some(hash)) = (block.number, &block.hash) {
+                hashes.insert(number, hash.clone());
+            }
+        }
+
+        if res.next_block >= to_block || res.next_block <= query.from_block {
+            return Ok(hashes);
+        }
+        query.from_block = res.next_block;
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn hash(byte: u8) -> Hash {
+        Hash::try_from([byte; 32].as_slice()).unwrap()
+    }
+
+    fn guard(
+        first_block_number: u64,
+        first_parent_hash: u8,
+        block_number: u64,
+        block_hash: u8,
+    ) -> net_types::RollbackGuard {
+        serde_json::from_value(serde_json::json!({
+            "block_number": block_number,
+            "timestamp": 0,
+            "hash": hash(block_hash),
+            "first_block_number": first_block_number,
+            "first_parent_hash": hash(first_parent_hash),
+        }))
+        .unwrap()
+    }
+
+    #[test]
+    fn test_mismatch_rewinds_to_last_canonical_block() {
+        let mut detector = ReorgDetector::new(DEFAULT_REORG_BUFFER_SIZE);
+
+        // blocks 10 and 15, then 20 which extends them
+        let first = guard(11, 10, 15, 15);
+        assert!(!detector.is_reorg(&first));
+        detector.record(&first);
+        let second = guard(16, 15, 20, 20);
+        assert!(!detector.is_reorg(&second));
+        detector.record(&second);
+
+        // a different parent of block 21 or a different hash of block 20
+        assert!(detector.is_reorg(&guard(21, 99, 25, 25)));
+        assert!(detector.is_reorg(&guard(21, 20, 20, 99)));
+        assert!(!detector.is_reorg(&guard(21, 20, 25, 25)));
+
+        // block 20 was replaced, 15 is still canonical
+        let canonical = HashMap::from([(10, hash(10)), (15, hash(15)), (20, hash(99))]);
+        assert_eq!(detector.rewind(&canonical).unwrap(), 16);
+        assert_eq!(detector.get(20), None);
+        assert_eq!(detector.get(15), Some(&hash(15)));
+
+        // nothing recorded matches, the rollback is deeper than the buffer
+        assert!(detector.rewind(&HashMap::new()).is_err());
+        assert_eq!(detector.get(10), None);
+    }
+
+    #[test]
+    fn test_buffer_evicts_oldest_blocks() {
+        let mut detector = ReorgDetector::new(3);
+        for number in [5, 1, 4, 2, 3] {
+            detector.insert(number, hash(number as u8));
+        }
+
+        assert_eq!(
+            detector.blocks.iter().map(|(n, _)| *n).collect::<Vec<_>>(),
+            [3, 4, 5]
+        );
+        assert_eq!(detector.get(2), None);
+        // evicted blocks can't contradict a guard anymore
+        assert!(!detector.is_reorg(&guard(3, 99, 5, 5)));
+        assert!(detector.is_reorg(&guard(4, 99, 5, 5)));
+
+        // a block older than all recorded ones is evicted right away
+        detector.insert(1, hash(1));
+        assert_eq!(detector.get(1), None);
+        assert_eq!(detector.blocks.len(), 3);
+    }
+}
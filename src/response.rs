@@ -1,31 +1,96 @@
+use std::collections::{hash_map::Entry, HashMap, VecDeque};
+use std::mem::size_of;
 use std::sync::Arc;
-
-use anyhow::{Context, Result};
-use pyo3::{pyclass, pymethods, Bound, Py, PyAny, PyErr, PyResult, Python};
+use std::time::Instant;
+
+use anyhow::{anyhow, Context, Result};
+use arrow::{
+    array::RecordBatch,
+    datatypes::{Schema, SchemaRef},
+    error::ArrowError,
+    record_batch::RecordBatchReader,
+};
+use hypersync_client::{net_types, simple_types};
+use pyo3::{
+    exceptions::{PyStopAsyncIteration, PyValueError},
+    pyclass, pymethods,
+    types::PyCapsule,
+    Bound, Py, PyAny, PyClass, PyErr, PyRef, PyResult, Python,
+};
 use pyo3_async_runtimes::tokio::future_into_py;
 use tokio::sync::mpsc;
 
 use crate::{
-    arrow_ffi::response_to_pyarrow,
-    types::{Block, Event, Log, RollbackGuard, Trace, Transaction},
+    arrow_ffi::{
+        arrow_response_size, batch_to_python, events_to_pyarrow, layout_events,
+        response_to_pyarrow, schema_capsule, stream_capsule, table_batches, TableFormat,
+    },
+    column_layout::ColumnLayout,
+    decode_arrow::EventTables,
+    event_join::EventJoin,
+    metrics::{millis, ResponseTiming},
+    query::FieldSelection,
+    rows::{Interner, RowFormat, Rows, Selection, ValueConverter},
+    stream::{
+        parse_timeout, spawn_converter, spawn_message_converter, BufferStats, Message,
+        ResponseReceiver, StreamOptions, Upstream,
+    },
+    sync_client::block_on,
+    types::{Block, Event, Log, Rollback, RollbackGuard, Trace, Transaction},
 };
 
-#[pyclass]
-#[pyo3(get_all)]
+#[pyclass(module = "hypersync.hypersync")]
 #[derive(Clone)]
 pub struct ArrowResponse {
     /// Current height of the source hypersync instance
+    #[pyo3(get)]
     pub archive_height: Option<u64>,
     /// Next block to query for, the responses are paginated so,
     ///  the caller should continue the query from this block if they
     ///  didn't get responses up to the to_block they specified in the Query.
+    #[pyo3(get)]
     pub next_block: u64,
     /// Total time it took the hypersync instance to execute the query.
+    #[pyo3(get)]
     pub total_execution_time: u64,
     /// Response data
+    #[pyo3(get)]
     pub data: ArrowResponseData,
     /// Rollback guard, supposed to be used to detect rollbacks
+    #[pyo3(get)]
     pub rollback_guard: Option<RollbackGuard>,
+    /// Where the time went while producing this response
+    #[pyo3(get)]
+    pub timing: ResponseTiming,
+    /// Record batches of the tables of `data` in `ARROW_TABLES` order, so `ArrowStreamTable`
+    /// can export them without importing them back from python. `None` if the response was
+    /// read from IPC.
+    pub batches: Option<Arc<[Vec<RecordBatch>; 5]>>,
+}
+
+impl ArrowResponse {
+    /// Record batches of the `name` table of `ARROW_TABLES`.
+    fn table_batches(&self, py: Python, name: &str) -> Result<Vec<RecordBatch>> {
+        let index = ARROW_TABLES
+            .iter()
+            .position(|table| *table == name)
+            .with_context(|| format!("unknown table: {name}"))?;
+
+        match &self.batches {
+            Some(batches) => Ok(batches[index].clone()),
+            None => {
+                let data = &self.data;
+                let table = [
+                    &data.blocks,
+                    &data.transactions,
+                    &data.logs,
+                    &data.traces,
+                    &data.decoded_logs,
+                ][index];
+                table_batches(table.bind(py))
+            }
+        }
+    }
 }
 
 #[pyclass]
@@ -37,6 +102,8 @@ pub struct ArrowResponseData {
     pub logs: Py<PyAny>,
     pub traces: Py<PyAny>,
     pub decoded_logs: Py<PyAny>,
+    /// Dict of a pyarrow Table per event of `StreamConfig.event_signatures`, None if not set.
+    pub decoded_events: Py<PyAny>,
 }
 
 impl Clone for ArrowResponseData {
@@ -47,132 +114,630 @@ impl Clone for ArrowResponseData {
             logs: self.logs.clone_ref(py),
             traces: self.traces.clone_ref(py),
             decoded_logs: self.decoded_logs.clone_ref(py),
+            decoded_events: self.decoded_events.clone_ref(py),
         })
     }
 }
 
-#[pyclass]
-pub struct QueryResponseStream {
-    inner: Arc<tokio::sync::Mutex<mpsc::Receiver<Result<hypersync_client::QueryResponse>>>>,
+/// Define a stream pyclass that hands out responses of type `$resp` converted by a
+/// `ResponseReceiver`.
+///
+/// All streams share the same receiving interface, class specific `#[pymethods]` can be passed
+/// in the trailing block.
+macro_rules! response_stream {
+    ($name:ident, $resp:ty $(, { $($extra:tt)* })?) => {
+        #[pyclass]
+        pub struct $name {
+            inner: Arc<tokio::sync::Mutex<ResponseReceiver<$resp>>>,
+            stats: Arc<BufferStats>,
+        }
+
+        impl $name {
+            fn from_receiver(rx: ResponseReceiver<$resp>) -> Self {
+                Self {
+                    stats: rx.stats(),
+                    inner: Arc::new(tokio::sync::Mutex::new(rx)),
+                }
+            }
+        }
+
+        #[pymethods]
+        impl $name {
+            /// Approximate size in bytes of the responses buffered ahead of the consumer.
+            pub fn buffered_bytes(&self) -> usize {
+                self.stats.buffered_bytes()
+            }
+
+            /// Number of responses buffered ahead of the consumer.
+            pub fn queue_depth(&self) -> usize {
+                self.stats.queue_depth()
+            }
+
+            pub fn close<'py>(&'py self, py: Python<'py>) -> PyResult<Bound<'py, PyAny>> {
+                let inner = Arc::clone(&self.inner);
+
+                future_into_py(py, async move {
+                    inner.lock().await.close();
+                    Ok::<_, PyErr>(())
+                })
+            }
+
+            pub fn recv<'py>(&self, py: Python<'py>) -> PyResult<Bound<'py, PyAny>> {
+                let inner = Arc::clone(&self.inner);
+
+                future_into_py(py, async move {
+                    inner.lock().await.recv().await.map_err(Into::into)
+                })
+            }
+
+            #[pyo3(signature = (max_items, timeout=None))]
+            pub fn recv_many<'py>(
+                &self,
+                max_items: usize,
+                timeout: Option<f64>,
+                py: Python<'py>,
+            ) -> PyResult<Bound<'py, PyAny>> {
+                if max_items == 0 {
+                    return Err(PyValueError::new_err("max_items must be greater than zero"));
+                }
+                let timeout = parse_timeout(timeout)?;
+                let inner = Arc::clone(&self.inner);
+
+                future_into_py(py, async move {
+                    inner
+                        .lock()
+                        .await
+                        .recv_many(max_items, timeout)
+                        .await
+                        .map_err(Into::into)
+                })
+            }
+
+            fn __aiter__(slf: PyRef<'_, Self>) -> PyRef<'_, Self> {
+                slf
+            }
+
+            fn __anext__<'py>(&self, py: Python<'py>) -> PyResult<Bound<'py, PyAny>> {
+                let inner = Arc::clone(&self.inner);
+
+                future_into_py(py, async move {
+                    match inner.lock().await.recv().await? {
+                        Some(resp) => Ok(resp),
+                        None => Err(PyStopAsyncIteration::new_err(())),
+                    }
+                })
+            }
+
+            /// Blocking version of `close`, releases the GIL while waiting.
+            pub fn close_sync(&self, py: Python<'_>) {
+                block_on(py, async { self.inner.lock().await.close() })
+            }
+
+            /// Blocking version of `recv`, releases the GIL while waiting.
+            pub fn recv_sync(&self, py: Python<'_>) -> Result<Option<$resp>> {
+                block_on(py, async { self.inner.lock().await.recv().await })
+            }
+
+            /// Blocking version of `recv_many`, releases the GIL while waiting.
+            #[pyo3(signature = (max_items, timeout=None))]
+            pub fn recv_many_sync(
+                &self,
+                max_items: usize,
+                timeout: Option<f64>,
+                py: Python<'_>,
+            ) -> PyResult<Option<Vec<$resp>>> {
+                if max_items == 0 {
+                    return Err(PyValueError::new_err("max_items must be greater than zero"));
+                }
+                let timeout = parse_timeout(timeout)?;
+
+                block_on(py, async {
+                    self.inner.lock().await.recv_many(max_items, timeout).await
+                })
+                .map_err(Into::into)
+            }
+
+            fn __iter__(slf: PyRef<'_, Self>) -> PyRef<'_, Self> {
+                slf
+            }
+
+            fn __next__(&self, py: Python<'_>) -> Result<Option<$resp>> {
+                self.recv_sync(py)
+            }
+
+            $($($extra)*)?
+        }
+    };
 }
 
+response_stream!(QueryResponseStream, Message<QueryResponse>);
+
 impl QueryResponseStream {
-    pub fn new(inner: mpsc::Receiver<Result<hypersync_client::QueryResponse>>) -> Self {
-        Self {
-            inner: Arc::new(tokio::sync::Mutex::new(inner)),
-        }
+    pub fn new(inner: Upstream<hypersync_client::QueryResponse>, options: &StreamOptions) -> Self {
+        let convert = options.convert.clone();
+
+        Self::from_receiver(spawn_message_converter(
+            inner,
+            options,
+            move |res| convert_response(res, &convert),
+            query_response_size,
+        ))
     }
 }
 
-#[pymethods]
-impl QueryResponseStream {
-    pub fn close<'py>(&'py self, py: Python<'py>) -> PyResult<Bound<'py, PyAny>> {
-        let inner = Arc::clone(&self.inner);
+response_stream!(EventStream, Message<EventResponse>);
+
+impl EventStream {
+    pub fn new(inner: Upstream<hypersync_client::EventResponse>, options: &StreamOptions) -> Self {
+        Self::from_receiver(spawn_message_converter(
+            inner,
+            options,
+            convert_event_response,
+            event_response_size,
+        ))
+    }
+}
 
-        future_into_py(py, async move {
-            inner.lock().await.close();
-            Ok::<_, PyErr>(())
+response_stream!(ArrowStream, Message<ArrowResponse>, {
+    /// View of the `name` table of the remaining responses, which implements the Arrow
+    /// PyCapsule stream interface.
+    pub fn table(&self, name: &str) -> PyResult<ArrowStreamTable> {
+        if !ARROW_TABLES.contains(&name) {
+            return Err(PyValueError::new_err(format!("unknown table: {name}")));
+        }
+
+        Ok(ArrowStreamTable {
+            source: TableSource::Responses(Arc::clone(&self.inner)),
+            table: name.to_owned(),
+            reader: None,
         })
     }
 
-    pub fn recv<'py>(&self, py: Python<'py>) -> PyResult<Bound<'py, PyAny>> {
-        let inner = Arc::clone(&self.inner);
+    /// Responses hold several tables, so exporting the stream itself fails instead of picking
+    /// one of them. Export one with `table`.
+    #[pyo3(signature = (requested_schema=None))]
+    pub fn __arrow_c_stream__(
+        &self,
+        requested_schema: Option<Bound<'_, PyAny>>,
+    ) -> PyResult<Bound<'_, PyCapsule>> {
+        let _ = requested_schema;
+        Err(PyValueError::new_err(
+            "responses hold several tables, export one with ArrowStream.table(name)",
+        ))
+    }
+});
 
-        future_into_py(py, async move {
-            let resp = inner.lock().await.recv().await;
+impl ArrowStream {
+    pub fn new(inner: Upstream<hypersync_client::ArrowResponse>, options: &StreamOptions) -> Self {
+        let events = options.event_tables.clone();
+        let format = options.table_format;
+        let layout = options.column_layout;
+
+        Self::from_receiver(spawn_message_converter(
+            inner,
+            options,
+            move |resp| response_to_pyarrow(resp, events.as_deref(), format, layout),
+            arrow_response_size,
+        ))
+    }
+}
 
-            resp.map(|r| convert_response(r?).context("convert response"))
-                .transpose()
-                .map_err(Into::into)
-        })
+response_stream!(ArrowBatchStream, Message<ArrowBatch>, {
+    /// View of the `name` table of the remaining batches, which implements the Arrow PyCapsule
+    /// stream interface. Tables of `StreamConfig.event_signatures` are named after their event.
+    pub fn table(&self, name: &str) -> ArrowStreamTable {
+        ArrowStreamTable {
+            source: TableSource::Batches(Arc::clone(&self.inner)),
+            table: name.to_owned(),
+            reader: None,
+        }
+    }
+});
+
+impl ArrowBatchStream {
+    pub fn new(inner: Upstream<hypersync_client::ArrowResponse>, options: &StreamOptions) -> Self {
+        let format = options.table_format;
+
+        Self::from_receiver(spawn_message_converter(
+            split_batches(inner, options.event_tables.clone(), options.column_layout),
+            options,
+            move |batch| convert_batch(batch, format),
+            |batch| batch.batch.get_array_memory_size(),
+        ))
     }
 }
 
+/// A record batch of one table of an arrow response, delivered by `ArrowBatchStream`.
 #[pyclass]
-pub struct EventStream {
-    inner: Arc<tokio::sync::Mutex<mpsc::Receiver<Result<hypersync_client::EventResponse>>>>,
+pub struct ArrowBatch {
+    /// "blocks", "transactions", "logs", "traces", "decoded_logs" or the name of an event of
+    /// `StreamConfig.event_signatures`.
+    #[pyo3(get)]
+    pub table: String,
+    /// pyarrow RecordBatch, or an `ArrowTable` holding the batch, see
+    /// `StreamConfig.arrow_output`.
+    #[pyo3(get)]
+    pub batch: Py<PyAny>,
+    /// Next block of the response the batch belongs to.
+    #[pyo3(get)]
+    pub next_block: u64,
+    /// Set on the last batch of a response, the response is only fully delivered with it.
+    #[pyo3(get)]
+    pub last_in_response: bool,
+    /// Current height of the source hypersync instance
+    #[pyo3(get)]
+    pub archive_height: Option<u64>,
+    /// Rollback guard of the response, only set on its last batch.
+    #[pyo3(get)]
+    pub rollback_guard: Option<RollbackGuard>,
+    /// Where the time went while producing this batch. The server execution time is only set
+    /// on the last batch of a response.
+    #[pyo3(get)]
+    pub timing: ResponseTiming,
+    /// `batch` on the rust side, exported by `ArrowStreamTable`.
+    record_batch: RecordBatch,
 }
 
-impl EventStream {
-    pub fn new(inner: mpsc::Receiver<Result<hypersync_client::EventResponse>>) -> Self {
-        Self {
-            inner: Arc::new(tokio::sync::Mutex::new(inner)),
+/// A batch split off an inner arrow response, converted to an `ArrowBatch` by the stream.
+struct RawBatch {
+    table: String,
+    batch: RecordBatch,
+    next_block: u64,
+    last_in_response: bool,
+    archive_height: Option<u64>,
+    rollback_guard: Option<net_types::RollbackGuard>,
+    server_execution_time_ms: u64,
+}
+
+/// Split the responses of `upstream` into their non-empty batches in a background task,
+/// decoding the logs into `events` if given and laying out the columns by `layout`.
+///
+/// The returned stream delivers rollbacks like a tail stream, whether `upstream` is one or not.
+/// Responses without rows yield a single zero-row batch, see `split_response`.
+fn split_batches(
+    mut upstream: Upstream<hypersync_client::ArrowResponse>,
+    events: Option<Arc<EventTables>>,
+    layout: ColumnLayout,
+) -> Upstream<RawBatch> {
+    let (tx, rx) = mpsc::channel(1);
+
+    tokio::spawn(async move {
+        'responses: loop {
+            let msg = tokio::select! {
+                msg = upstream.recv() => msg,
+                _ = tx.closed() => break,
+            };
+            let msg = match msg {
+                Some(msg) => msg,
+                None => break,
+            };
+
+            let batches = msg.and_then(|msg| match msg {
+                Message::Response(resp) => Ok(split_response(resp, events.as_deref(), layout)?
+                    .into_iter()
+                    .map(Message::Response)
+                    .collect()),
+                Message::Rollback(rollback) => Ok(vec![Message::Rollback(rollback)]),
+            });
+
+            match batches {
+                Ok(batches) => {
+                    for batch in batches {
+                        if tx.send(Ok(batch)).await.is_err() {
+                            break 'responses;
+                        }
+                    }
+                }
+                Err(e) => {
+                    let _ = tx.send(Err(e)).await;
+                    break;
+                }
+            }
         }
-    }
+
+        upstream.close();
+    });
+
+    Upstream::Tail(rx)
 }
 
-#[pymethods]
-impl EventStream {
-    pub fn close<'py>(&'py self, py: Python<'py>) -> PyResult<Bound<'py, PyAny>> {
-        let inner = Arc::clone(&self.inner);
+/// Split `resp` into its non-empty batches.
+///
+/// A response without rows is delivered as its first, empty batch, or an empty `blocks` batch
+/// without columns if it has none, so consumers still see `next_block` and the checkpoint
+/// advance past it.
+fn split_response(
+    resp: hypersync_client::ArrowResponse,
+    events: Option<&EventTables>,
+    layout: ColumnLayout,
+) -> Result<Vec<RawBatch>> {
+    let decoded_events = events
+        .map(|events| layout_events(events.decode(&resp.data.logs)?, layout))
+        .transpose()
+        .context("decode events")?
+        .unwrap_or_default();
+    let resp = layout.apply_response(resp)?;
+
+    let data = resp.data;
+    let mut batches = [
+        ("blocks", data.blocks),
+        ("transactions", data.transactions),
+        ("logs", data.logs),
+        ("traces", data.traces),
+        ("decoded_logs", data.decoded_logs),
+    ]
+    .into_iter()
+    .map(|(name, batches)| (name.to_owned(), batches))
+    .chain(decoded_events)
+    .flat_map(|(name, batches)| batches.into_iter().map(move |batch| (name.clone(), batch)))
+    .collect::<Vec<_>>();
+    if batches.iter().any(|(_, batch)| batch.num_rows() > 0) {
+        batches.retain(|(_, batch)| batch.num_rows() > 0);
+    } else {
+        batches.truncate(1);
+        if batches.is_empty() {
+            batches.push((
+                "blocks".to_owned(),
+                RecordBatch::new_empty(Arc::new(Schema::empty())),
+            ));
+        }
+    }
 
-        future_into_py(py, async move {
-            inner.lock().await.close();
-            Ok::<_, PyErr>(())
+    let num_batches = batches.len();
+    let mut rollback_guard = resp.rollback_guard;
+    Ok(batches
+        .into_iter()
+        .enumerate()
+        .map(|(i, (table, batch))| {
+            let last_in_response = i + 1 == num_batches;
+            RawBatch {
+                table,
+                batch,
+                next_block: resp.next_block,
+                last_in_response,
+                archive_height: resp.archive_height,
+                rollback_guard: if last_in_response {
+                    rollback_guard.take()
+                } else {
+                    None
+                },
+                server_execution_time_ms: if last_in_response {
+                    resp.total_execution_time
+                } else {
+                    0
+                },
+            }
         })
-    }
+        .collect())
+}
 
-    pub fn recv<'py>(&self, py: Python<'py>) -> PyResult<Bound<'py, PyAny>> {
-        let inner = Arc::clone(&self.inner);
+fn convert_batch(raw: RawBatch, format: TableFormat) -> Result<ArrowBatch> {
+    let start = Instant::now();
 
-        future_into_py(py, async move {
-            let resp = inner.lock().await.recv().await;
+    let batch = Python::attach(|py| batch_to_python(py, raw.batch.clone(), format))?;
 
-            resp.map(|r| convert_event_response(r?).context("convert response"))
-                .transpose()
-                .map_err(Into::into)
+    Ok(ArrowBatch {
+        table: raw.table,
+        batch,
+        record_batch: raw.batch,
+        next_block: raw.next_block,
+        last_in_response: raw.last_in_response,
+        archive_height: raw.archive_height,
+        rollback_guard: raw
+            .rollback_guard
+            .map(RollbackGuard::try_convert)
+            .transpose()
+            .context("convert rollback guard")?,
+        timing: ResponseTiming {
+            server_execution_time_ms: raw.server_execution_time_ms,
+            arrow_conversion_ms: millis(start.elapsed()),
+            ..Default::default()
+        },
+    })
+}
+
+/// Tables of `ArrowResponseData` that `ArrowStream` can export.
+const ARROW_TABLES: [&str; 5] = ["blocks", "transactions", "logs", "traces", "decoded_logs"];
+
+/// Stream an `ArrowStreamTable` reads its batches from.
+#[derive(Clone)]
+enum TableSource {
+    Responses(Arc<tokio::sync::Mutex<ResponseReceiver<Message<ArrowResponse>>>>),
+    Batches(Arc<tokio::sync::Mutex<ResponseReceiver<Message<ArrowBatch>>>>),
+}
+
+impl TableSource {
+    /// Batches of `table` in the next item of the stream, `None` once the stream is finished.
+    ///
+    /// Consumers might read the stream while holding the GIL, which is released while waiting
+    /// so the stream can keep converting responses. The batches are taken from the rust side of
+    /// the items, the python tables are not read.
+    fn next_batches(&self, table: &str) -> Result<Option<Vec<RecordBatch>>> {
+        Python::attach(|py| match self {
+            Self::Responses(inner) => {
+                match block_on(py, async { inner.lock().await.recv().await })? {
+                    Some(Message::Response(resp)) => resp.table_batches(py, table).map(Some),
+                    Some(Message::Rollback(rollback)) => Err(rolled_back(&rollback)),
+                    None => Ok(None),
+                }
+            }
+            Self::Batches(inner) => {
+                match block_on(py, async { inner.lock().await.recv().await })? {
+                    // Zero-row batches only mark the progress of empty responses and might not
+                    // have the columns of the table.
+                    Some(Message::Response(batch))
+                        if batch.table == table && batch.record_batch.num_rows() > 0 =>
+                    {
+                        Ok(Some(vec![batch.record_batch]))
+                    }
+                    Some(Message::Response(_)) => Ok(Some(Vec::new())),
+                    Some(Message::Rollback(rollback)) => Err(rolled_back(&rollback)),
+                    None => Ok(None),
+                }
+            }
         })
     }
 }
 
+fn rolled_back(rollback: &Rollback) -> anyhow::Error {
+    anyhow!("blocks from {} were rolled back", rollback.block_number)
+}
+
+/// One table of the remaining items of an `ArrowStream` or `ArrowBatchStream`.
+///
+/// Arrow consumers pull the batches of the table item by item as they read the exported
+/// stream, so at most the prefetched items are held in memory. Other tables of the items are
+/// dropped, and the stream fails on a rollback.
 #[pyclass]
-pub struct ArrowStream {
-    inner: Arc<tokio::sync::Mutex<mpsc::Receiver<Result<hypersync_client::ArrowResponse>>>>,
+pub struct ArrowStreamTable {
+    source: TableSource,
+    table: String,
+    /// Reader that already read the first batch to get the schema, used by the next export.
+    reader: Option<StreamTableReader>,
 }
 
-impl ArrowStream {
-    pub fn new(inner: mpsc::Receiver<Result<hypersync_client::ArrowResponse>>) -> Self {
-        Self {
-            inner: Arc::new(tokio::sync::Mutex::new(inner)),
+impl ArrowStreamTable {
+    /// Reader of the remaining batches, waiting for the first one to get the schema.
+    fn reader(&mut self) -> Result<&StreamTableReader> {
+        if self.reader.is_none() {
+            let reader = StreamTableReader::new(self.source.clone(), self.table.clone())
+                .with_context(|| format!("read first {} batch", self.table))?;
+            self.reader = Some(reader);
         }
+
+        Ok(self.reader.as_ref().expect("reader was just set"))
     }
 }
 
 #[pymethods]
-impl ArrowStream {
-    pub fn close<'py>(&'py self, py: Python<'py>) -> PyResult<Bound<'py, PyAny>> {
-        let inner = Arc::clone(&self.inner);
+impl ArrowStreamTable {
+    /// Export the table as an `arrow_array_stream` capsule. Waits for the first batch of the
+    /// table to get its schema, which is empty if the stream finishes before that.
+    /// `requested_schema` is not supported.
+    #[pyo3(signature = (requested_schema=None))]
+    pub fn __arrow_c_stream__<'py>(
+        &mut self,
+        py: Python<'py>,
+        requested_schema: Option<Bound<'py, PyAny>>,
+    ) -> Result<Bound<'py, PyCapsule>> {
+        let _ = requested_schema;
+        self.reader()?;
+        let reader = self.reader.take().expect("reader was just set");
+        Ok(stream_capsule(py, Box::new(reader))?)
+    }
 
-        future_into_py(py, async move {
-            inner.lock().await.close();
-            Ok::<_, PyErr>(())
-        })
+    /// Export the schema of the table as an `arrow_schema` capsule. Waits for the first batch
+    /// of the table like `__arrow_c_stream__`, the batch is kept for the next export.
+    pub fn __arrow_c_schema__<'py>(&mut self, py: Python<'py>) -> Result<Bound<'py, PyCapsule>> {
+        let schema = self.reader()?.schema();
+        schema_capsule(py, &schema)
     }
+}
 
-    pub fn recv<'py>(&self, py: Python<'py>) -> PyResult<Bound<'py, PyAny>> {
-        let inner = Arc::clone(&self.inner);
+struct StreamTableReader {
+    source: TableSource,
+    table: String,
+    schema: SchemaRef,
+    pending: VecDeque<RecordBatch>,
+}
 
-        future_into_py(py, async move {
-            let resp = inner.lock().await.recv().await;
+impl StreamTableReader {
+    fn new(source: TableSource, table: String) -> Result<Self> {
+        let mut pending = VecDeque::new();
+        let mut schema = Arc::new(Schema::empty());
+
+        while let Some(batches) = source.next_batches(&table)? {
+            if let Some(batch) = batches.first() {
+                schema = batch.schema();
+                pending.extend(batches);
+                break;
+            }
+        }
 
-            resp.map(|r| response_to_pyarrow(r?).context("convert response"))
-                .transpose()
-                .map_err(Into::into)
+        Ok(Self {
+            source,
+            table,
+            schema,
+            pending,
         })
     }
 }
 
+impl Iterator for StreamTableReader {
+    type Item = Result<RecordBatch, ArrowError>;
+
+    fn next(&mut self) -> Option<Self::Item> {
+        loop {
+            if let Some(batch) = self.pending.pop_front() {
+                return Some(Ok(batch));
+            }
+            match self.source.next_batches(&self.table) {
+                Ok(Some(batches)) => self.pending.extend(batches),
+                Ok(None) => return None,
+                Err(e) => return Some(Err(ArrowError::ExternalError(e.into()))),
+            }
+        }
+    }
+}
+
+impl RecordBatchReader for StreamTableReader {
+    fn schema(&self) -> SchemaRef {
+        Arc::clone(&self.schema)
+    }
+}
+
+response_stream!(MultiQueryStream, (usize, QueryResponse));
+
+impl MultiQueryStream {
+    /// Wrap the fan-in stream of `stream_many`, responses are tagged with the index of their
+    /// query. Responses are converted with the options at the index of their query in `convert`.
+    pub fn new(
+        inner: mpsc::Receiver<Result<(usize, hypersync_client::QueryResponse)>>,
+        options: &StreamOptions,
+        convert: Vec<ConvertOptions>,
+    ) -> Self {
+        Self::from_receiver(spawn_converter(
+            inner,
+            options,
+            move |(query_id, res)| Ok((query_id, convert_response(res, &convert[query_id])?)),
+            |(_, res)| query_response_size(res),
+        ))
+    }
+}
+
+response_stream!(ArrowEventStream, Message<ArrowEventResponse>);
+
+impl ArrowEventStream {
+    pub fn new(
+        inner: Upstream<hypersync_client::ArrowResponse>,
+        options: &StreamOptions,
+        join: EventJoin,
+    ) -> Self {
+        let format = options.table_format;
+        let layout = options.column_layout;
+
+        Self::from_receiver(spawn_message_converter(
+            inner,
+            options,
+            move |resp| events_to_pyarrow(resp, &join, format, layout),
+            arrow_response_size,
+        ))
+    }
+}
+
+/// Rows are lists of objects, `RowSequence` views or lists of `Record`s depending on the
+/// `RowFormat` of the client.
 #[pyclass]
 #[pyo3(get_all)]
 #[derive(Clone)]
 pub struct QueryResponseData {
-    pub blocks: Vec<Block>,
-    pub transactions: Vec<Transaction>,
-    pub logs: Vec<Log>,
-    pub traces: Vec<Trace>,
+    pub blocks: Rows<Block>,
+    pub transactions: Rows<Transaction>,
+    pub logs: Rows<Log>,
+    pub traces: Rows<Trace>,
 }
 
-#[pyclass]
+#[pyclass(module = "hypersync.hypersync")]
 #[pyo3(get_all)]
 #[derive(Clone)]
 pub struct QueryResponse {
@@ -188,9 +753,11 @@ pub struct QueryResponse {
     pub data: QueryResponseData,
     /// Rollback guard, supposed to be used to detect rollbacks
     pub rollback_guard: Option<RollbackGuard>,
+    /// Where the time went while producing this response
+    pub timing: ResponseTiming,
 }
 
-#[pyclass]
+#[pyclass(module = "hypersync.hypersync")]
 #[pyo3(get_all)]
 #[derive(Clone)]
 pub struct EventResponse {
@@ -206,6 +773,27 @@ pub struct EventResponse {
     pub data: Vec<Event>,
     /// Rollback guard, supposed to be used to detect rollbacks
     pub rollback_guard: Option<RollbackGuard>,
+    /// Where the time went while producing this response
+    pub timing: ResponseTiming,
+}
+
+#[pyclass(module = "hypersync.hypersync")]
+#[pyo3(get_all)]
+pub struct ArrowEventResponse {
+    /// Current height of the source hypersync instance
+    pub archive_height: Option<u64>,
+    /// Next block to query for, the responses are paginated so,
+    ///  the caller should continue the query from this block if they
+    ///  didn't get responses up to the to_block they specified in the Query.
+    pub next_block: u64,
+    /// Total time it took the hypersync instance to execute the query.
+    pub total_execution_time: u64,
+    /// Logs joined with their transactions and blocks, `None` if there are no logs.
+    pub data: Py<PyAny>,
+    /// Rollback guard, supposed to be used to detect rollbacks
+    pub rollback_guard: Option<RollbackGuard>,
+    /// Where the time went while producing this response
+    pub timing: ResponseTiming,
 }
 
 #[pyclass]
@@ -226,34 +814,59 @@ pub struct Events {
     pub rollback_guard: Option<RollbackGuard>,
 }
 
-pub fn convert_response(res: hypersync_client::QueryResponse) -> Result<QueryResponse> {
-    let blocks = res
-        .data
-        .blocks
-        .iter()
-        .flat_map(|b| b.iter().map(Block::from))
-        .collect::<Vec<_>>();
+/// Number of values a stream wide interner holds before it is cleared.
+const SHARED_INTERNER_CAPACITY: usize = 1 << 16;
+
+/// Options for converting query responses to python objects, set on the client.
+#[derive(Clone, Debug, Default)]
+pub struct ConvertOptions {
+    /// Representation of the rows.
+    pub row_format: RowFormat,
+    /// Columns kept by records, all of them unless set for a query.
+    pub selection: Arc<Selection>,
+    /// Interner shared by all responses converted with these options, instead of one per
+    /// response.
+    pub interner: Option<Arc<Interner>>,
+}
 
-    let transactions = res
-        .data
-        .transactions
-        .iter()
-        .flat_map(|b| b.iter().map(Transaction::from))
-        .collect::<Vec<_>>();
+impl ConvertOptions {
+    /// Options for converting the responses of a query with `field_selection`.
+    pub fn for_query(&self, field_selection: &FieldSelection) -> Self {
+        Self {
+            selection: Arc::new(Selection::new(field_selection)),
+            ..self.clone()
+        }
+    }
 
-    let logs = res
-        .data
-        .logs
-        .iter()
-        .flat_map(|b| b.iter().map(Log::from))
-        .collect::<Vec<_>>();
+    /// Share interned strings between all responses converted with the returned options.
+    pub fn with_shared_interner(self) -> Self {
+        Self {
+            interner: self
+                .row_format
+                .interns()
+                .then(|| Arc::new(Interner::new(Some(SHARED_INTERNER_CAPACITY)))),
+            ..self
+        }
+    }
+}
 
-    let traces = res
-        .data
-        .traces
-        .iter()
-        .flat_map(|b| b.iter().map(Trace::from))
-        .collect::<Vec<_>>();
+pub fn convert_response(
+    res: hypersync_client::QueryResponse,
+    options: &ConvertOptions,
+) -> Result<QueryResponse> {
+    let start = Instant::now();
+
+    let selection = &options.selection;
+    let values = ValueConverter::new(options);
+    let blocks = Rows::convert(res.data.blocks, options, &selection.blocks, &values);
+    let transactions = Rows::convert(
+        res.data.transactions,
+        options,
+        &selection.transactions,
+        &values,
+    );
+    let logs = Rows::convert(res.data.logs, options, &selection.logs, &values);
+    let traces = Rows::convert(res.data.traces, options, &selection.traces, &values);
 
     Ok(QueryResponse {
         archive_height: res
@@ -277,19 +890,107 @@ pub fn convert_response(res: hypersync_client::QueryResponse) -> Result<QueryRes
             .map(RollbackGuard::try_convert)
             .transpose()
             .context("convert rollback guard")?,
+        timing: ResponseTiming {
+            server_execution_time_ms: res.total_execution_time,
+            response_conversion_ms: millis(start.elapsed()),
+            ..Default::default()
+        },
     })
 }
 
-pub fn convert_event_response(resp: hypersync_client::EventResponse) -> Result<EventResponse> {
-    let data = resp
+/// Approximate in-memory size of a response, used for stream memory budgeting.
+pub fn query_response_size(res: &hypersync_client::QueryResponse) -> usize {
+    let blocks = res
         .data
-        .into_iter()
-        .map(|event| Event {
-            transaction: event.transaction.map(|v| Transaction::from(&*v)),
-            block: event.block.map(|v| Block::from(&*v)),
-            log: Log::from(&event.log),
+        .blocks
+        .iter()
+        .flatten()
+        .map(|b| size_of::<simple_types::Block>() + b.extra_data.as_ref().map_or(0, |v| v.len()))
+        .sum::<usize>();
+    let transactions = res
+        .data
+        .transactions
+        .iter()
+        .flatten()
+        .map(|t| size_of::<simple_types::Transaction>() + t.input.as_ref().map_or(0, |v| v.len()))
+        .sum::<usize>();
+    let logs = res
+        .data
+        .logs
+        .iter()
+        .flatten()
+        .map(|l| size_of::<simple_types::Log>() + l.data.as_ref().map_or(0, |v| v.len()))
+        .sum::<usize>();
+    let traces = res
+        .data
+        .traces
+        .iter()
+        .flatten()
+        .map(|t| {
+            size_of::<simple_types::Trace>()
+                + t.input.as_ref().map_or(0, |v| v.len())
+                + t.output.as_ref().map_or(0, |v| v.len())
         })
-        .collect();
+        .sum::<usize>();
+
+    blocks + transactions + logs + traces
+}
+
+/// Approximate in-memory size of a response, used for stream memory budgeting.
+///
+/// Blocks and transactions are shared between events so they are not counted per event.
+pub fn event_response_size(res: &hypersync_client::EventResponse) -> usize {
+    res.data
+        .iter()
+        .map(|e| size_of::<simple_types::Event>() + e.log.data.as_ref().map_or(0, |v| v.len()))
+        .sum()
+}
+
+/// Convert a block or transaction of an event once per response.
+///
+/// The inner client shares them between the events of a response, so they are looked up by
+/// address and events of the same block or transaction get the same python object.
+fn convert_shared<T, U>(
+    py: Python<'_>,
+    converted: &mut HashMap<*const T, Py<U>>,
+    v: &Arc<T>,
+) -> PyResult<Py<U>>
+where
+    U: PyClass + for<'a> From<&'a T>,
+{
+    match converted.entry(Arc::as_ptr(v)) {
+        Entry::Occupied(entry) => Ok(entry.get().clone_ref(py)),
+        Entry::Vacant(entry) => Ok(entry.insert(Py::new(py, U::from(&**v))?).clone_ref(py)),
+    }
+}
+
+pub fn convert_event_response(resp: hypersync_client::EventResponse) -> Result<EventResponse> {
+    let start = Instant::now();
+
+    let data = Python::attach(|py| {
+        let mut transactions = HashMap::new();
+        let mut blocks = HashMap::new();
+
+        resp.data
+            .iter()
+            .map(|event| {
+                Ok(Event {
+                    transaction: event
+                        .transaction
+                        .as_ref()
+                        .map(|v| convert_shared(py, &mut transactions, v))
+                        .transpose()?,
+                    block: event
+                        .block
+                        .as_ref()
+                        .map(|v| convert_shared(py, &mut blocks, v))
+                        .transpose()?,
+                    log: Log::from(&event.log),
+                })
+            })
+            .collect::<PyResult<Vec<_>>>()
+    })
+    .context("convert events")?;
 
     Ok(EventResponse {
         archive_height: resp.archive_height.map(|v| v.try_into().unwrap()),
@@ -300,5 +1001,10 @@ pub fn convert_event_response(resp: hypersync_client::EventResponse) -> Result<E
             .rollback_guard
             .map(|rg| RollbackGuard::try_convert(rg).context("convert rollback guard"))
             .transpose()?,
+        timing: ResponseTiming {
+            server_execution_time_ms: resp.total_execution_time,
+            response_conversion_ms: millis(start.elapsed()),
+            ..Default::default()
+        },
     })
 }
@@ -0,0 +1,843 @@
+//! Alternative representations of the rows of a query response.
+//!
+//! By default rows are converted to `Block`, `Transaction`, `Log` and `Trace` objects with
+//! hex string fields. Depending on the `RowFormat` of the client they are instead:
+//!
+//! - kept in the batches the inner client delivered them in and wrapped by a `RowSequence`.
+//!   Indexing it creates a `RowView` that only points at the row, a field of the row is
+//!   converted when it is accessed.
+//! - converted to `Record`s, which hold python values instead of rust strings so they can carry
+//!   native ints and bytes, and only hold the columns of the field selection. Repeated hashes
+//!   and addresses share one python object through an `Interner`.
+//!
+//! Both keep the rows of the inner client until the table is handed to python, so responses
+//! are converted without holding the GIL.
+
+use std::collections::HashMap;
+use std::sync::{Arc, Mutex, OnceLock};
+
+use anyhow::{anyhow, Result};
+use hypersync_client::{
+    format::{Data, FixedSizeData, Hex, Quantity},
+    simple_types,
+};
+use num_bigint::BigUint;
+use pyo3::{
+    exceptions::{PyAttributeError, PyIndexError},
+    prelude::*,
+    types::{PyBytes, PyList},
+    IntoPyObjectExt,
+};
+
+use crate::{
+    query::FieldSelection,
+    response::ConvertOptions,
+    types::{AccessList, Block, Log, Trace, Transaction, Withdrawal},
+};
+
+/// Representation of the rows of query responses, set on the client.
+#[derive(Clone, Copy, Debug, Default, PartialEq, Eq)]
+pub enum RowFormat {
+    /// Lists of `Block`, `Transaction`, `Log` and `Trace` objects with hex string fields.
+    #[default]
+    Objects,
+    /// Lists of `Record`s of the selected columns with hex string fields.
+    Records,
+    /// Like `Records`, with quantities as ints and other binary fields as bytes.
+    NativeRecords,
+    /// `RowSequence` views with hex string fields.
+    Lazy,
+    /// Like `Lazy`, with quantities as ints and other binary fields as bytes.
+    NativeLazy,
+}
+
+impl RowFormat {
+    pub fn parse(name: &str) -> Result<Self> {
+        match name {
+            "objects" => Ok(Self::Objects),
+            "records" => Ok(Self::Records),
+            "native_records" => Ok(Self::NativeRecords),
+            "lazy" => Ok(Self::Lazy),
+            "native_lazy" => Ok(Self::NativeLazy),
+            other => Err(anyhow!("unknown row format: {other}")),
+        }
+    }
+
+    fn native_types(self) -> bool {
+        matches!(self, Self::NativeRecords | Self::NativeLazy)
+    }
+
+    /// Whether repeated hashes and addresses share one python object.
+    pub fn interns(self) -> bool {
+        matches!(self, Self::Records | Self::NativeRecords)
+    }
+}
+
+/// Object types of the rows of a table, built from the rows of the inner client.
+pub trait RowObject: Clone + for<'a> From<&'a Self::Inner> {
+    type Inner: Row;
+}
+
+impl RowObject for Block {
+    type Inner = simple_types::Block;
+}
+
+impl RowObject for Transaction {
+    type Inner = simple_types::Transaction;
+}
+
+impl RowObject for Log {
+    type Inner = simple_types::Log;
+}
+
+impl RowObject for Trace {
+    type Inner = simple_types::Trace;
+}
+
+/// Rows of a response table in the representation selected by `RowFormat`.
+pub enum Rows<T: RowObject> {
+    Objects(Vec<T>),
+    View {
+        rows: Arc<Batches<T::Inner>>,
+        values: ValueConverter,
+    },
+    Records(RecordList<T::Inner>),
+}
+
+impl<T: RowObject> Clone for Rows<T> {
+    fn clone(&self) -> Self {
+        match self {
+            Self::Objects(rows) => Self::Objects(rows.clone()),
+            Self::View { rows, values } => Self::View {
+                rows: Arc::clone(rows),
+                values: values.clone(),
+            },
+            Self::Records(records) => Self::Records(records.clone()),
+        }
+    }
+}
+
+impl<'py, T> IntoPyObject<'py> for Rows<T>
+where
+    T: RowObject + IntoPyObject<'py>,
+{
+    type Target = PyAny;
+    type Output = Bound<'py, PyAny>;
+    type Error = PyErr;
+
+    fn into_pyobject(self, py: Python<'py>) -> Result<Self::Output, Self::Error> {
+        match self {
+            Self::Objects(rows) => rows.into_pyobject(py),
+            Self::View { rows, values } => RowSequence { rows, values }
+                .into_pyobject(py)
+                .map(Bound::into_any),
+            Self::Records(records) => records.to_list(py).map(Bound::into_any),
+        }
+    }
+}
+
+impl<T: RowObject> Rows<T> {
+    /// Build the rows of a table from the batches of the inner client, records hold `columns`.
+    ///
+    /// Only objects are converted here, views and records keep the batches.
+    pub fn convert(
+        batches: Vec<Vec<T::Inner>>,
+        options: &ConvertOptions,
+        columns: &Arc<Columns>,
+        values: &ValueConverter,
+    ) -> Self {
+        match options.row_format {
+            RowFormat::Objects => Self::Objects(batches.iter().flatten().map(T::from).collect()),
+            RowFormat::Lazy | RowFormat::NativeLazy => Self::View {
+                rows: Arc::new(Batches::new(batches)),
+                values: values.clone(),
+            },
+            RowFormat::Records | RowFormat::NativeRecords => Self::Records(RecordList {
+                rows: Arc::new(Batches::new(batches)),
+                columns: Arc::clone(columns),
+                values: values.clone(),
+                list: Arc::new(OnceLock::new()),
+            }),
+        }
+    }
+
+    /// The rows if they were converted to objects, `None` for views and records.
+    pub fn objects(&self) -> Option<&[T]> {
+        match self {
+            Self::Objects(rows) => Some(rows),
+            Self::View { .. } | Self::Records(_) => None,
+        }
+    }
+}
+
+/// Rows of a table that become a list of `Record`s when they are handed to python.
+pub struct RecordList<R> {
+    rows: Arc<Batches<R>>,
+    columns: Arc<Columns>,
+    values: ValueConverter,
+    /// The list, built once and shared by all clones.
+    list: Arc<OnceLock<Py<PyList>>>,
+}
+
+impl<R> Clone for RecordList<R> {
+    fn clone(&self) -> Self {
+        Self {
+            rows: Arc::clone(&self.rows),
+            columns: Arc::clone(&self.columns),
+            values: self.values.clone(),
+            list: Arc::clone(&self.list),
+        }
+    }
+}
+
+impl<R: Row> RecordList<R> {
+    fn to_list<'py>(&self, py: Python<'py>) -> PyResult<Bound<'py, PyList>> {
+        if let Some(list) = self.list.get() {
+            return Ok(list.bind(py).clone());
+        }
+
+        let records = self
+            .rows
+            .iter()
+            .map(|row| Record::new(py, row, &self.columns, &self.values))
+            .collect::<PyResult<Vec<_>>>()?;
+        let list = PyList::new(py, records)?.unbind();
+
+        // Another thread may have built the list while converting released the GIL, keep the
+        // first one so every access returns the same list.
+        Ok(self.list.get_or_init(|| list).bind(py).clone())
+    }
+}
+
+/// Converts the binary fields of rows to python values.
+#[derive(Clone, Debug, Default)]
+pub struct ValueConverter {
+    native_types: bool,
+    interner: Option<Arc<Interner>>,
+}
+
+impl ValueConverter {
+    /// Create a converter for a single response.
+    ///
+    /// If the row format interns strings, the interner of `options` is used if it has one, otherwise
+    /// values are only shared within the response.
+    pub fn new(options: &ConvertOptions) -> Self {
+        let interner = options
+            .row_format
+            .interns()
+            .then(|| match &options.interner {
+                Some(interner) => Arc::clone(interner),
+                None => Arc::new(Interner::new(None)),
+            });
+
+        Self {
+            native_types: options.row_format.native_types(),
+            interner,
+        }
+    }
+
+    /// Hex string, or int/bytes in native mode.
+    fn binary<T: Binary>(&self, py: Python<'_>, v: &Option<T>) -> PyResult<Py<PyAny>> {
+        match v {
+            Some(v) => self.binary_value(py, v),
+            None => Ok(py.None()),
+        }
+    }
+
+    fn binary_value<T: Binary>(&self, py: Python<'_>, v: &T) -> PyResult<Py<PyAny>> {
+        match (&self.interner, v.intern_key()) {
+            (Some(interner), Some(key)) => {
+                interner.get_or_insert(py, key, || self.convert_value(py, v))
+            }
+            _ => self.convert_value(py, v),
+        }
+    }
+
+    fn convert_value<T: Binary>(&self, py: Python<'_>, v: &T) -> PyResult<Py<PyAny>> {
+        if self.native_types {
+            v.to_native(py)
+        } else {
+            v.encode_hex().into_py_any(py)
+        }
+    }
+
+    fn binary_list<T: Binary>(&self, py: Python<'_>, v: &Option<Vec<T>>) -> PyResult<Py<PyAny>> {
+        match v {
+            Some(v) => v
+                .iter()
+                .map(|v| self.binary_value(py, v))
+                .collect::<PyResult<Vec<_>>>()?
+                .into_py_any(py),
+            None => Ok(py.None()),
+        }
+    }
+}
+
+/// Python objects of converted hashes and addresses by value, so repeated values share one
+/// object.
+#[derive(Debug)]
+pub struct Interner {
+    values: Mutex<HashMap<Box<[u8]>, Py<PyAny>>>,
+    /// The cache is cleared once it holds this many values.
+    capacity: Option<usize>,
+}
+
+impl Interner {
+    pub fn new(capacity: Option<usize>) -> Self {
+        Self {
+            values: Mutex::new(HashMap::new()),
+            capacity,
+        }
+    }
+
+    fn get_or_insert(
+        &self,
+        py: Python<'_>,
+        key: &[u8],
+        convert: impl FnOnce() -> PyResult<Py<PyAny>>,
+    ) -> PyResult<Py<PyAny>> {
+        let mut values = self.values.lock().unwrap();
+        if let Some(value) = values.get(key) {
+            return Ok(value.clone_ref(py));
+        }
+
+        let value = convert()?;
+        if self
+            .capacity
+            .is_some_and(|capacity| values.len() >= capacity)
+        {
+            values.clear();
+        }
+        values.insert(key.into(), value.clone_ref(py));
+
+        Ok(value)
+    }
+}
+
+/// Binary values of the inner client, which are hex encoded unless native types are requested.
+trait Binary: Hex {
+    fn to_native(&self, py: Python<'_>) -> PyResult<Py<PyAny>>;
+
+    /// Bytes to intern the converted value by, `None` if values of this type rarely repeat.
+    fn intern_key(&self) -> Option<&[u8]> {
+        None
+    }
+}
+
+/// Quantities become ints.
+impl Binary for Quantity {
+    fn to_native(&self, py: Python<'_>) -> PyResult<Py<PyAny>> {
+        BigUint::from_bytes_be(self.as_ref()).into_py_any(py)
+    }
+}
+
+/// Hashes, addresses and other fixed size values become bytes.
+impl<const N: usize> Binary for FixedSizeData<N> {
+    fn to_native(&self, py: Python<'_>) -> PyResult<Py<PyAny>> {
+        Ok(PyBytes::new(py, self.as_slice()).into_any().unbind())
+    }
+
+    fn intern_key(&self) -> Option<&[u8]> {
+        Some(self.as_slice())
+    }
+}
+
+/// Variable length data such as calldata becomes bytes.
+impl Binary for Data {
+    fn to_native(&self, py: Python<'_>) -> PyResult<Py<PyAny>> {
+        Ok(PyBytes::new(py, self).into_any().unbind())
+    }
+}
+
+/// Rows that can be converted one field at a time.
+pub trait Row: Send + Sync + 'static {
+    /// Names of the fields, same as the attributes of the matching object.
+    const FIELDS: &'static [&'static str];
+
+    /// Convert the field at `index` in `FIELDS`.
+    fn field(&self, py: Python<'_>, index: usize, values: &ValueConverter) -> PyResult<Py<PyAny>>;
+}
+
+type Getter<T> = for<'py> fn(&T, Python<'py>, &ValueConverter) -> PyResult<Py<PyAny>>;
+
+/// Implement `Row` from a list of `field => conversion` pairs, in the order of the attributes of
+/// the matching object.
+macro_rules! row {
+    ($ty:ty, |$row:ident, $py:ident, $values:ident| { $($name:ident => $value:expr,)* }) => {
+        impl Row for $ty {
+            const FIELDS: &'static [&'static str] = &[$(stringify!($name)),*];
+
+            fn field(
+                &self,
+                py: Python<'_>,
+                index: usize,
+                values: &ValueConverter,
+            ) -> PyResult<Py<PyAny>> {
+                const GETTERS: &[Getter<$ty>] = &[
+                    $(|$row: &$ty, $py: Python<'_>, $values: &ValueConverter| $value),*
+                ];
+                GETTERS[index](self, py, values)
+            }
+        }
+    };
+}
+
+/// Columns of a table that are kept by its records.
+#[derive(Debug)]
+pub struct Columns {
+    /// All fields of the row type.
+    fields: &'static [&'static str],
+    /// Indices of the kept fields in `fields`.
+    selected: Vec<usize>,
+}
+
+impl Columns {
+    /// Keep the fields of `R` named in `selection`, or all of them if nothing is selected.
+    pub fn new<R: Row>(selection: Option<&[String]>) -> Self {
+        let selected = match selection {
+            Some(names) if !names.is_empty() => (0..R::FIELDS.len())
+                .filter(|&index| {
+                    names
+                        .iter()
+                        .any(|name| attribute_name(name) == R::FIELDS[index])
+                })
+                .collect(),
+            _ => (0..R::FIELDS.len()).collect(),
+        };
+
+        Self {
+            fields: R::FIELDS,
+            selected,
+        }
+    }
+}
+
+/// Name of the attribute a selected column ends up in.
+fn attribute_name(column: &str) -> &str {
+    match column {
+        "from" => "from_",
+        "type" => "kind",
+        "topic0" | "topic1" | "topic2" | "topic3" => "topics",
+        column => column,
+    }
+}
+
+/// Columns kept by the records of each table, derived from the field selection of a query.
+#[derive(Debug)]
+pub struct Selection {
+    pub blocks: Arc<Columns>,
+    pub transactions: Arc<Columns>,
+    pub logs: Arc<Columns>,
+    pub traces: Arc<Columns>,
+}
+
+impl Selection {
+    pub fn new(selection: &FieldSelection) -> Self {
+        Self {
+            blocks: Arc::new(Columns::new::<simple_types::Block>(
+                selection.block.as_deref(),
+            )),
+            transactions: Arc::new(Columns::new::<simple_types::Transaction>(
+                selection.transaction.as_deref(),
+            )),
+            logs: Arc::new(Columns::new::<simple_types::Log>(selection.log.as_deref())),
+            traces: Arc::new(Columns::new::<simple_types::Trace>(
+                selection.trace.as_deref(),
+            )),
+        }
+    }
+}
+
+impl Default for Selection {
+    fn default() -> Self {
+        Self::new(&FieldSelection::default())
+    }
+}
+
+/// A row converted up front, holding a python value per selected column.
+///
+/// Fields that were not selected read as None, like on the matching object.
+#[pyclass]
+pub struct Record {
+    columns: Arc<Columns>,
+    values: Box<[Py<PyAny>]>,
+}
+
+impl Record {
+    fn new<T: Row>(
+        py: Python<'_>,
+        row: &T,
+        columns: &Arc<Columns>,
+        values: &ValueConverter,
+    ) -> PyResult<Self> {
+        Ok(Self {
+            columns: Arc::clone(columns),
+            values: columns
+                .selected
+                .iter()
+                .map(|&index| row.field(py, index, values))
+                .collect::<PyResult<_>>()?,
+        })
+    }
+}
+
+#[pymethods]
+impl Record {
+    fn __getattr__(&self, py: Python<'_>, name: &str) -> PyResult<Py<PyAny>> {
+        let columns = &self.columns;
+        if let Some(pos) = columns
+            .selected
+            .iter()
+            .position(|&index| columns.fields[index] == name)
+        {
+            return Ok(self.values[pos].clone_ref(py));
+        }
+
+        if columns.fields.contains(&name) {
+            Ok(py.None())
+        } else {
+            Err(PyAttributeError::new_err(name.to_owned()))
+        }
+    }
+
+    fn __dir__(&self) -> Vec<&'static str> {
+        self.columns.fields.to_vec()
+    }
+}
+
+/// Rows kept in the batches they were delivered in.
+pub struct Batches<T> {
+    batches: Vec<Vec<T>>,
+    /// Index of the first row of each batch.
+    offsets: Vec<usize>,
+    len: usize,
+}
+
+impl<T> Batches<T> {
+    pub fn new(batches: Vec<Vec<T>>) -> Self {
+        let mut offsets = Vec::with_capacity(batches.len());
+        let mut len = 0;
+        for batch in batches.iter() {
+            offsets.push(len);
+            len += batch.len();
+        }
+
+        Self {
+            batches,
+            offsets,
+            len,
+        }
+    }
+
+    pub fn iter(&self) -> impl Iterator<Item = &T> {
+        self.batches.iter().flatten()
+    }
+
+    pub fn get(&self, index: usize) -> Option<&T> {
+        if index >= self.len {
+            return None;
+        }
+        // The last batch starting at or before `index` contains it. An empty batch shares its
+        // offset with the batch after it, so it is never picked.
+        let batch = self.offsets.partition_point(|&offset| offset <= index) - 1;
+        self.batches[batch].get(index - self.offsets[batch])
+    }
+}
+
+/// Type erased `Batches`, so a single pyclass can view any kind of row.
+trait RowSource: Send + Sync {
+    fn len(&self) -> usize;
+    fn field(
+        &self,
+        py: Python<'_>,
+        row: usize,
+        field: usize,
+        values: &ValueConverter,
+    ) -> PyResult<Py<PyAny>>;
+    fn fields(&self) -> &'static [&'static str];
+}
+
+impl<T: Row> RowSource for Batches<T> {
+    fn len(&self) -> usize {
+        self.len
+    }
+
+    fn field(
+        &self,
+        py: Python<'_>,
+        row: usize,
+        field: usize,
+        values: &ValueConverter,
+    ) -> PyResult<Py<PyAny>> {
+        match self.get(row) {
+            Some(row) => row.field(py, field, values),
+            None => Err(PyIndexError::new_err("row index out of range")),
+        }
+    }
+
+    fn fields(&self) -> &'static [&'static str] {
+        T::FIELDS
+    }
+}
+
+/// Read-only sequence of rows that converts rows and fields only when they are accessed.
+#[pyclass]
+#[derive(Clone)]
+pub struct RowSequence {
+    rows: Arc<dyn RowSource>,
+    values: ValueConverter,
+}
+
+impl RowSequence {
+    fn view(&self, index: usize) -> RowView {
+        RowView {
+            rows: Arc::clone(&self.rows),
+            values: self.values.clone(),
+            index,
+        }
+    }
+}
+
+#[pymethods]
+impl RowSequence {
+    fn __len__(&self) -> usize {
+        self.rows.len()
+    }
+
+    fn __getitem__(&self, index: isize) -> PyResult<RowView> {
+        let len = self.rows.len();
+        let index = if index < 0 {
+            len.checked_sub(index.unsigned_abs())
+        } else {
+            Some(index.unsigned_abs()).filter(|&i| i < len)
+        };
+
+        match index {
+            Some(index) => Ok(self.view(index)),
+            None => Err(PyIndexError::new_err("row index out of range")),
+        }
+    }
+
+    fn __iter__(&self) -> RowIterator {
+        RowIterator {
+            rows: self.clone(),
+            next: 0,
+        }
+    }
+}
+
+#[pyclass]
+pub struct RowIterator {
+    rows: RowSequence,
+    next: usize,
+}
+
+#[pymethods]
+impl RowIterator {
+    fn __iter__(slf: PyRef<'_, Self>) -> PyRef<'_, Self> {
+        slf
+    }
+
+    fn __next__(&mut self) -> Option<RowView> {
+        if self.next >= self.rows.rows.len() {
+            return None;
+        }
+        let view = self.rows.view(self.next);
+        self.next += 1;
+
+        Some(view)
+    }
+}
+
+/// A single row of a `RowSequence`, fields are converted on attribute access.
+#[pyclass]
+pub struct RowView {
+    rows: Arc<dyn RowSource>,
+    values: ValueConverter,
+    index: usize,
+}
+
+#[pymethods]
+impl RowView {
+    fn __getattr__(&self, py: Python<'_>, name: &str) -> PyResult<Py<PyAny>> {
+        match self.rows.fields().iter().position(|field| *field == name) {
+            Some(field) => self.rows.field(py, self.index, field, &self.values),
+            None => Err(PyAttributeError::new_err(name.to_owned())),
+        }
+    }
+
+    fn __dir__(&self) -> Vec<&'static str> {
+        self.rows.fields().to_vec()
+    }
+}
+
+row!(simple_types::Block, |b, py, v| {
+    number => b.number.into_py_any(py),
+    hash => v.binary(py, &b.hash),
+    parent_hash => v.binary(py, &b.parent_hash),
+    nonce => v.binary(py, &b.nonce),
+    sha3_uncles => v.binary(py, &b.sha3_uncles),
+    logs_bloom => v.binary(py, &b.logs_bloom),
+    transactions_root => v.binary(py, &b.transactions_root),
+    state_root => v.binary(py, &b.state_root),
+    receipts_root => v.binary(py, &b.receipts_root),
+    miner => v.binary(py, &b.miner),
+    difficulty => v.binary(py, &b.difficulty),
+    total_difficulty => v.binary(py, &b.total_difficulty),
+    extra_data => v.binary(py, &b.extra_data),
+    size => v.binary(py, &b.size),
+    gas_limit => v.binary(py, &b.gas_limit),
+    gas_used => v.binary(py, &b.gas_used),
+    timestamp => v.binary(py, &b.timestamp),
+    uncles => v.binary_list(py, &b.uncles),
+    base_fee_per_gas => v.binary(py, &b.base_fee_per_gas),
+    blob_gas_used => v.binary(py, &b.blob_gas_used),
+    excess_blob_gas => v.binary(py, &b.excess_blob_gas),
+    parent_beacon_block_root => v.binary(py, &b.parent_beacon_block_root),
+    withdrawals_root => v.binary(py, &b.withdrawals_root),
+    withdrawals => b
+        .withdrawals
+        .as_ref()
+        .map(|w| w.iter().map(Withdrawal::from).collect::<Vec<_>>())
+        .into_py_any(py),
+    l1_block_number => b.l1_block_number.map(u64::from).into_py_any(py),
+    send_count => v.binary(py, &b.send_count),
+    send_root => v.binary(py, &b.send_root),
+    mix_hash => v.binary(py, &b.mix_hash),
+});
+
+row!(simple_types::Transaction, |t, py, v| {
+    block_hash => v.binary(py, &t.block_hash),
+    block_number => t.block_number.map(u64::from).into_py_any(py),
+    from_ => v.binary(py, &t.from),
+    gas => v.binary(py, &t.gas),
+    gas_price => v.binary(py, &t.gas_price),
+    hash => v.binary(py, &t.hash),
+    input => v.binary(py, &t.input),
+    nonce => v.binary(py, &t.nonce),
+    to => v.binary(py, &t.to),
+    transaction_index => t.transaction_index.map(u64::from).into_py_any(py),
+    value => v.binary(py, &t.value),
+    v => v.binary(py, &t.v),
+    r => v.binary(py, &t.r),
+    s => v.binary(py, &t.s),
+    y_parity => v.binary(py, &t.y_parity),
+    max_priority_fee_per_gas => v.binary(py, &t.max_priority_fee_per_gas),
+    max_fee_per_gas => v.binary(py, &t.max_fee_per_gas),
+    chain_id => t
+        .chain_id
+        .as_ref()
+        .map(|n| BigUint::from_bytes_be(n.as_ref()))
+        .into_py_any(py),
+    access_list => t
+        .access_list
+        .as_ref()
+        .map(|arr| arr.iter().map(AccessList::from).collect::<Vec<_>>())
+        .into_py_any(py),
+    max_fee_per_blob_gas => v.binary(py, &t.max_fee_per_blob_gas),
+    blob_versioned_hashes => v.binary_list(py, &t.blob_versioned_hashes),
+    cumulative_gas_used => v.binary(py, &t.cumulative_gas_used),
+    effective_gas_price => v.binary(py, &t.effective_gas_price),
+    gas_used => v.binary(py, &t.gas_used),
+    contract_address => v.binary(py, &t.contract_address),
+    logs_bloom => v.binary(py, &t.logs_bloom),
+    kind => t.type_.map(u8::from).into_py_any(py),
+    root => v.binary(py, &t.root),
+    status => t.status.map(|s| s.to_u8()).into_py_any(py),
+    l1_fee => v.binary(py, &t.l1_fee),
+    l1_gas_price => v.binary(py, &t.l1_gas_price),
+    l1_gas_used => v.binary(py, &t.l1_gas_used),
+    l1_fee_scalar => t.l1_fee_scalar.into_py_any(py),
+    gas_used_for_l1 => v.binary(py, &t.gas_used_for_l1),
+    blob_gas_price => v.binary(py, &t.blob_gas_price),
+    blob_gas_used => v.binary(py, &t.blob_gas_used),
+    deposit_nonce => v.binary(py, &t.deposit_nonce),
+    deposit_receipt_version => v.binary(py, &t.deposit_receipt_version),
+    l1_base_fee_scalar => v.binary(py, &t.l1_base_fee_scalar),
+    l1_blob_base_fee => v.binary(py, &t.l1_blob_base_fee),
+    l1_blob_base_fee_scalar => v.binary(py, &t.l1_blob_base_fee_scalar),
+    l1_block_number => v.binary(py, &t.l1_block_number),
+    mint => v.binary(py, &t.mint),
+    sighash => v.binary(py, &t.sighash),
+    source_hash => v.binary(py, &t.source_hash),
+});
+
+row!(simple_types::Log, |l, py, v| {
+    removed => l.removed.into_py_any(py),
+    log_index => l.log_index.map(u64::from).into_py_any(py),
+    transaction_index => l.transaction_index.map(u64::from).into_py_any(py),
+    transaction_hash => v.binary(py, &l.transaction_hash),
+    block_hash => v.binary(py, &l.block_hash),
+    block_number => l.block_number.map(u64::from).into_py_any(py),
+    address => v.binary(py, &l.address),
+    data => v.binary(py, &l.data),
+    topics => l
+        .topics
+        .iter()
+        .map(|t| v.binary(py, t))
+        .collect::<PyResult<Vec<_>>>()?
+        .into_py_any(py),
+});
+
+row!(simple_types::Trace, |t, py, v| {
+    from_ => v.binary(py, &t.from),
+    to => v.binary(py, &t.to),
+    call_type => t.call_type.as_deref().into_py_any(py),
+    gas => v.binary(py, &t.gas),
+    input => v.binary(py, &t.input),
+    init => v.binary(py, &t.init),
+    value => v.binary(py, &t.value),
+    author => v.binary(py, &t.author),
+    reward_type => t.reward_type.as_deref().into_py_any(py),
+    block_hash => v.binary(py, &t.block_hash),
+    block_number => t.block_number.into_py_any(py),
+    address => v.binary(py, &t.address),
+    code => v.binary(py, &t.code),
+    gas_used => v.binary(py, &t.gas_used),
+    output => v.binary(py, &t.output),
+    subtraces => t.subtraces.into_py_any(py),
+    trace_address => t.trace_address.as_deref().into_py_any(py),
+    transaction_hash => v.binary(py, &t.transaction_hash),
+    transaction_position => t.transaction_position.into_py_any(py),
+    kind => t.type_.as_deref().into_py_any(py),
+    error => t.error.as_deref().into_py_any(py),
+    sighash => v.binary(py, &t.sighash),
+    action_address => v.binary(py, &t.action_address),
+    balance => v.binary(py, &t.balance),
+    refund_address => v.binary(py, &t.refund_address),
+});
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_batches_get() {
+        let batches = Batches::new(vec![vec![], vec![0, 1, 2], vec![], vec![3], vec![]]);
+
+        assert_eq!(batches.len, 4);
+        for i in 0..4 {
+            assert_eq!(batches.get(i), Some(&i));
+        }
+        assert_eq!(batches.get(4), None);
+        assert_eq!(Batches::<usize>::new(Vec::new()).get(0), None);
+    }
+
+    #[test]
+    fn test_columns() {
+        let selection = ["from", "type", "hash", "unknown"].map(String::from);
+        let columns = Columns::new::<simple_types::Transaction>(Some(&selection));
+        let names = columns
+            .selected
+            .iter()
+            .map(|&index| columns.fields[index])
+            .collect::<Vec<_>>();
+        assert_eq!(names, ["from_", "hash", "kind"]);
+
+        let columns = Columns::new::<simple_types::Log>(Some(&["topic1".to_owned()]));
+        assert_eq!(columns.selected, [8]);
+
+        let columns = Columns::new::<simple_types::Block>(None);
+        assert_eq!(columns.selected.len(), simple_types::Block::FIELDS.len());
+    }
+}
@@ -0,0 +1,438 @@
+//! Range-sharded collection.
+//!
+//! `[from_block, to_block)` is split into one range per shard and every shard drives its own
+//! inner stream. When a shard runs out of work, a busy shard donates the upper half of its
+//! remaining range at the next response boundary. The split point is derived from the busy
+//! shard's `next_block` progress, so dense ranges get split while sparse ones are left alone.
+
+use std::collections::{BTreeMap, VecDeque};
+use std::fs;
+use std::path::PathBuf;
+use std::sync::{Arc, Mutex};
+
+use anyhow::{Context, Result};
+use hypersync_client::{net_types, ArrowResponse, Client, StreamConfig};
+use tokio::sync::Notify;
+use tokio::task::JoinSet;
+
+use crate::parquet_sink::{ParquetOptions, RangeFiles};
+
+/// A range is only split if at least this many responses worth of blocks are left in it,
+/// judged by the number of blocks per response seen so far.
+const MIN_RESPONSES_TO_SPLIT: u64 = 4;
+
+/// Collect `query` into a single arrow response by running `shard_count` independent streams.
+///
+/// Responses are merged in block order.
+pub async fn collect_arrow(
+    client: Arc<Client>,
+    query: net_types::Query,
+    config: StreamConfig,
+    shard_count: usize,
+) -> Result<ArrowResponse> {
+    let pages = Arc::new(Mutex::new(BTreeMap::new()));
+
+    run(
+        Arc::clone(&client),
+        query.clone(),
+        config.clone(),
+        shard_count,
+        Output::Arrow(Arc::clone(&pages)),
+    )
+    .await?;
+
+    let pages = std::mem::take(&mut *pages.lock().unwrap());
+    if pages.is_empty() {
+        // Empty range, let the inner client build the empty response.
+        return client.collect_arrow(query, config).await;
+    }
+
+    merge_pages(pages.into_values())
+}
+
+/// Collect `query` into parquet files under `path` by running `shard_count` independent
+/// streams.
+///
+/// Responses are written as they arrive. Every range processed by a shard is written to its own
+/// file per table, named `{table}_{from_block}_{to_block}.parquet`. Ranges are further split into
+/// multiple files if `parquet` configures rotation.
+pub async fn collect_parquet(
+    client: Arc<Client>,
+    path: &str,
+    query: net_types::Query,
+    config: StreamConfig,
+    shard_count: usize,
+    parquet: ParquetOptions,
+) -> Result<()> {
+    let dir = PathBuf::from(path);
+    fs::create_dir_all(&dir).context("create output directory")?;
+
+    run(
+        client,
+        query,
+        config,
+        shard_count,
+        Output::Parquet(dir, Arc::new(parquet)),
+    )
+    .await
+}
+
+#[derive(Clone)]
+enum Output {
+    /// Responses keyed by the first block they cover.
+    Arrow(Arc<Mutex<BTreeMap<u64, ArrowResponse>>>),
+    Parquet(PathBuf, Arc<ParquetOptions>),
+}
+
+impl Output {
+    /// Block at which the output file containing `block` ends.
+    fn rotation_boundary(&self, block: u64) -> Option<u64> {
+        match self {
+            Self::Arrow(_) => None,
+            Self::Parquet(_, options) => options.rotation_boundary(block),
+        }
+    }
+}
+
+struct Shared {
+    client: Arc<Client>,
+    query: net_types::Query,
+    config: StreamConfig,
+    output: Output,
+    scheduler: Scheduler,
+}
+
+async fn run(
+    client: Arc<Client>,
+    query: net_types::Query,
+    config: StreamConfig,
+    shard_count: usize,
+    output: Output,
+) -> Result<()> {
+    let to_block = match query.to_block {
+        Some(to_block) => to_block,
+        None => client.get_height().await.context("get height")?,
+    };
+
+    let shared = Arc::new(Shared {
+        scheduler: Scheduler::new(split_range(query.from_block, to_block, shard_count)),
+        client,
+        query,
+        config,
+        output,
+    });
+
+    let mut workers = JoinSet::new();
+    for _ in 0..shard_count {
+        workers.spawn(run_worker(Arc::clone(&shared)));
+    }
+
+    while let Some(res) = workers.join_next().await {
+        res.context("join shard worker")??;
+    }
+
+    Ok(())
+}
+
+/// Split `[from, to)` into at most `count` contiguous ranges of roughly equal size.
+fn split_range(from: u64, to: u64, count: usize) -> VecDeque<(u64, u64)> {
+    let len = to.saturating_sub(from);
+    let count = (count as u64).clamp(1, len.max(1));
+    let step = len.div_ceil(count).max(1);
+
+    (0..count)
+        .map(|i| (from + i * step, (from + (i + 1) * step).min(to)))
+        .filter(|(start, end)| start < end)
+        .collect()
+}
+
+struct SchedulerState {
+    queue: VecDeque<(u64, u64)>,
+    /// Number of ranges currently being processed.
+    active: usize,
+    /// Number of shards waiting for a range.
+    idle: usize,
+}
+
+struct Scheduler {
+    state: Mutex<SchedulerState>,
+    notify: Notify,
+}
+
+impl Scheduler {
+    fn new(queue: VecDeque<(u64, u64)>) -> Self {
+        Self {
+            state: Mutex::new(SchedulerState {
+                queue,
+                active: 0,
+                idle: 0,
+            }),
+            notify: Notify::new(),
+        }
+    }
+
+    /// Take the next range to process, waiting for a donation if the queue is empty.
+    ///
+    /// Returns None once the queue is empty and no other shard could donate work.
+    async fn next_range(&self) -> Option<(u64, u64)> {
+        loop {
+            let notified = self.notify.notified();
+
+            {
+                let mut state = self.state.lock().unwrap();
+                if let Some(range) = state.queue.pop_front() {
+                    state.active += 1;
+                    return Some(range);
+                }
+                if state.active == 0 {
+                    return None;
+                }
+                state.idle += 1;
+            }
+
+            notified.await;
+
+            self.state.lock().unwrap().idle -= 1;
+        }
+    }
+
+    fn finish_range(&self) {
+        self.state.lock().unwrap().active -= 1;
+        self.notify.notify_waiters();
+    }
+
+    /// Donate the upper half of `[pos, end)` if another shard is idle and the remaining range
+    /// is large compared to the progress made per response so far.
+    ///
+    /// Returns the new end of the caller's range.
+    fn try_donate(&self, range_start: u64, pos: u64, end: u64, num_responses: u64) -> Option<u64> {
+        let mut state = self.state.lock().unwrap();
+        if state.idle == 0 || !state.queue.is_empty() {
+            return None;
+        }
+
+        let blocks_per_response = ((pos - range_start) / num_responses.max(1)).max(1);
+        let remaining = end.saturating_sub(pos);
+        if remaining < 2 || remaining < blocks_per_response * MIN_RESPONSES_TO_SPLIT {
+            return None;
+        }
+
+        let mid = pos + remaining / 2;
+        state.queue.push_back((mid, end));
+        drop(state);
+        self.notify.notify_waiters();
+
+        Some(mid)
+    }
+}
+
+async fn run_worker(shared: Arc<Shared>) -> Result<()> {
+    while let Some(range) = shared.scheduler.next_range().await {
+        let res = run_range(&shared, range).await;
+        shared.scheduler.finish_range();
+        res.with_context(|| format!("collect range [{}, {})", range.0, range.1))?;
+    }
+
+    Ok(())
+}
+
+async fn run_range(shared: &Shared, (range_start, mut range_end): (u64, u64)) -> Result<()> {
+    let mut writer = RangeWriter::new(&shared.output, range_start);
+    let mut pos = range_start;
+    let mut num_responses = 0;
+
+    'restart: while pos < range_end {
+        // Streams stop at rotation boundaries so files cover exact block ranges.
+        let stream_end = shared
+            .output
+            .rotation_boundary(pos)
+            .map_or(range_end, |boundary| boundary.min(range_end));
+
+        let mut query = shared.query.clone();
+        query.from_block = pos;
+        query.to_block = Some(stream_end);
+
+        let mut rx = Arc::clone(&shared.client)
+            .stream_arrow(query, shared.config.clone())
+            .await
+            .context("start inner stream")?;
+
+        while let Some(resp) = rx.recv().await {
+            let resp = resp?;
+            let page_start = pos;
+            pos = resp.next_block;
+            num_responses += 1;
+
+            writer = writer.write(page_start, resp).await?;
+
+            if pos >= range_end {
+                break 'restart;
+            }
+
+            if pos >= stream_end {
+                writer = writer.rotate(&shared.output, pos).await?;
+                continue 'restart;
+            }
+
+            if writer.is_full() {
+                writer = writer.rotate(&shared.output, pos).await?;
+            }
+
+            if let Some(mid) =
+                shared
+                    .scheduler
+                    .try_donate(range_start, pos, range_end, num_responses)
+            {
+                // Dropping the receiver stops the inner stream, restart it for the part
+                // of the range this shard kept.
+                range_end = mid;
+                continue 'restart;
+            }
+        }
+
+        // The inner stream finished before range_end, the server doesn't have more data.
+        break;
+    }
+
+    writer.finish(pos.min(range_end)).await
+}
+
+/// Merge responses that are already sorted by block number into one response.
+fn merge_pages(pages: impl IntoIterator<Item = ArrowResponse>) -> Result<ArrowResponse> {
+    let mut pages = pages.into_iter();
+    let mut merged = pages.next().context("no responses to merge")?;
+
+    for page in pages {
+        merged.data.blocks.extend(page.data.blocks);
+        merged.data.transactions.extend(page.data.transactions);
+        merged.data.logs.extend(page.data.logs);
+        merged.data.traces.extend(page.data.traces);
+        merged.data.decoded_logs.extend(page.data.decoded_logs);
+        merged.archive_height = merged.archive_height.max(page.archive_height);
+        merged.total_execution_time += page.total_execution_time;
+        merged.next_block = page.next_block;
+        merged.rollback_guard = page.rollback_guard;
+    }
+
+    Ok(merged)
+}
+
+/// Writes the responses of a single range to the configured output.
+///
+/// Parquet encoding, compression and file IO run on the blocking thread pool, so methods take
+/// the writer by value and hand it back once the work is done.
+enum RangeWriter {
+    Arrow(Arc<Mutex<BTreeMap<u64, ArrowResponse>>>),
+    Parquet {
+        files: RangeFiles,
+        rotate_bytes: Option<usize>,
+    },
+}
+
+impl RangeWriter {
+    fn new(output: &Output, range_start: u64) -> Self {
+        match output {
+            Output::Arrow(pages) => Self::Arrow(Arc::clone(pages)),
+            Output::Parquet(dir, options) => Self::Parquet {
+                files: RangeFiles::new(dir.clone(), options.props.clone(), range_start),
+                rotate_bytes: options.rotate_bytes,
+            },
+        }
+    }
+
+    async fn write(self, page_start: u64, resp: ArrowResponse) -> Result<Self> {
+        match self {
+            Self::Arrow(pages) => {
+                pages.lock().unwrap().insert(page_start, resp);
+                Ok(Self::Arrow(pages))
+            }
+            Self::Parquet {
+                mut files,
+                rotate_bytes,
+            } => {
+                let files = blocking(move || {
+                    files.write(resp)?;
+                    Ok(files)
+                })
+                .await?;
+                Ok(Self::Parquet {
+                    files,
+                    rotate_bytes,
+                })
+            }
+        }
+    }
+
+    /// Whether the current files reached the configured size.
+    fn is_full(&self) -> bool {
+        match self {
+            Self::Arrow(_) => false,
+            Self::Parquet {
+                files,
+                rotate_bytes,
+            } => rotate_bytes.is_some_and(|max| files.size() >= max),
+        }
+    }
+
+    /// Finish the current files at `pos` and continue writing into new ones.
+    async fn rotate(self, output: &Output, pos: u64) -> Result<Self> {
+        match self {
+            Self::Arrow(_) => Ok(self),
+            Self::Parquet { .. } => {
+                self.finish(pos).await?;
+                Ok(Self::new(output, pos))
+            }
+        }
+    }
+
+    async fn finish(self, range_end: u64) -> Result<()> {
+        match self {
+            Self::Arrow(_) => Ok(()),
+            Self::Parquet { files, .. } => blocking(move || files.finish(range_end)).await,
+        }
+    }
+}
+
+/// Run parquet work on the blocking thread pool instead of a runtime worker.
+async fn blocking<T, F>(f: F) -> Result<T>
+where
+    T: Send + 'static,
+    F: FnOnce() -> Result<T> + Send + 'static,
+{
+    tokio::task::spawn_blocking(f)
+        .await
+        .context("join parquet task")?
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_split_range() {
+        assert_eq!(
+            split_range(0, 10, 3),
+            VecDeque::from(vec![(0, 4), (4, 8), (8, 10)])
+        );
+        assert_eq!(split_range(5, 7, 4), VecDeque::from(vec![(5, 6), (6, 7)]));
+        assert_eq!(split_range(5, 5, 4), VecDeque::new());
+    }
+
+    #[test]
+    fn test_try_donate() {
+        let scheduler = Scheduler::new(VecDeque::new());
+
+        // nobody is idle
+        assert_eq!(scheduler.try_donate(0, 10, 100, 1), None);
+
+        scheduler.state.lock().unwrap().idle = 1;
+        // 10 blocks per response, 90 blocks left, split in the middle
+        assert_eq!(scheduler.try_donate(0, 10, 100, 1), Some(55));
+        assert_eq!(
+            scheduler.state.lock().unwrap().queue.pop_front(),
+            Some((55, 100))
+        );
+        // 50 blocks per response, only 50 left
+        assert_eq!(scheduler.try_donate(0, 50, 100, 1), None);
+    }
+}
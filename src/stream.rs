@@ -0,0 +1,557 @@
+use std::future::Future;
+use std::sync::{
+    atomic::{AtomicUsize, Ordering},
+    Arc,
+};
+use std::time::{Duration, Instant};
+
+use anyhow::{Context, Result};
+use hypersync_client::{net_types, Client, StreamConfig};
+use pyo3::{Bound, BoundObject, IntoPyObject, PyAny, PyErr, Python};
+use tokio::sync::{mpsc, OwnedSemaphorePermit, Semaphore};
+
+use crate::{
+    arrow_ffi::TableFormat,
+    checkpoint::{Checkpoint, CheckpointStore, Checkpointed},
+    column_layout::ColumnLayout,
+    decode_arrow::EventTables,
+    metrics::{millis, Metrics, Timed},
+    parquet_sink::ParquetOptions,
+    response::ConvertOptions,
+    tail::{self, Progress, TailOptions},
+    types::Rollback,
+};
+
+/// Default number of converted responses buffered ahead of the consumer.
+pub const DEFAULT_PREFETCH: usize = 1;
+
+/// Granularity of the memory budget semaphore, permits are counted in KiB so budgets larger
+/// than 4GiB fit into a single `acquire_many` call.
+const BUDGET_UNIT: usize = 1024;
+
+/// Stream options that are handled by this crate instead of the inner client.
+#[derive(Clone, Debug)]
+pub struct StreamOptions {
+    /// Maximum number of converted responses buffered ahead of the consumer.
+    pub prefetch: usize,
+    /// Maximum number of bytes of responses buffered ahead of the consumer.
+    pub memory_budget_bytes: Option<usize>,
+    /// Store that acknowledged progress is written to and resumed from.
+    pub checkpoint: Option<Arc<CheckpointStore>>,
+    /// Number of independent streams used by collect_arrow and collect_parquet.
+    pub shard_count: Option<usize>,
+    /// Keep streaming past the height of the server if set.
+    pub tail: Option<TailOptions>,
+    /// Write collect_parquet output incrementally with these options if set.
+    pub parquet: Option<ParquetOptions>,
+    /// Counters of the client the stream belongs to.
+    pub metrics: Option<Arc<Metrics>>,
+    /// Conversion options of the client the stream belongs to.
+    pub convert: ConvertOptions,
+    /// Decode the logs of arrow responses into a table per event if set.
+    pub event_tables: Option<Arc<EventTables>>,
+    /// Python type of the tables of arrow responses.
+    pub table_format: TableFormat,
+    /// Layout of the hash and address columns of arrow responses.
+    pub column_layout: ColumnLayout,
+}
+
+impl Default for StreamOptions {
+    fn default() -> Self {
+        Self {
+            prefetch: DEFAULT_PREFETCH,
+            memory_budget_bytes: None,
+            checkpoint: None,
+            shard_count: None,
+            tail: None,
+            parquet: None,
+            metrics: None,
+            convert: ConvertOptions::default(),
+            event_tables: None,
+            table_format: TableFormat::default(),
+            column_layout: ColumnLayout::default(),
+        }
+    }
+}
+
+impl StreamOptions {
+    /// Record delivered responses in `metrics`.
+    pub fn with_metrics(self, metrics: Arc<Metrics>) -> Self {
+        Self {
+            metrics: Some(metrics),
+            ..self
+        }
+    }
+
+    /// Convert responses with the options of the client, sharing one interner between all
+    /// responses of the stream.
+    pub fn with_convert(self, convert: ConvertOptions) -> Self {
+        Self {
+            convert: convert.with_shared_interner(),
+            ..self
+        }
+    }
+
+    /// Move `query.from_block` forward to the stored checkpoint, if there is one.
+    ///
+    /// Returns false if the checkpoint shows the query is already finished.
+    pub fn resume(&self, query: &mut net_types::Query) -> Result<bool> {
+        let store = match &self.checkpoint {
+            Some(store) => store,
+            None => return Ok(true),
+        };
+
+        let checkpoint = match store.load().context("load checkpoint")? {
+            Some(checkpoint) => checkpoint,
+            None => return Ok(true),
+        };
+
+        if checkpoint.next_block > query.from_block {
+            query.from_block = checkpoint.next_block;
+        }
+
+        Ok(query
+            .to_block
+            .map_or(true, |to_block| query.from_block < to_block))
+    }
+}
+
+/// Item of a stream, either a response or a notice that delivered data was rolled back.
+pub enum Message<T> {
+    Response(T),
+    Rollback(Rollback),
+}
+
+impl<T> Message<T> {
+    pub fn try_map<U>(self, f: impl FnOnce(T) -> Result<U>) -> Result<Message<U>> {
+        match self {
+            Self::Response(resp) => f(resp).map(Message::Response),
+            Self::Rollback(rollback) => Ok(Message::Rollback(rollback)),
+        }
+    }
+}
+
+impl<T: Checkpointed> Checkpointed for Message<T> {
+    fn checkpoint(&self) -> Option<Checkpoint> {
+        match self {
+            Self::Response(resp) => resp.checkpoint(),
+            // Acknowledging a rollback rewinds the checkpoint.
+            Self::Rollback(rollback) => Some(Checkpoint {
+                next_block: rollback.block_number,
+                rollback_guard: None,
+            }),
+        }
+    }
+}
+
+impl<'py, T> IntoPyObject<'py> for Message<T>
+where
+    T: IntoPyObject<'py>,
+{
+    type Target = PyAny;
+    type Output = Bound<'py, PyAny>;
+    type Error = PyErr;
+
+    fn into_pyobject(self, py: Python<'py>) -> Result<Self::Output, Self::Error> {
+        match self {
+            Self::Response(resp) => resp
+                .into_pyobject(py)
+                .map(|obj| obj.into_any().into_bound())
+                .map_err(Into::into),
+            Self::Rollback(rollback) => rollback.into_pyobject(py).map(Bound::into_any),
+        }
+    }
+}
+
+/// Receiving end of an inner stream, tail streams also deliver rollbacks.
+pub enum Upstream<R> {
+    Plain(mpsc::Receiver<Result<R>>),
+    Tail(mpsc::Receiver<Result<Message<R>>>),
+}
+
+impl<R> Upstream<R> {
+    /// Receive the next response or rollback, `None` once the stream is finished.
+    pub async fn recv(&mut self) -> Option<Result<Message<R>>> {
+        match self {
+            Self::Plain(rx) => rx.recv().await.map(|res| res.map(Message::Response)),
+            Self::Tail(rx) => rx.recv().await,
+        }
+    }
+
+    pub fn close(&mut self) {
+        match self {
+            Self::Plain(rx) => rx.close(),
+            Self::Tail(rx) => rx.close(),
+        }
+    }
+}
+
+/// Start an inner stream with `start`, applying the checkpoint and tail options.
+pub async fn open<R, F, Fut>(
+    client: Arc<Client>,
+    mut query: net_types::Query,
+    config: StreamConfig,
+    options: &StreamOptions,
+    start: F,
+) -> Result<Upstream<R>>
+where
+    R: Progress + Send + 'static,
+    F: Fn(Arc<Client>, net_types::Query, StreamConfig) -> Fut + Send + 'static,
+    Fut: Future<Output = Result<mpsc::Receiver<Result<R>>>> + Send + 'static,
+{
+    if !options.resume(&mut query)? {
+        return Ok(Upstream::Plain(finished()));
+    }
+
+    match &options.tail {
+        Some(tail_options) => Ok(Upstream::Tail(tail::tail(
+            client,
+            query,
+            config,
+            tail_options.clone(),
+            start,
+        ))),
+        None => start(client, query, config)
+            .await
+            .context("start inner stream")
+            .map(Upstream::Plain),
+    }
+}
+
+/// A receiver for a stream that has nothing left to deliver.
+pub fn finished<R>() -> mpsc::Receiver<Result<R>> {
+    let (_, rx) = mpsc::channel(1);
+    rx
+}
+
+/// Buffer occupancy counters shared between the converter task and the stream object.
+#[derive(Default, Debug)]
+pub struct BufferStats {
+    bytes: AtomicUsize,
+    depth: AtomicUsize,
+}
+
+impl BufferStats {
+    /// Approximate size of the responses that are buffered but not yet received.
+    pub fn buffered_bytes(&self) -> usize {
+        self.bytes.load(Ordering::Relaxed)
+    }
+
+    /// Number of responses that are buffered but not yet received.
+    pub fn queue_depth(&self) -> usize {
+        self.depth.load(Ordering::Relaxed)
+    }
+
+    fn add(&self, bytes: usize) {
+        self.bytes.fetch_add(bytes, Ordering::Relaxed);
+        self.depth.fetch_add(1, Ordering::Relaxed);
+    }
+
+    fn release(&self, bytes: usize) {
+        self.bytes.fetch_sub(bytes, Ordering::Relaxed);
+        self.depth.fetch_sub(1, Ordering::Relaxed);
+    }
+}
+
+/// A converted response waiting in the stream buffer.
+struct Buffered<T> {
+    item: Result<T>,
+    bytes: usize,
+    /// Share of the memory budget held by this response, returned when it is received.
+    _permit: Option<OwnedSemaphorePermit>,
+    buffered_at: Instant,
+}
+
+/// Receiving end of a converted response stream.
+///
+/// Responses are converted by a background task (see `spawn_converter`) so conversion of
+/// response N+1 overlaps with the caller processing response N.
+pub struct ResponseReceiver<T> {
+    rx: mpsc::Receiver<Buffered<T>>,
+    stats: Arc<BufferStats>,
+    /// Error drained by `recv_many` after some successful responses, returned on the next call.
+    pending_err: Option<anyhow::Error>,
+    checkpoint: Option<Arc<CheckpointStore>>,
+    /// Progress of the last delivered response, saved once the consumer asks for more.
+    unacked: Option<Checkpoint>,
+    metrics: Option<Arc<Metrics>>,
+}
+
+impl<T: Checkpointed + Timed> ResponseReceiver<T> {
+    pub fn stats(&self) -> Arc<BufferStats> {
+        Arc::clone(&self.stats)
+    }
+
+    pub fn close(&mut self) {
+        self.rx.close();
+    }
+
+    fn unwrap_buffered(&self, buffered: Buffered<T>) -> Result<T> {
+        self.stats.release(buffered.bytes);
+
+        let mut item = buffered.item;
+        match &mut item {
+            Ok(resp) => {
+                if let Some(timing) = resp.timing_mut() {
+                    timing.queued_ms = millis(buffered.buffered_at.elapsed());
+                    if let Some(metrics) = &self.metrics {
+                        metrics.record(timing);
+                    }
+                }
+            }
+            Err(_) => {
+                if let Some(metrics) = &self.metrics {
+                    metrics.record_error();
+                }
+            }
+        }
+
+        item
+    }
+
+    /// Save the progress of the previously delivered responses.
+    ///
+    /// Asking for the next response acknowledges everything delivered before it. The progress
+    /// stays unacknowledged if saving fails, so the next call retries it.
+    async fn ack(&mut self) -> Result<()> {
+        if let (Some(store), Some(checkpoint)) = (&self.checkpoint, &self.unacked) {
+            let store = Arc::clone(store);
+            let checkpoint = checkpoint.clone();
+            tokio::task::spawn_blocking(move || store.save(&checkpoint))
+                .await
+                .context("join checkpoint save")?
+                .context("save checkpoint")?;
+            self.unacked = None;
+        }
+
+        Ok(())
+    }
+
+    fn track(&mut self, delivered: &T) {
+        if self.checkpoint.is_some() {
+            if let Some(checkpoint) = delivered.checkpoint() {
+                self.unacked = Some(checkpoint);
+            }
+        }
+    }
+
+    /// Receive the next response, returns None if the stream is finished.
+    pub async fn recv(&mut self) -> Result<Option<T>> {
+        self.ack().await?;
+
+        if let Some(err) = self.pending_err.take() {
+            return Err(err);
+        }
+
+        match self.rx.recv().await {
+            Some(buffered) => {
+                let resp = self.unwrap_buffered(buffered)?;
+                self.track(&resp);
+                Ok(Some(resp))
+            }
+            None => Ok(None),
+        }
+    }
+
+    /// Wait for at least one response and drain up to `max_items` buffered responses.
+    ///
+    /// Returns None if the stream is finished and an empty vec if `timeout` elapsed before any
+    /// response arrived.
+    pub async fn recv_many(
+        &mut self,
+        max_items: usize,
+        timeout: Option<Duration>,
+    ) -> Result<Option<Vec<T>>> {
+        self.ack().await?;
+
+        if let Some(err) = self.pending_err.take() {
+            return Err(err);
+        }
+
+        let mut buf = Vec::with_capacity(max_items);
+        let num_received = match timeout {
+            Some(timeout) => {
+                match tokio::time::timeout(timeout, self.rx.recv_many(&mut buf, max_items)).await {
+                    Ok(n) => n,
+                    Err(_) => return Ok(Some(Vec::new())),
+                }
+            }
+            None => self.rx.recv_many(&mut buf, max_items).await,
+        };
+
+        if num_received == 0 {
+            return Ok(None);
+        }
+
+        let mut out = Vec::with_capacity(num_received);
+        let mut buf = buf.into_iter();
+        while let Some(buffered) = buf.next() {
+            match self.unwrap_buffered(buffered) {
+                Ok(v) => out.push(v),
+                Err(e) => {
+                    // The converter stops after forwarding an error so nothing should follow
+                    // it, release whatever did so the buffer stats stay accurate.
+                    for rest in buf.by_ref() {
+                        self.stats.release(rest.bytes);
+                    }
+                    if out.is_empty() {
+                        return Err(e);
+                    }
+                    self.pending_err = Some(e);
+                }
+            }
+        }
+
+        for delivered in &out {
+            self.track(delivered);
+        }
+
+        Ok(Some(out))
+    }
+}
+
+/// Spawn a task that pulls responses from `upstream`, converts them and keeps them buffered
+/// for the consumer.
+///
+/// At most `options.prefetch` converted responses are buffered. If a memory budget is
+/// configured, the task also stops pulling from `upstream` while the buffered responses,
+/// as measured by `size_of`, exceed it. A single response larger than the budget is still
+/// let through once the buffer is empty. Responses held by the inner client's channel are
+/// not counted against the budget.
+///
+/// The task stops after forwarding the first error or when the returned receiver is closed.
+pub fn spawn_converter<R, T, C, S>(
+    mut upstream: mpsc::Receiver<Result<R>>,
+    options: &StreamOptions,
+    convert: C,
+    size_of: S,
+) -> ResponseReceiver<T>
+where
+    R: Send + 'static,
+    T: Timed + Send + 'static,
+    C: Fn(R) -> Result<T> + Send + 'static,
+    S: Fn(&R) -> usize + Send + 'static,
+{
+    let (tx, rx) = mpsc::channel(options.prefetch.max(1));
+    let stats = Arc::new(BufferStats::default());
+    let budget = options
+        .memory_budget_bytes
+        .map(|bytes| budget_units(bytes).clamp(1, Semaphore::MAX_PERMITS));
+
+    let task_stats = Arc::clone(&stats);
+    tokio::spawn(async move {
+        let semaphore = budget.map(|units| Arc::new(Semaphore::new(units)));
+
+        loop {
+            let wait_start = Instant::now();
+            let resp = tokio::select! {
+                resp = upstream.recv() => resp,
+                _ = tx.closed() => break,
+            };
+            let wait = wait_start.elapsed();
+
+            let resp = match resp {
+                Some(resp) => resp,
+                None => break,
+            };
+
+            let bytes = resp.as_ref().map(&size_of).unwrap_or(0);
+
+            let permit = match (&semaphore, budget) {
+                (Some(semaphore), Some(budget)) => {
+                    let units = budget_units(bytes).clamp(1, budget);
+                    let units = u32::try_from(units).unwrap_or(u32::MAX);
+                    tokio::select! {
+                        permit = Arc::clone(semaphore).acquire_many_owned(units) => {
+                            Some(permit.expect("semaphore is never closed"))
+                        }
+                        _ = tx.closed() => break,
+                    }
+                }
+                _ => None,
+            };
+
+            task_stats.add(bytes);
+
+            let item = resp.and_then(&convert).map(|mut resp| {
+                if let Some(timing) = resp.timing_mut() {
+                    timing.fetch_wait_ms = millis(wait);
+                    timing.decoded_bytes = bytes as u64;
+                }
+                resp
+            });
+            // Checked after conversion so a failed conversion also ends the stream.
+            let is_err = item.is_err();
+            let buffered = Buffered {
+                item,
+                bytes,
+                _permit: permit,
+                buffered_at: Instant::now(),
+            };
+
+            if tx.send(buffered).await.is_err() {
+                task_stats.release(bytes);
+                break;
+            }
+            if is_err {
+                break;
+            }
+        }
+
+        upstream.close();
+    });
+
+    ResponseReceiver {
+        rx,
+        stats,
+        pending_err: None,
+        checkpoint: options.checkpoint.clone(),
+        unacked: None,
+        metrics: options.metrics.clone(),
+    }
+}
+
+/// Like `spawn_converter`, for the responses and rollbacks of an inner stream.
+pub fn spawn_message_converter<R, T, C, S>(
+    upstream: Upstream<R>,
+    options: &StreamOptions,
+    convert: C,
+    size_of: S,
+) -> ResponseReceiver<Message<T>>
+where
+    R: Send + 'static,
+    T: Timed + Send + 'static,
+    C: Fn(R) -> Result<T> + Send + 'static,
+    S: Fn(&R) -> usize + Send + 'static,
+{
+    match upstream {
+        Upstream::Plain(rx) => spawn_converter(
+            rx,
+            options,
+            move |resp| convert(resp).map(Message::Response),
+            size_of,
+        ),
+        Upstream::Tail(rx) => spawn_converter(
+            rx,
+            options,
+            move |msg| msg.try_map(&convert),
+            move |msg| match msg {
+                Message::Response(resp) => size_of(resp),
+                Message::Rollback(_) => 0,
+            },
+        ),
+    }
+}
+
+fn budget_units(bytes: usize) -> usize {
+    bytes.div_ceil(BUDGET_UNIT)
+}
+
+/// Parse the optional `timeout` argument of `recv_many`, given in seconds.
+pub fn parse_timeout(timeout: Option<f64>) -> Result<Option<Duration>> {
+    timeout
+        .map(|t| {
+            Duration::try_from_secs_f64(t).map_err(|e| anyhow::anyhow!("invalid timeout: {e}"))
+        })
+        .transpose()
+}
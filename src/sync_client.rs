@@ -0,0 +1,196 @@
+use std::future::Future;
+
+use anyhow::Result;
+use pyo3::prelude::*;
+
+use crate::{
+    client::ClientCore,
+    config::{ClientConfig, StreamConfig},
+    metrics::ClientMetrics,
+    query::Query,
+    response::{
+        ArrowBatchStream, ArrowEventResponse, ArrowEventStream, ArrowResponse, ArrowStream,
+        EventResponse, EventStream, MultiQueryStream, QueryResponse, QueryResponseStream,
+    },
+    types::RateLimitInfo,
+};
+
+/// Run `fut` to completion on the shared tokio runtime, releasing the GIL while it runs.
+pub fn block_on<F>(py: Python<'_>, fut: F) -> F::Output
+where
+    F: Future + Send,
+    F::Output: Send,
+{
+    py.detach(|| pyo3_async_runtimes::tokio::get_runtime().block_on(fut))
+}
+
+/// Blocking counterpart of `HypersyncClient`.
+///
+/// Every method blocks the calling thread on the shared tokio runtime and releases the GIL while
+/// waiting, so it can be used from threads that don't run an asyncio event loop.
+#[pyclass]
+pub struct SyncHypersyncClient {
+    core: ClientCore,
+}
+
+#[pymethods]
+impl SyncHypersyncClient {
+    /// Create a new client with given config
+    #[new]
+    fn new(config: ClientConfig) -> Result<SyncHypersyncClient> {
+        Ok(SyncHypersyncClient {
+            core: ClientCore::new(config)?,
+        })
+    }
+
+    /// Counters aggregated over all responses delivered by this client
+    pub fn metrics(&self) -> ClientMetrics {
+        self.core.metrics()
+    }
+
+    /// Get the height of the source hypersync instance
+    pub fn get_height(&self, py: Python<'_>) -> Result<u64> {
+        block_on(py, self.core.clone().get_height())
+    }
+
+    /// Get the chain_id of the source hypersync instance
+    pub fn get_chain_id(&self, py: Python<'_>) -> Result<u64> {
+        block_on(py, self.core.clone().get_chain_id())
+    }
+
+    pub fn collect(
+        &self,
+        query: Query,
+        config: StreamConfig,
+        py: Python<'_>,
+    ) -> Result<QueryResponse> {
+        block_on(py, self.core.clone().collect(query, config))
+    }
+
+    pub fn collect_events(
+        &self,
+        query: Query,
+        config: StreamConfig,
+        py: Python<'_>,
+    ) -> Result<EventResponse> {
+        block_on(py, self.core.clone().collect_events(query, config))
+    }
+
+    pub fn collect_arrow(
+        &self,
+        query: Query,
+        config: StreamConfig,
+        py: Python<'_>,
+    ) -> Result<ArrowResponse> {
+        block_on(py, self.core.clone().collect_arrow(query, config))
+    }
+
+    pub fn collect_events_arrow(
+        &self,
+        query: Query,
+        config: StreamConfig,
+        py: Python<'_>,
+    ) -> Result<ArrowEventResponse> {
+        block_on(py, self.core.clone().collect_events_arrow(query, config))
+    }
+
+    pub fn collect_parquet(
+        &self,
+        path: String,
+        query: Query,
+        config: StreamConfig,
+        py: Python<'_>,
+    ) -> Result<()> {
+        block_on(py, self.core.clone().collect_parquet(path, query, config))
+    }
+
+    pub fn get(&self, query: Query, py: Python<'_>) -> Result<QueryResponse> {
+        block_on(py, self.core.clone().get(query))
+    }
+
+    pub fn get_events(&self, query: Query, py: Python<'_>) -> Result<EventResponse> {
+        block_on(py, self.core.clone().get_events(query))
+    }
+
+    pub fn get_arrow(&self, query: Query, py: Python<'_>) -> Result<ArrowResponse> {
+        block_on(py, self.core.clone().get_arrow(query))
+    }
+
+    /// Get blockchain data for a single query, with rate limit info
+    pub fn get_with_rate_limit(
+        &self,
+        query: Query,
+        py: Python<'_>,
+    ) -> Result<(QueryResponse, RateLimitInfo)> {
+        block_on(py, self.core.clone().get_with_rate_limit(query))
+    }
+
+    /// Get the most recently observed rate limit information.
+    /// Returns None if no requests have been made yet.
+    pub fn rate_limit_info(&self) -> Option<RateLimitInfo> {
+        self.core.rate_limit_info()
+    }
+
+    /// Wait until the current rate limit window resets.
+    /// Returns immediately if no rate limit info observed or quota available.
+    pub fn wait_for_rate_limit(&self, py: Python<'_>) {
+        block_on(py, self.core.clone().wait_for_rate_limit())
+    }
+
+    pub fn stream(
+        &self,
+        query: Query,
+        config: StreamConfig,
+        py: Python<'_>,
+    ) -> Result<QueryResponseStream> {
+        block_on(py, self.core.clone().stream(query, config))
+    }
+
+    pub fn stream_events(
+        &self,
+        query: Query,
+        config: StreamConfig,
+        py: Python<'_>,
+    ) -> Result<EventStream> {
+        block_on(py, self.core.clone().stream_events(query, config))
+    }
+
+    pub fn stream_arrow(
+        &self,
+        query: Query,
+        config: StreamConfig,
+        py: Python<'_>,
+    ) -> Result<ArrowStream> {
+        block_on(py, self.core.clone().stream_arrow(query, config))
+    }
+
+    pub fn stream_events_arrow(
+        &self,
+        query: Query,
+        config: StreamConfig,
+        py: Python<'_>,
+    ) -> Result<ArrowEventStream> {
+        block_on(py, self.core.clone().stream_events_arrow(query, config))
+    }
+
+    pub fn stream_arrow_batches(
+        &self,
+        query: Query,
+        config: StreamConfig,
+        py: Python<'_>,
+    ) -> Result<ArrowBatchStream> {
+        block_on(py, self.core.clone().stream_arrow_batches(query, config))
+    }
+
+    /// Stream many queries at once, sharing one request concurrency limit and one buffer.
+    ///
+    /// Responses are tagged with the index of their query in `queries`.
+    pub fn stream_many(
+        &self,
+        queries: Vec<Query>,
+        config: StreamConfig,
+        py: Python<'_>,
+    ) -> Result<MultiQueryStream> {
+        block_on(py, self.core.clone().stream_many(queries, config))
+    }
+}
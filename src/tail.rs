@@ -0,0 +1,211 @@
+//! Live tail mode for streams.
+//!
+//! The inner client stops a stream once it reaches the height of the server. In tail mode the
+//! stream is restarted from the last `next_block` as soon as the server reports a higher
+//! height, so the consumer keeps receiving new blocks as they are produced.
+
+use std::future::Future;
+use std::sync::Arc;
+use std::time::Duration;
+
+use anyhow::{Context, Result};
+use hypersync_client::{net_types, Client, StreamConfig};
+use tokio::sync::mpsc;
+
+use crate::{
+    reorg::{ReorgDetector, DEFAULT_REORG_BUFFER_SIZE},
+    stream::Message,
+    types::Rollback,
+};
+
+/// Default delay before asking the server for a new height after catching up.
+pub const DEFAULT_POLL_INTERVAL: Duration = Duration::from_millis(200);
+/// Default cap for the poll interval, which doubles every time the height hasn't moved.
+pub const DEFAULT_MAX_POLL_INTERVAL: Duration = Duration::from_secs(2);
+
+#[derive(Clone, Debug)]
+pub struct TailOptions {
+    /// Delay before the first height poll after the stream caught up with the server.
+    pub poll_interval: Duration,
+    /// Upper bound of the exponentially growing delay between height polls.
+    pub max_poll_interval: Duration,
+    /// Number of block hashes kept to detect reorgs, 0 disables reorg detection.
+    pub reorg_buffer_size: usize,
+}
+
+impl Default for TailOptions {
+    fn default() -> Self {
+        Self {
+            poll_interval: DEFAULT_POLL_INTERVAL,
+            max_poll_interval: DEFAULT_MAX_POLL_INTERVAL,
+            reorg_buffer_size: DEFAULT_REORG_BUFFER_SIZE,
+        }
+    }
+}
+
+/// Responses of the inner client that report how far a stream got.
+pub trait Progress {
+    fn next_block(&self) -> u64;
+    fn rollback_guard(&self) -> Option<&net_types::RollbackGuard>;
+}
+
+impl Progress for hypersync_client::QueryResponse {
+    fn next_block(&self) -> u64 {
+        self.next_block
+    }
+
+    fn rollback_guard(&self) -> Option<&net_types::RollbackGuard> {
+        self.rollback_guard.as_ref()
+    }
+}
+
+impl Progress for hypersync_client::EventResponse {
+    fn next_block(&self) -> u64 {
+        self.next_block
+    }
+
+    fn rollback_guard(&self) -> Option<&net_types::RollbackGuard> {
+        self.rollback_guard.as_ref()
+    }
+}
+
+impl Progress for hypersync_client::ArrowResponse {
+    fn next_block(&self) -> u64 {
+        self.next_block
+    }
+
+    fn rollback_guard(&self) -> Option<&net_types::RollbackGuard> {
+        self.rollback_guard.as_ref()
+    }
+}
+
+/// Keep running `query` past the height of the server.
+///
+/// `start` starts an inner stream, e.g. `Client::stream`. Every time the inner stream finishes
+/// before `query.to_block`, the height of the server is polled until it moves past the last
+/// `next_block` and a new inner stream is started from there with the same query and config.
+///
+/// Unless disabled, rollback guards of the responses are checked for reorgs. A response that
+/// contradicts previously delivered blocks is not forwarded. Instead a `Rollback` to the first
+/// block that is no longer part of the chain is sent and the stream continues from that block.
+///
+/// Stops after forwarding the first error, once `query.to_block` is reached or when the returned
+/// receiver is closed.
+pub fn tail<R, F, Fut>(
+    client: Arc<Client>,
+    mut query: net_types::Query,
+    config: StreamConfig,
+    options: TailOptions,
+    start: F,
+) -> mpsc::Receiver<Result<Message<R>>>
+where
+    R: Progress + Send + 'static,
+    F: Fn(Arc<Client>, net_types::Query, StreamConfig) -> Fut + Send + 'static,
+    Fut: Future<Output = Result<mpsc::Receiver<Result<R>>>> + Send + 'static,
+{
+    let (tx, rx) = mpsc::channel(1);
+
+    tokio::spawn(async move {
+        let mut detector =
+            (options.reorg_buffer_size > 0).then(|| ReorgDetector::new(options.reorg_buffer_size));
+
+        'restart: loop {
+            let mut inner = match start(Arc::clone(&client), query.clone(), config.clone()).await {
+                Ok(inner) => inner,
+                Err(e) => {
+                    let _ = tx.send(Err(e.context("start inner stream"))).await;
+                    return;
+                }
+            };
+
+            loop {
+                let resp = tokio::select! {
+                    resp = inner.recv() => resp,
+                    _ = tx.closed() => return,
+                };
+
+                match resp {
+                    Some(Ok(resp)) => {
+                        let rollback = match (&mut detector, resp.rollback_guard()) {
+                            (Some(detector), Some(guard)) => detector
+                                .check(&client, guard, query.from_block)
+                                .await
+                                .context("check for reorg"),
+                            _ => Ok(None),
+                        };
+
+                        match rollback {
+                            Ok(None) => (),
+                            Ok(Some(block_number)) => {
+                                query.from_block = block_number;
+                                let rollback = Message::Rollback(Rollback { block_number });
+                                if tx.send(Ok(rollback)).await.is_err() {
+                                    return;
+                                }
+                                continue 'restart;
+                            }
+                            Err(e) => {
+                                let _ = tx.send(Err(e)).await;
+                                return;
+                            }
+                        }
+
+                        query.from_block = resp.next_block();
+                        if tx.send(Ok(Message::Response(resp))).await.is_err() {
+                            return;
+                        }
+                    }
+                    Some(Err(e)) => {
+                        let _ = tx.send(Err(e)).await;
+                        return;
+                    }
+                    None => break,
+                }
+            }
+
+            if query
+                .to_block
+                .is_some_and(|to_block| query.from_block >= to_block)
+            {
+                return;
+            }
+
+            match wait_for_height(&client, query.from_block, &options, &tx).await {
+                Ok(true) => (),
+                Ok(false) => return,
+                Err(e) => {
+                    let _ = tx.send(Err(e)).await;
+                    return;
+                }
+            }
+        }
+    });
+
+    rx
+}
+
+/// Poll the height of the server until it is past `block`, backing off while it stays put.
+///
+/// Returns false if `tx` was closed while waiting.
+async fn wait_for_height<T>(
+    client: &Client,
+    block: u64,
+    options: &TailOptions,
+    tx: &mpsc::Sender<T>,
+) -> Result<bool> {
+    let mut interval = options.poll_interval;
+
+    loop {
+        tokio::select! {
+            _ = tokio::time::sleep(interval) => (),
+            _ = tx.closed() => return Ok(false),
+        }
+
+        let height = client.get_height().await.context("get height")?;
+        if height > block {
+            return Ok(true);
+        }
+
+        interval = (interval * 2).min(options.max_poll_interval.max(options.poll_interval));
+    }
+}
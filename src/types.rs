@@ -5,26 +5,41 @@ use alloy_primitives::{Signed, U256};
 use anyhow::{Context, Result};
 use hypersync_client::{format, format::Hex, net_types, simple_types};
 use num_bigint::{BigInt, BigUint};
-use pyo3::{pyclass, IntoPyObject, Py, PyAny, Python};
+use pyo3::{
+    pyclass,
+    types::{PyDict, PyDictMethods, PyString, PyTuple},
+    IntoPyObject, Py, PyAny, PyResult, Python,
+};
 use serde::{Deserialize, Serialize};
 
 /// Data relating to a single event (log)
-#[pyclass]
+#[pyclass(module = "hypersync.hypersync")]
 #[pyo3(get_all)]
-#[derive(Clone)]
 pub struct Event {
-    /// Transaction that triggered this event
-    pub transaction: Option<Transaction>,
-    /// Block that this event happened in
-    pub block: Option<Block>,
+    /// Transaction that triggered this event, the same object for all events of the
+    /// transaction in a response
+    pub transaction: Option<Py<Transaction>>,
+    /// Block that this event happened in, the same object for all events of the block in a
+    /// response
+    pub block: Option<Py<Block>>,
     /// Evm log data
     pub log: Log,
 }
 
+impl Clone for Event {
+    fn clone(&self) -> Self {
+        Python::attach(|py| Self {
+            transaction: self.transaction.as_ref().map(|v| v.clone_ref(py)),
+            block: self.block.as_ref().map(|v| v.clone_ref(py)),
+            log: self.log.clone(),
+        })
+    }
+}
+
 /// Evm log object
 ///
 /// See ethereum rpc spec for the meaning of fields
-#[pyclass]
+#[pyclass(module = "hypersync.hypersync")]
 #[pyo3(get_all)]
 #[derive(Clone)]
 pub struct Log {
@@ -42,7 +57,7 @@ pub struct Log {
 /// Evm transaction object
 ///
 /// See ethereum rpc spec for the meaning of fields
-#[pyclass]
+#[pyclass(module = "hypersync.hypersync")]
 #[pyo3(get_all)]
 #[derive(Clone)]
 pub struct Transaction {
@@ -96,7 +111,7 @@ pub struct Transaction {
 /// Evm withdrawal object
 ///
 /// See ethereum rpc spec for the meaning of fields
-#[pyclass]
+#[pyclass(module = "hypersync.hypersync")]
 #[pyo3(get_all)]
 #[derive(Clone)]
 pub struct Withdrawal {
@@ -120,7 +135,7 @@ impl From<&format::Withdrawal> for Withdrawal {
 /// Evm access list object
 ///
 /// See ethereum rpc spec for the meaning of fields
-#[pyclass]
+#[pyclass(module = "hypersync.hypersync")]
 #[pyo3(get_all)]
 #[derive(Clone)]
 pub struct AccessList {
@@ -143,7 +158,7 @@ impl From<&format::AccessList> for AccessList {
 /// Evm block header object
 ///
 /// See ethereum rpc spec for the meaning of fields
-#[pyclass]
+#[pyclass(module = "hypersync.hypersync")]
 #[pyo3(get_all)]
 #[derive(Clone)]
 pub struct Block {
@@ -180,7 +195,7 @@ pub struct Block {
 /// Evm trace object
 ///
 /// See ethereum rpc spec for the meaning of fields
-#[pyclass]
+#[pyclass(module = "hypersync.hypersync")]
 #[pyo3(get_all)]
 #[derive(Clone)]
 pub struct Trace {
@@ -238,7 +253,7 @@ impl From<hypersync_client::RateLimitInfo> for RateLimitInfo {
 }
 
 /// Decoded EVM log
-#[pyclass]
+#[pyclass(module = "hypersync.hypersync")]
 #[pyo3(get_all)]
 #[derive(Clone)]
 pub struct DecodedEvent {
@@ -246,7 +261,7 @@ pub struct DecodedEvent {
     pub body: Vec<DecodedSolValue>,
 }
 
-#[pyclass]
+#[pyclass(module = "hypersync.hypersync")]
 #[pyo3(get_all)]
 pub struct DecodedSolValue {
     pub val: Py<PyAny>,
@@ -263,79 +278,134 @@ impl Clone for DecodedSolValue {
 impl DecodedSolValue {
     pub fn new(py: Python, val: DynSolValue, checksummed_addresses: bool) -> Self {
         let val = match val {
-            DynSolValue::Bool(b) => b.into_pyobject(py).unwrap().to_owned().into_any().unbind(),
-            DynSolValue::Int(v, _) => convert_bigint_signed(v)
-                .into_pyobject(py)
-                .unwrap()
-                .into_any()
-                .unbind(),
-            DynSolValue::Uint(v, _) => convert_bigint_unsigned(v)
-                .into_pyobject(py)
-                .unwrap()
-                .into_any()
-                .unbind(),
-            DynSolValue::FixedBytes(bytes, _) => encode_prefix_hex(bytes.as_slice())
-                .into_pyobject(py)
-                .unwrap()
-                .into_any()
-                .unbind(),
-            DynSolValue::Address(addr) => {
-                if !checksummed_addresses {
-                    encode_prefix_hex(addr.as_slice())
-                        .into_pyobject(py)
-                        .unwrap()
-                        .into_any()
-                        .unbind()
-                } else {
-                    addr.to_checksum(None)
-                        .into_pyobject(py)
-                        .unwrap()
-                        .into_any()
-                        .unbind()
-                }
+            DynSolValue::Array(vals) | DynSolValue::FixedArray(vals) | DynSolValue::Tuple(vals) => {
+                vals.into_iter()
+                    .map(|v| DecodedSolValue::new(py, v, checksummed_addresses))
+                    .collect::<Vec<_>>()
+                    .into_pyobject(py)
+                    .unwrap()
+                    .into_any()
+                    .unbind()
             }
-            DynSolValue::Function(bytes) => encode_prefix_hex(bytes.as_slice())
-                .into_pyobject(py)
-                .unwrap()
-                .into_any()
-                .unbind(),
-            DynSolValue::Bytes(bytes) => encode_prefix_hex(bytes.as_slice())
-                .into_pyobject(py)
-                .unwrap()
-                .into_any()
-                .unbind(),
-            DynSolValue::String(s) => s.into_pyobject(py).unwrap().into_any().unbind(),
-            DynSolValue::Array(vals) => vals
-                .into_iter()
-                .map(|v| DecodedSolValue::new(py, v, checksummed_addresses))
-                .collect::<Vec<_>>()
-                .into_pyobject(py)
-                .unwrap()
-                .into_any()
-                .unbind(),
-            DynSolValue::FixedArray(vals) => vals
-                .into_iter()
-                .map(|v| DecodedSolValue::new(py, v, checksummed_addresses))
-                .collect::<Vec<_>>()
-                .into_pyobject(py)
-                .unwrap()
-                .into_any()
-                .unbind(),
-            DynSolValue::Tuple(vals) => vals
-                .into_iter()
-                .map(|v| DecodedSolValue::new(py, v, checksummed_addresses))
-                .collect::<Vec<_>>()
-                .into_pyobject(py)
-                .unwrap()
-                .into_any()
-                .unbind(),
+            val => sol_value_to_py(py, val, checksummed_addresses),
         };
 
         Self { val }
     }
 }
 
-fn encode_prefix_hex(bytes: &[u8]) -> String {
+/// Convert a decoded value to a plain python value. Arrays become lists and tuples become
+/// tuples, without wrapping the elements in `DecodedSolValue`.
+pub fn sol_value_to_py(py: Python, val: DynSolValue, checksummed_addresses: bool) -> Py<PyAny> {
+    match val {
+        DynSolValue::Bool(b) => b.into_pyobject(py).unwrap().to_owned().into_any().unbind(),
+        DynSolValue::Int(v, _) => convert_bigint_signed(v)
+            .into_pyobject(py)
+            .unwrap()
+            .into_any()
+            .unbind(),
+        DynSolValue::Uint(v, _) => convert_bigint_unsigned(v)
+            .into_pyobject(py)
+            .unwrap()
+            .into_any()
+            .unbind(),
+        DynSolValue::FixedBytes(bytes, _) => encode_prefix_hex(bytes.as_slice())
+            .into_pyobject(py)
+            .unwrap()
+            .into_any()
+            .unbind(),
+        DynSolValue::Address(addr) => {
+            if !checksummed_addresses {
+                encode_prefix_hex(addr.as_slice())
+                    .into_pyobject(py)
+                    .unwrap()
+                    .into_any()
+                    .unbind()
+            } else {
+                addr.to_checksum(None)
+                    .into_pyobject(py)
+                    .unwrap()
+                    .into_any()
+                    .unbind()
+            }
+        }
+        DynSolValue::Function(bytes) => encode_prefix_hex(bytes.as_slice())
+            .into_pyobject(py)
+            .unwrap()
+            .into_any()
+            .unbind(),
+        DynSolValue::Bytes(bytes) => encode_prefix_hex(bytes.as_slice())
+            .into_pyobject(py)
+            .unwrap()
+            .into_any()
+            .unbind(),
+        DynSolValue::String(s) => s.into_pyobject(py).unwrap().into_any().unbind(),
+        DynSolValue::Array(vals) | DynSolValue::FixedArray(vals) => vals
+            .into_iter()
+            .map(|v| sol_value_to_py(py, v, checksummed_addresses))
+            .collect::<Vec<_>>()
+            .into_pyobject(py)
+            .unwrap()
+            .into_any()
+            .unbind(),
+        DynSolValue::Tuple(vals) => PyTuple::new(
+            py,
+            vals.into_iter()
+                .map(|v| sol_value_to_py(py, v, checksummed_addresses)),
+        )
+        .unwrap()
+        .into_any()
+        .unbind(),
+    }
+}
+
+/// How decoders return decoded parameters.
+#[derive(Clone, Copy, Debug, Default, PartialEq, Eq)]
+pub enum ValueFormat {
+    /// `DecodedEvent`s and lists of `DecodedSolValue`.
+    #[default]
+    Wrapped,
+    /// Tuples of plain values in signature order.
+    Tuple,
+    /// Dicts of plain values keyed by parameter name.
+    Dict,
+}
+
+impl ValueFormat {
+    pub fn plain(named: bool) -> Self {
+        if named {
+            Self::Dict
+        } else {
+            Self::Tuple
+        }
+    }
+}
+
+/// Plain python values of decoded parameters, a dict keyed by `names` if given and a tuple
+/// otherwise.
+pub fn plain_params<'a>(
+    py: Python,
+    values: Vec<DynSolValue>,
+    names: Option<impl Iterator<Item = &'a str>>,
+    checksummed_addresses: bool,
+) -> PyResult<Py<PyAny>> {
+    let values = values
+        .into_iter()
+        .map(|v| sol_value_to_py(py, v, checksummed_addresses));
+
+    match names {
+        Some(names) => {
+            let dict = PyDict::new(py);
+            for (name, value) in names.zip(values) {
+                dict.set_item(PyString::intern(py, name), value)?;
+            }
+            Ok(dict.into_any().unbind())
+        }
+        None => Ok(PyTuple::new(py, values)?.into_any().unbind()),
+    }
+}
+
+pub fn encode_prefix_hex(bytes: &[u8]) -> String {
     if bytes.is_empty() {
         return "0x".into();
     }
@@ -343,7 +413,7 @@ fn encode_prefix_hex(bytes: &[u8]) -> String {
     format!("0x{}", faster_hex::hex_string(bytes))
 }
 
-fn map_binary<T: Hex>(v: &Option<T>) -> Option<String> {
+pub fn map_binary<T: Hex>(v: &Option<T>) -> Option<String> {
     v.as_ref().map(|v| v.encode_hex())
 }
 
@@ -509,7 +579,7 @@ impl From<&simple_types::Trace> for Trace {
     }
 }
 
-#[pyclass]
+#[pyclass(module = "hypersync.hypersync")]
 #[pyo3(get_all)]
 #[derive(Default, Clone, Serialize, Deserialize)]
 pub struct RollbackGuard {
@@ -547,6 +617,17 @@ impl RollbackGuard {
     }
 }
 
+/// Notice on a tail stream that previously delivered data is no longer part of the chain.
+///
+/// Data from `block_number` on should be discarded, the stream continues from `block_number`.
+#[pyclass(module = "hypersync.hypersync")]
+#[pyo3(get_all)]
+#[derive(Clone)]
+pub struct Rollback {
+    /// First block that was rolled back.
+    pub block_number: u64,
+}
+
 fn convert_bigint_signed(v: Signed<256, 4>) -> BigInt {
     BigInt::from_str(&v.to_string()).unwrap()
 }